@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the JSON codecs on the responses of ``read`` / ``search_read``.
+
+Usage: python benchmarks/bench_codecs.py [--records N] [--repeat N]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import erppeek
+
+
+def read_payload(count):
+    """Return a JSON-RPC response like ``res.partner`` ``search_read``."""
+    records = []
+    for idx in range(1, count + 1):
+        records.append({
+            'id': idx,
+            'name': u'Partner %d - Société Générale' % idx,
+            'display_name': u'Main Company, Partner %d' % idx,
+            'active': True,
+            'is_company': idx % 5 == 0,
+            'customer': True,
+            'credit_limit': idx * 12.5,
+            'parent_id': [1, u'Main Company'] if idx % 3 else False,
+            'country_id': [75, u'France'],
+            'category_id': [1, 3, 7],
+            'child_ids': list(range(idx, idx + idx % 4)),
+            'email': u'partner%d@example.com' % idx,
+            'phone': False,
+            'street': u'%d rue de la Paix' % idx,
+            'zip': u'75002',
+            'city': u'Paris',
+            'comment': u'<p>Lorem ipsum dolor sit amet</p>' * (idx % 3),
+            'write_date': u'2018-12-05 10:%02d:00' % (idx % 60),
+        })
+    return {'jsonrpc': '2.0', 'id': 42, 'result': records}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    payload = read_payload(args.records)
+    data = erppeek.json_codec('json')[0](payload)
+    print('%d records, %d bytes, best of %d runs' %
+          (args.records, len(data), args.repeat))
+    print('%-10s %12s %12s' % ('codec', 'dumps (ms)', 'loads (ms)'))
+    for (name, codec) in erppeek.JSON_CODECS:
+        try:
+            (dumps, loads) = codec()
+        except ImportError:
+            print('%-10s %12s' % (name, 'not installed'))
+            continue
+        assert loads(dumps(payload)) == payload
+        timings = []
+        for (func, arg) in ((dumps, payload), (loads, data)):
+            timer = timeit.Timer(lambda: func(arg))
+            timings.append(min(timer.repeat(args.repeat, 1)) * 1000)
+        print('%-10s %12.2f %12.2f' % (name, timings[0], timings[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark the hot paths of the client, and compare with the baseline.
+
+Each run of a benchmark loops long enough to last 0.2 seconds, like
+``timeit.Timer.autorange``, and it alternates with a run of a calibration
+loop.  The score is the median time of the benchmark divided by the
+median time of the calibration, to compare the results of different
+machines.  The script fails when a benchmark is slower than the baseline
+by more than its tolerance.
+
+Usage: python benchmarks/bench_hotpaths.py [--repeat N] [--threshold R]
+                                           [--save] [name [name ...]]
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import erppeek
+from tests.fake_server import FakeServer, Table, default_tables
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+BENCHMARKS = []
+
+
+def benchmark(tolerance=0.3):
+    """Register a benchmark, which fails when it is slower than the
+    baseline by more than the `tolerance` ratio."""
+    def decorator(setup):
+        BENCHMARKS.append((setup.__name__, tolerance, setup))
+        return setup
+    return decorator
+
+
+def calibrate():
+    """Return the reference function, a pure Python loop."""
+    def run():
+        total = 0
+        for idx in range(10000):
+            total += idx * idx % 7
+        return total
+    return run
+
+
+def wide_table(columns=100):
+    """Return a table with many columns of each type."""
+    fields = {}
+    row = {}
+    for idx in range(columns):
+        kind = ('char', 'float', 'many2one', 'many2many', 'one2many',
+                'reference', 'boolean')[idx % 7]
+        name = 'x_%s_%d' % (kind, idx)
+        fields[name] = {'type': kind, 'string': name}
+        if kind in ('many2one', 'many2many', 'one2many'):
+            fields[name]['relation'] = 'res.partner'
+        row[name] = {'char': 'Value %d' % idx, 'float': idx * 1.5,
+                     'many2one': [idx, 'Partner %d' % idx],
+                     'many2many': list(range(idx, idx + 10)),
+                     'one2many': list(range(idx, idx + 3)),
+                     'reference': 'res.partner,%d' % idx,
+                     'boolean': bool(idx % 2)}[kind]
+    return Table('x.wide', fields, [row])
+
+
+@benchmark()
+def searchargs():
+    domain = ['name like Morice', 'state != draft', 'id in [1, 2, 3]',
+              'date >= 2018-01-01', 'parent_id.name ilike Agrolait']
+    # The terms are replaced in the list, use a copy
+    return lambda: erppeek.searchargs((list(domain),))
+
+
+@benchmark()
+def literal_eval():
+    expression = "[1, 2.5, 'abc', None, True, {'a': (1, 2)}, [u'x']]"
+    return lambda: erppeek.literal_eval(expression)
+
+
+@benchmark()
+def issearchdomain():
+    args = [['name like Morice', ('id', 'in', [1, 2])], list(range(1, 100)),
+            ['1', '2', '3'], [], 42, 'name = Morice', (1, 2)]
+
+    def run():
+        for arg in args:
+            erppeek.issearchdomain(arg)
+    return run
+
+
+# Allocating a large list depends on the memory of the machine
+@benchmark(tolerance=0.5)
+def recordlist_init():
+    model = _client().model('res.partner')
+    ids = list(range(1, 1000001))
+    return lambda: erppeek.RecordList(model, ids)
+
+
+@benchmark()
+def browse_values():
+    model = _client().model('x.wide')
+    row = _client().read('x.wide', 1)
+    return lambda: model._browse_values(dict(row))
+
+
+@benchmark()
+def unbrowse_values():
+    model = _client().model('x.wide')
+    values = model._browse_values(_client().read('x.wide', 1))
+    return lambda: model._unbrowse_values(values)
+
+
+@benchmark()
+def read_order():
+    client = _client()
+    ids = list(range(1, 10001))
+    random.Random(42).shuffle(ids)
+    rows = [{'id': id_, 'name': 'Partner %d' % id_} for id_ in sorted(ids)]
+
+    def run():
+        steps = client._execute_steps('res.partner', 'read',
+                                      (ids, ['name']), {'order': True})
+        next(steps)
+        return steps.send(rows)
+    return run
+
+
+@benchmark()
+def format_exception():
+    frames = ''.join(['  File "/odoo/addons/module_%d/models.py", line %d, '
+                      'in method_%d\n    self.method_%d()\n' %
+                      (idx, idx, idx, idx + 1) for idx in range(2000)])
+    debug = ('Traceback (most recent call last):\n' + frames +
+             'psycopg2.IntegrityError: null value in column "name"\n')
+    fault = erppeek.Fault('null value in column "name"', debug)
+    error = erppeek.ServerError({'code': 200, 'message': 'Server Error',
+                                 'data': {'exception_type': 'internal_error',
+                                          'name': 'IntegrityError',
+                                          'arguments': ['null value'],
+                                          'debug': debug}})
+
+    def run():
+        erppeek.format_exception(erppeek.Fault, fault, None)
+        erppeek.format_exception(erppeek.ServerError, error, None)
+    return run
+
+
+def _client(_cache=[]):
+    # Return a Client connected to the fake server
+    if not _cache:
+        tables = default_tables(10)
+        tables['x.wide'] = wide_table()
+        tables['ir.model'].create({'model': 'x.wide', 'name': 'x.wide'})
+        server = FakeServer(tables=tables).start()
+        _cache.append(erppeek.Client(server.url, server.database,
+                                     'admin', 'admin'))
+    return _cache[0]
+
+
+def autorange(timer, min_time=0.2):
+    """Return the number of loops which last at least `min_time` seconds,
+    like ``timeit.Timer.autorange`` of Python 3.6."""
+    number = 1
+    while True:
+        for factor in (1, 2, 5):
+            if timer.timeit(number * factor) >= min_time:
+                return number * factor
+        number *= 10
+
+
+def median(values):
+    """Return the median of the `values`."""
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def score_of(func, reference, repeat):
+    """Return the time of a call to `func` in seconds, and its ratio to
+    the time of a call to the `reference`.  The runs of both functions
+    alternate, hence a change of the speed of the machine affects both."""
+    (timer, ref_timer) = (timeit.Timer(func), timeit.Timer(reference))
+    (number, ref_number) = (autorange(timer), autorange(ref_timer))
+    (timings, ref_timings) = ([], [])
+    for idx in range(repeat):
+        ref_timings.append(ref_timer.timeit(ref_number) / ref_number)
+        timings.append(timer.timeit(number) / number)
+    timing = median(timings)
+    return (timing, timing / median(ref_timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='run these benchmarks only')
+    parser.add_argument('--repeat', type=int, default=9,
+                        help='number of runs of each benchmark '
+                             '(default: 9)')
+    parser.add_argument('--threshold', type=float,
+                        help='fail when slower than the baseline by this '
+                             'ratio (default: the tolerance of each '
+                             'benchmark)')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true',
+                        help='save the results as the new baseline')
+    args = parser.parse_args()
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except (IOError, OSError):
+        baseline = {}
+    reference = calibrate()
+    print('%-18s %12s %10s %10s %9s' %
+          ('benchmark', 'time (us)', 'score', 'baseline', 'change'))
+    results = {}
+    regressions = []
+    for (name, tolerance, setup) in BENCHMARKS:
+        if args.names and name not in args.names:
+            continue
+        if args.threshold is not None:
+            tolerance = args.threshold
+        (timing, score) = score_of(setup(), reference, args.repeat)
+        results[name] = score
+        if name in baseline:
+            change = score / baseline[name] - 1
+            if change > tolerance:
+                regressions.append(name)
+            print('%-18s %12.1f %10.4g %10.4g %+8.1f%%' %
+                  (name, timing * 1e6, score, baseline[name], change * 100))
+        else:
+            print('%-18s %12.1f %10.4g %10s' %
+                  (name, timing * 1e6, score, '-'))
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Baseline saved to %s' % args.baseline)
+    elif regressions:
+        print('Slower than the baseline by more than the tolerance: %s' %
+              ', '.join(regressions))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,44 +7,99 @@ Author: Florent Xicluna
 """
 import _ast
 import atexit
+import bisect
+import contextlib
 import csv
+import errno
 import functools
+import itertools
 import json
+import logging
 import optparse
 import os
+import random
 import re
 import shlex
+import socket
 import sys
+import threading
 import time
 import traceback
+import zlib
 
 PY2 = (sys.version_info[0] == 2)
 if not PY2:             # Python 3
     from configparser import ConfigParser
+    from http.client import BadStatusLine, HTTPConnection, HTTPSConnection
     from threading import current_thread
+    from urllib.error import HTTPError
+    from urllib.parse import parse_qsl, urlencode, urlsplit
     from urllib.request import Request, urlopen
-    from xmlrpc.client import Fault, ServerProxy, MININT, MAXINT
+    from xmlrpc.client import (Fault, ProtocolError, ServerProxy, Transport,
+                               ExpatParser, Unmarshaller, MININT, MAXINT,
+                               dumps as xmlrpc_dumps, loads as xmlrpc_loads,
+                               gzip_encode)
 else:                   # Python 2
     from ConfigParser import SafeConfigParser as ConfigParser
+    from httplib import BadStatusLine, HTTPConnection, HTTPSConnection
     from threading import currentThread as current_thread
-    from urllib2 import Request, urlopen
-    from xmlrpclib import Fault, ServerProxy, MININT, MAXINT
+    from urllib2 import HTTPError, Request, urlopen
+    from urllib import urlencode
+    from urlparse import parse_qsl, urlsplit
+    from xmlrpclib import (Fault, ProtocolError, ServerProxy, Transport,
+                           ExpatParser, Unmarshaller, MININT, MAXINT,
+                           dumps as xmlrpc_dumps, loads as xmlrpc_loads,
+                           gzip_encode)
 
+try:
+    import asyncio
+except ImportError:     # Python 2
+    asyncio = None
 try:
     import requests
 except ImportError:
     requests = None
 
 __version__ = '1.7.2'
-__all__ = ['Client', 'Model', 'Record', 'RecordList', 'Service',
+__all__ = ['AsyncClient', 'Client', 'Model', 'Record', 'RecordList', 'Service',
            'format_exception', 'read_config', 'start_odoo_services']
 
+_logger = logging.getLogger(__name__)
+
 CONF_FILE = 'erppeek.ini'
 HIST_FILE = os.path.expanduser('~/.erppeek_history')
+CACHE_FILE = os.path.expanduser('~/.erppeek_cache')
 DEFAULT_URL = 'http://localhost:8069/xmlrpc'
 DEFAULT_DB = 'odoo'
 DEFAULT_USER = 'admin'
 MAXCOL = [79, 179, 9999]    # Line length in verbose mode
+# Default values of the Client options
+CLIENT_OPTIONS = {
+    'pool_size': 10,
+    'idle_timeout': 60.0,
+    'compress': None,
+    'codec': 'json',
+    'retries': 0,
+    'backoff': 0.5,
+    'breaker_threshold': None,
+    'breaker_timeout': 30.0,
+    'connect_timeout': None,
+    'timeout': None,
+    'balance': 'round_robin',
+    'primary': None,
+    'eject_threshold': 3,
+    'eject_timeout': 30.0,
+    'fallback': None,
+    'cache_file': None,
+    'cache_ttl': 3600.0,
+    'version': None,
+    'metrics': True,
+    'slow_threshold': None,
+    'n1_threshold': None,
+    'record': None,
+    'replay': None,
+    'replay_latency': 0.0,
+}
 _DEFAULT = object()
 
 USAGE = """\
@@ -93,6 +148,20 @@ _methods = {
 #          (object) execute_kw,  (report) render_report
 # New 7.0: (db) duplicate_database
 
+# Methods which are safe to retry, for all the services
+IDEMPOTENT_METHODS = frozenset([
+    'server_version', 'list', 'db_exist', 'list_lang', 'about', 'version',
+    'login', 'authenticate', 'timezone_get',
+    # methods of the models
+    'read', 'search', 'search_read', 'search_count', 'read_group',
+    'fields_get', 'fields_get_keys', 'name_get', 'name_search',
+    'default_get', 'check_access_rights',
+])
+# Methods which return records, counted as the rows of the spans
+_record_methods = frozenset([
+    'read', 'search_read', 'read_group', 'name_get', 'name_search',
+])
+
 _obsolete_methods = {
     'db': ['create', 'get_progress'],                       # < 8.0
     'common': ['check_connectivity', 'get_available_updates', 'get_os_time',
@@ -264,6 +333,11 @@ def read_config(section=None):
     ``database``, ``username`` and (optional) ``password``.  Default values
     are read from the ``[DEFAULT]`` section.  If the ``password`` is not in
     the configuration file, it is requested on login.
+    The options of the :class:`Client` (e.g. ``compress``) are accepted
+    too.  They are appended to the query string of the ``server`` URL.
+    The ``host`` may be a list of servers, separated by commas, optionally
+    with their port (e.g. ``odoo1, odoo2:8070``): the calls are distributed
+    across them, see :class:`Balancer`.
     Return a tuple ``(server, db, user, password or None)``.
     Without argument, it returns the list of configured environments.
     """
@@ -278,7 +352,14 @@ def read_config(section=None):
         server = shlex.split(env.get('options', ''))
     else:
         protocol = env.get('protocol', 'xmlrpc')
-        server = '%s://%s:%s/%s' % (scheme, env['host'], env['port'], protocol)
+        server = ' '.join([
+            '%s://%s/%s' % (scheme, host if ':' in host else
+                            '%s:%s' % (host, env['port']), protocol)
+            for host in env['host'].replace(',', ' ').split()])
+        options = [(key, env[key]) for key in sorted(CLIENT_OPTIONS)
+                   if key in env]
+        if options:
+            server += '?' + urlencode(options)
     return (server, env['database'], env['username'], env.get('password'))
 
 
@@ -374,30 +455,594 @@ def searchargs(params, kwargs=None, context=None, api_v9=False):
     return params
 
 
+# The state of the current RPC call, for each thread
+_rpc_local = threading.local()
+_timer = getattr(time, 'perf_counter', time.time)
+
+
+def _count_sizes(sent=b'', received=b''):
+    # Count the payload sizes of the current RPC call, if it is measured
+    sizes = getattr(_rpc_local, 'sizes', None)
+    if sizes is not None:
+        sizes[0] += len(sent)
+        sizes[1] += len(received)
+
+
+def _marshal(func, *args):
+    # Encode or decode a payload, and count the time of the current RPC
+    # call, if it is measured
+    sizes = getattr(_rpc_local, 'sizes', None)
+    if sizes is None:
+        return func(*args)
+    start = _timer()
+    try:
+        return func(*args)
+    finally:
+        sizes[2] += _timer() - start
+
+
 if requests:
-    def http_post(url, data, headers={'Content-Type': 'application/json'}):
-        resp = requests.post(url, data=data, headers=headers)
-        return resp.json()
+    def http_post(url, data, headers={'Content-Type': 'application/json'},
+                  session=None, loads=None, timeout=None):
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+        resp = (session or requests).post(url, data=data, headers=headers,
+                                          **kwargs)
+        _count_sizes(received=resp.content)
+        return _marshal(loads, resp.content) if loads else _marshal(resp.json)
+
+    def http_session(options):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=options['pool_size'], pool_block=True)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return (session, None)
 else:
-    def http_post(url, data, headers={'Content-Type': 'application/json'}):
+    def http_post(url, data, headers={'Content-Type': 'application/json'},
+                  session=None, loads=None, timeout=None):
+        if session is not None:
+            kwargs = {'timeout': timeout} if timeout is not None else {}
+            resp = session.post(url, data=data, headers=headers, **kwargs)
+            _count_sizes(received=resp.content)
+            return (_marshal(loads, resp.content) if loads else
+                    _marshal(resp.json))
         request = Request(url, data=data, headers=headers)
-        resp = urlopen(request)
-        return json.load(resp)
+        if timeout is not None and timeout[1] is not None:
+            resp = urlopen(request, timeout=timeout[1])
+        else:
+            resp = urlopen(request)
+        content = resp.read()
+        _count_sizes(received=content)
+        return _marshal(loads or _stdlib_codec()[1], content)
+
+    def http_session(options):
+        pool = ConnectionPool(options['pool_size'], options['idle_timeout'])
+        accept_gzip = options['compress'] is not None
+        return (HTTPSession(pool, accept_gzip=accept_gzip), pool)
+
+
+def _stdlib_codec():
+    return (lambda obj: json.dumps(obj).encode('ascii'),
+            lambda data: json.loads(data.decode('utf-8')))
+
+
+def _orjson_codec():
+    import orjson
+    return (functools.partial(orjson.dumps, option=orjson.OPT_NON_STR_KEYS),
+            orjson.loads)
+
+
+def _ujson_codec():
+    import ujson
+    return (lambda obj: ujson.dumps(obj).encode('ascii'), ujson.loads)
+
+
+def _rapidjson_codec():
+    import rapidjson
+    return (lambda obj: rapidjson.dumps(obj).encode('ascii'), rapidjson.loads)
+
+
+# Fastest first
+JSON_CODECS = [
+    ('orjson', _orjson_codec),
+    ('rapidjson', _rapidjson_codec),
+    ('ujson', _ujson_codec),
+    ('json', _stdlib_codec),
+]
+
+
+def json_codec(name='json'):
+    """Return the ``(dumps, loads)`` functions of a JSON codec.
+
+    The codec `name` is one of ``json`` (standard library), ``orjson``,
+    ``rapidjson`` or ``ujson``.  With ``auto``, the fastest installed
+    codec is selected.  If the codec is not installed, the standard
+    library is used.  The ``dumps`` function returns bytes, and the
+    ``loads`` function accepts bytes.
+    """
+    codecs = dict(JSON_CODECS)
+    if name not in codecs and name != 'auto':
+        raise ValueError('Unknown JSON codec: %r' % (name,))
+    for (codec_name, codec) in JSON_CODECS:
+        if name in ('auto', codec_name):
+            try:
+                return codec()
+            except ImportError:
+                pass
+    return _stdlib_codec()
+
+
+def _client_options(server, options):
+    """Return the server URL and the options of the Client.
+
+    The keyword arguments override the options in the query string of
+    the server URL, which override the default values.
+    """
+    if isinstance(server, basestring) and '?' in server:
+        (server, query) = server.split('?', 1)
+        for (key, value) in parse_qsl(query):
+            try:
+                value = literal_eval(value)
+            except Exception:
+                pass    # Interpret the value as a string
+            options.setdefault(key, value)
+    unknown = set(options) - set(CLIENT_OPTIONS)
+    if unknown:
+        raise TypeError('Unexpected keyword argument(s): %s' %
+                        ', '.join(sorted(unknown)))
+    return (server, dict(CLIENT_OPTIONS, **options))
 
 
-def dispatch_jsonrpc(url, service_name, method, args):
-    data = {
+def _server_url(url, protocol='xmlrpc'):
+    # Return the URL of the XML-RPC or JSON-RPC endpoint
+    # The `protocol` is used for the URL without path
+    url = url.rstrip('/')
+    if '/jsonrpc' in url or '/xmlrpc' in url:
+        return url
+    return url + '/' + protocol
+
+
+def _split_servers(server):
+    # Return the list of server URLs, or None for a local server
+    if isinstance(server, basestring):
+        return server.replace(',', ' ').split()
+    if (isinstance(server, (list, tuple)) and server and
+            all(isinstance(url, basestring) and '://' in url
+                for url in server)):
+        return list(server)
+
+
+def _jsonrpc_id():
+    return '%04x%010x' % (os.getpid(), (int(time.time() * 1E6) % 2**40))
+
+
+def _jsonrpc_call(service_name, method, args, call_id):
+    return {
         'jsonrpc': '2.0',
         'method': 'call',
         'params': {'service': service_name, 'method': method, 'args': args},
-        'id': '%04x%010x' % (os.getpid(), (int(time.time() * 1E6) % 2**40)),
+        'id': call_id,
     }
-    resp = http_post(url, json.dumps(data).encode('ascii'))
+
+
+def _post_jsonrpc(url, data, session, compress, codec, timeout=None):
+    # Encode and send the request, and return the decoded response
+    kwargs = {'session': session}
+    if timeout is not None:
+        kwargs['timeout'] = timeout
+    if codec:
+        (dumps, kwargs['loads']) = codec
+        data = _marshal(dumps, data)
+    else:
+        data = _marshal(json.dumps, data).encode('ascii')
+    _count_sizes(sent=data)
+    if compress is not None and len(data) > compress:
+        headers = {'Content-Type': 'application/json',
+                   'Content-Encoding': 'gzip'}
+        return http_post(url, gzip_encode(data), headers, **kwargs)
+    return http_post(url, data, **kwargs)
+
+
+def dispatch_jsonrpc(url, service_name, method, args, session=None,
+                     compress=None, codec=None, timeout=None):
+    data = _jsonrpc_call(service_name, method, args, _jsonrpc_id())
+    resp = _post_jsonrpc(url, data, session, compress, codec, timeout)
     if resp.get('error'):
         raise ServerError(resp['error'])
     return resp['result']
 
 
+def dispatch_jsonrpc_batch(url, service_name, calls, session=None,
+                           compress=None, codec=None, timeout=None):
+    """Send the `calls` in a single JSON-RPC batch request.
+
+    The `calls` are ``(method, args)`` tuples.  Return the list of results,
+    where the errors are :exc:`ServerError` instances.  Return None if the
+    server does not support batch requests.
+    """
+    prefix = _jsonrpc_id()
+    data = [_jsonrpc_call(service_name, method, args, '%s-%d' % (prefix, idx))
+            for (idx, (method, args)) in enumerate(calls)]
+    try:
+        resp = _post_jsonrpc(url, data, session, compress, codec, timeout)
+    except (HTTPError, ValueError):
+        return None
+    if not isinstance(resp, list):
+        return None
+    responses = {item.get('id'): item for item in resp}
+    results = []
+    for request in data:
+        item = responses.get(request['id'])
+        if item is None:
+            results.append(Error('No response for the call %r' %
+                                 (request['params']['method'],)))
+        elif item.get('error'):
+            results.append(ServerError(item['error']))
+        else:
+            results.append(item['result'])
+    return results
+
+
+def dispatch_multicall(dispatch, calls):
+    """Send the `calls` with the ``system.multicall`` XML-RPC method.
+
+    The `calls` are ``(method, args)`` tuples.  Return the list of results,
+    where the errors are :exc:`Fault` instances.  Return None if the server
+    does not expose this method.
+    """
+    multicall = [{'methodName': method, 'params': args}
+                 for (method, args) in calls]
+    try:
+        resp = dispatch('system.multicall', (multicall,))
+    except (Fault, ProtocolError):
+        return None
+    return [Fault(item['faultCode'], item['faultString'])
+            if isinstance(item, dict) else item[0] for item in resp]
+
+
+def dispatch_stream(transport, url, method, args):
+    """Send the XML-RPC request and iterate over the resulting array.
+
+    The response is parsed incrementally by the :class:`PooledTransport`
+    `transport`, and the items are returned while it is received.  The
+    connection is held until the iteration is done.
+    """
+    (host, handler) = urlsplit(url)[1:3]
+    request = xmlrpc_dumps(args, method, allow_none=True)
+    if not PY2:
+        request = request.encode('utf-8', 'xmlcharrefreplace')
+    return transport.stream_request(host, handler, request)
+
+
+def _prefetch(items):
+    # Receive the first item, hence send the request, and return an
+    # iterator over all the items
+    items = iter(items)
+    for item in items:
+        return itertools.chain([item], items)
+    return iter(())
+
+
+def _parallel_map(func, items, workers, local=None):
+    # Apply func to the items, in concurrent threads
+    # Return the results in the same order, or the exceptions
+    # The state of the thread-local `local` is copied to the threads
+    results = [None] * len(items)
+    queue = iter(enumerate(items))
+    lock = threading.Lock()
+    state = dict(local.__dict__) if local is not None else None
+
+    def worker():
+        if state:
+            local.__dict__.update(state)
+        while True:
+            with lock:
+                (idx, item) = next(queue, (None, None))
+            if idx is None:
+                return
+            try:
+                results[idx] = func(item)
+            except Exception as exc:
+                results[idx] = exc
+    threads = [threading.Thread(target=worker)
+               for __ in range(min(workers, len(items)) - 1)]
+    for thread in threads:
+        thread.start()
+    worker()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _set_timeout(conn, timeout):
+    # Apply the (connect, read) timeouts on the HTTP connection
+    (connect, read) = timeout
+    if conn.sock is None:
+        if connect is None and read is None:
+            return
+        conn.timeout = connect
+        conn.connect()
+    conn.sock.settimeout(read)
+
+
+class ConnectionPool(object):
+    """A pool of persistent HTTP connections.
+
+    The connections are kept alive after each request, and they are reused
+    for the next requests to the same host.  At most `maxsize` connections
+    are open for each host: additional requests wait for a free connection.
+    The connections which stay idle more than `idle_timeout` seconds are
+    closed.  The counters ``created`` and ``reused`` report the activity
+    of the pool.
+    """
+
+    def __init__(self, maxsize=10, idle_timeout=60.0):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.created = self.reused = 0
+        self._idle = {}     # {(scheme, host): [(last_used, connection)]}
+        self._active = {}   # {(scheme, host): count}
+        self._cond = threading.Condition()
+
+    def __repr__(self):
+        return ("<ConnectionPool maxsize=%s created=%s reused=%s>" %
+                (self.maxsize, self.created, self.reused))
+
+    def _connect(self, scheme, host):
+        if scheme == 'https':
+            return HTTPSConnection(host)
+        return HTTPConnection(host)
+
+    def acquire(self, scheme, host, timeout=None):
+        """Return a connection to `host`, reused if possible.
+
+        The `timeout` is a ``(connect, read)`` tuple of seconds, where
+        None means no limit.  A new connection is opened immediately when
+        a timeout is given.
+        """
+        key = (scheme, host)
+        with self._cond:
+            while self._active.get(key, 0) >= self.maxsize:
+                self._cond.wait()
+            self._active[key] = self._active.get(key, 0) + 1
+            idle = self._idle.get(key) or []
+            if idle and idle[-1][0] + self.idle_timeout > time.time():
+                self.reused += 1
+                conn = idle.pop()[1]
+            else:
+                # The most recent connection is expired, discard them all
+                for (last_used, conn) in idle:
+                    conn.close()
+                del idle[:]
+                self.created += 1
+                conn = None
+        if conn is None:
+            conn = self._connect(scheme, host)
+        try:
+            _set_timeout(conn, timeout or (None, None))
+        except Exception:
+            self.release(scheme, host, conn, reuse=False)
+            raise
+        return conn
+
+    def release(self, scheme, host, conn, reuse=True):
+        """Give back the connection to the pool.
+
+        If `reuse` is False, or if the server closed it, the connection
+        is discarded.
+        """
+        key = (scheme, host)
+        with self._cond:
+            self._active[key] -= 1
+            if reuse and conn.sock is not None:
+                self._idle.setdefault(key, []).append((time.time(), conn))
+            else:
+                conn.close()
+            self._cond.notify()
+
+    def close(self):
+        """Close the idle connections."""
+        with self._cond:
+            for idle in self._idle.values():
+                for (last_used, conn) in idle:
+                    conn.close()
+            self._idle.clear()
+
+
+class PooledTransport(Transport):
+    """An XML-RPC transport with persistent connections.
+
+    The connections are taken from the :class:`ConnectionPool` `pool`,
+    which might be shared by many transports.  The request is compressed
+    with gzip if its size exceeds `compress` bytes.  The server may
+    compress the responses too.  The optional `timeouts` callable returns
+    the ``(connect, read)`` timeouts of the next request.
+    """
+
+    def __init__(self, pool, scheme='http', compress=None, timeouts=None):
+        Transport.__init__(self)
+        self._pool = pool
+        self._scheme = scheme
+        self._timeouts = timeouts
+        self._local = threading.local()
+        self.encode_threshold = compress
+
+    def make_connection(self, host):
+        (chost, self._extra_headers, x509) = self.get_host_info(host)
+        timeout = self._timeouts() if self._timeouts else None
+        conn = self._pool.acquire(self._scheme, chost, timeout)
+        self._local.connection = (chost, conn)
+        return conn
+
+    def _release(self, reuse=True):
+        (chost, conn) = getattr(self._local, 'connection', None) or (0, 0)
+        if conn:
+            self._local.connection = None
+            self._pool.release(self._scheme, chost, conn, reuse=reuse)
+
+    def close(self):
+        # Discard the current connection, after an error
+        self._release(reuse=False)
+
+    def getparser(self):
+        (parser, unmarshaller) = Transport.getparser(self)
+        if getattr(_rpc_local, 'sizes', None) is not None:
+            feed = parser.feed
+
+            def count_feed(data):
+                _count_sizes(received=data)
+                return _marshal(feed, data)
+            parser.feed = count_feed
+        return (parser, unmarshaller)
+
+    def single_request(self, host, handler, request_body, verbose=False):
+        _count_sizes(sent=request_body)
+        try:
+            resp = Transport.single_request(self, host, handler,
+                                            request_body, verbose)
+        except Fault:
+            self._release()
+            raise
+        except Exception:
+            self.close()
+            raise
+        self._release()
+        return resp
+
+    def stream_request(self, host, handler, request_body, chunk_size=8192):
+        """Send the request and iterate over the items of the result.
+
+        The response is parsed while it is received, by chunks of
+        `chunk_size` bytes.  The items of the resulting array are
+        returned as soon as they are parsed.
+        """
+        _count_sizes(sent=request_body)
+        try:
+            if PY2:
+                conn = self.make_connection(host)
+                self.send_request(conn, handler, request_body)
+                self.send_host(conn, host)
+                self.send_user_agent(conn)
+                self.send_content(conn, request_body)
+            else:
+                conn = self.send_request(host, handler, request_body, False)
+        except Exception:
+            # Release the connection if the request is not sent
+            self.close()
+            raise
+        # Do not share the connection with the other requests of the thread
+        (chost, conn) = self._local.connection
+        self._local.connection = None
+        reuse = False
+        try:
+            resp = conn.getresponse()
+            if resp.status != 200:
+                resp.read()
+                raise ProtocolError(host + handler, resp.status,
+                                    resp.reason, dict(resp.getheaders()))
+            if resp.getheader('Content-Encoding') == 'gzip':
+                decompress = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress
+            else:
+                decompress = None
+            unmarshaller = _StreamUnmarshaller()
+            parser = ExpatParser(unmarshaller)
+            while True:
+                data = resp.read(chunk_size)
+                if not data:
+                    break
+                _count_sizes(received=data)
+                _marshal(parser.feed, decompress(data) if decompress else data)
+                for item in unmarshaller.pop_items():
+                    yield item
+            parser.close()
+            reuse = True
+            (result,) = unmarshaller.close()
+            for item in result:
+                yield item
+        finally:
+            # Discard the connection if the response is not read
+            self._pool.release(self._scheme, chost, conn, reuse=reuse)
+
+
+class _StreamUnmarshaller(Unmarshaller):
+    # Release the items of the result array as soon as they are parsed
+    _array = None
+
+    def start(self, tag, attrs):
+        if self._array is None and tag in ('array', 'struct'):
+            self._array = (tag == 'array')
+        Unmarshaller.start(self, tag, attrs)
+
+    def pop_items(self):
+        if not (self._array and len(self._marks) == 1):
+            return ()
+        items = self._stack[:]
+        del self._stack[:]
+        return items
+
+
+class HTTPSession(object):
+    """A minimal HTTP client with persistent connections.
+
+    It is used for JSON-RPC if the ``requests`` library is not installed.
+    The connections are taken from the :class:`ConnectionPool` `pool`.
+    If `accept_gzip` is True, the server may compress the responses.
+    """
+
+    def __init__(self, pool, accept_gzip=False):
+        self.pool = pool
+        self.accept_gzip = accept_gzip
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        """Send a POST request and return the response.
+
+        The `timeout` is a ``(connect, read)`` tuple of seconds.
+        """
+        (scheme, host, path) = urlsplit(url)[:3]
+        headers = dict(headers or {})
+        if self.accept_gzip:
+            headers['Accept-Encoding'] = 'gzip'
+        for attempt in (0, 1):
+            conn = self.pool.acquire(scheme, host, timeout)
+            try:
+                conn.request('POST', path, data, headers)
+                resp = conn.getresponse()
+                content = resp.read()
+                if resp.getheader('Content-Encoding') == 'gzip':
+                    content = zlib.decompress(content, 16 + zlib.MAX_WBITS)
+            except socket.timeout:
+                self.pool.release(scheme, host, conn, reuse=False)
+                raise
+            except (BadStatusLine, socket.error):
+                self.pool.release(scheme, host, conn, reuse=False)
+                # Retry once, if the server closed the connection
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                self.pool.release(scheme, host, conn, reuse=False)
+                raise
+            self.pool.release(scheme, host, conn)
+            if resp.status >= 400:
+                raise HTTPError(url, resp.status, resp.reason,
+                                resp.msg, None)
+            return _HTTPResponse(resp.status, content)
+
+    def close(self):
+        """Close the idle connections."""
+        self.pool.close()
+
+
+class _HTTPResponse(object):
+    # Similar to requests.Response
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
 class Error(Exception):
     """An ERPpeek error."""
 
@@ -406,6 +1051,1184 @@ class ServerError(Exception):
     """An error received from the server."""
 
 
+class CircuitOpenError(Error):
+    """The server is considered down, the call is not sent."""
+
+
+class DeadlineExceeded(Error):
+    """The deadline expired before the call is sent."""
+
+
+def _is_transient(exc):
+    # Connection errors, and errors of a proxy or a load balancer
+    if isinstance(exc, (ProtocolError, HTTPError)):
+        return getattr(exc, 'errcode', getattr(exc, 'code', None)) in (
+            502, 503, 504)
+    if requests and isinstance(exc, requests.RequestException):
+        return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+    return isinstance(exc, (socket.error, BadStatusLine))
+
+
+def _is_stale(endpoint, exc):
+    # The cached capabilities might be outdated: a missing service or
+    # method, or a failed call of the 'db' or 'common' services
+    if isinstance(exc, (ProtocolError, HTTPError)):
+        return True
+    message = str(exc)
+    if re.search('Method not (available|found)', message):
+        return True
+    return (endpoint in ('db', 'common') and
+            not re.search('access.?denied', message, re.I))
+
+
+def _not_sent(exc):
+    # The connection failed, the request was not sent
+    if requests and isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    return (isinstance(exc, socket.gaierror) or
+            getattr(exc, 'errno', None) == errno.ECONNREFUSED)
+
+
+def _is_idempotent(name, args):
+    # The calls which can be sent again safely
+    if name in ('execute', 'execute_kw'):
+        name = args[4] if len(args) > 4 else None
+    return name in IDEMPOTENT_METHODS
+
+
+class RetryPolicy(object):
+    """Retry the idempotent calls which fail with a connection error.
+
+    The call is retried at most `retries` times.  The delay before each
+    retry grows exponentially from `backoff` seconds, up to `max_backoff`,
+    and a random jitter is applied.  Only the methods listed in
+    :data:`IDEMPOTENT_METHODS` are retried.  The counter ``retried`` reports
+    the activity.
+    """
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retried = 0
+
+    def __repr__(self):
+        return ("<RetryPolicy retries=%s backoff=%s retried=%s>" %
+                (self.retries, self.backoff, self.retried))
+
+    def delay(self, attempt):
+        """Return the delay before the retry number `attempt` + 1."""
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    """Fail fast when the server is down.
+
+    After `threshold` consecutive connection errors, the circuit opens:
+    the calls raise :exc:`CircuitOpenError` immediately, during
+    `reset_timeout` seconds.  Then a trial call is sent, and the circuit
+    is closed again if it succeeds.  The counters ``trips`` and ``rejected``
+    report how many times the circuit opened, and how many calls failed
+    fast.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = self.trips = self.rejected = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        state = 'closed' if self.opened_at is None else 'open'
+        return ("<CircuitBreaker %s trips=%s rejected=%s>" %
+                (state, self.trips, self.rejected))
+
+    def check(self):
+        """Raise :exc:`CircuitOpenError` if the circuit is open."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.time() < self.opened_at + self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError('The server is not available')
+            # Half-open: send a single trial call
+            self.opened_at = time.time()
+
+    def success(self):
+        """Close the circuit."""
+        if self.failures:
+            with self._lock:
+                self.failures = 0
+                self.opened_at = None
+
+    def failure(self):
+        """Count a connection error, and open the circuit if needed."""
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold and self.opened_at is None:
+                self.trips += 1
+                self.opened_at = time.time()
+
+
+class Balancer(object):
+    """Distribute the calls across several servers.
+
+    The read-only calls (see :data:`IDEMPOTENT_METHODS`) are sent to the
+    `servers` according to the `strategy`: ``round_robin``, or
+    ``least_outstanding`` to choose the server with the fewest pending
+    calls, or ``failover`` to use the first available server of the list.
+    If a `primary` server is set, the other calls are sent to it,
+    otherwise they are distributed too.
+
+    The health of each server is tracked by a :class:`CircuitBreaker`:
+    after `threshold` consecutive connection errors, the server is ejected
+    during `reset_timeout` seconds.  A read-only call which fails with a
+    connection error is sent to the next server, as well as any call which
+    could not connect.  When an ejected server is tried again, the
+    optional `probe` callable checks it first: it receives the index of
+    the server and raises an error if the server is still down.
+
+    The lists ``calls`` and ``outstanding`` report the activity of each
+    server.  With the ``failover`` strategy, the ``active`` server is the
+    last one which answered, and each switch is logged.
+    """
+    strategies = ('round_robin', 'least_outstanding', 'failover')
+
+    def __init__(self, servers, strategy='round_robin', primary=None,
+                 threshold=3, reset_timeout=30.0, probe=None):
+        if strategy not in self.strategies:
+            raise ValueError('Unknown strategy: %r' % (strategy,))
+        if primary is not None and primary not in servers:
+            raise ValueError('The primary server is not listed: %r' %
+                             (primary,))
+        self.servers = list(servers)
+        self.strategy = strategy
+        self.primary = primary
+        self.breakers = [CircuitBreaker(threshold, reset_timeout)
+                         for url in self.servers]
+        self.calls = [0] * len(self.servers)
+        self.outstanding = [0] * len(self.servers)
+        self.active = 0
+        self.probe = probe
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<Balancer %s %s>" % (self.strategy, ' '.join(self.servers))
+
+    def _order(self, write):
+        # Return the indexes of the candidate servers, in order
+        if write and self.primary is not None:
+            return [self.servers.index(self.primary)]
+        count = len(self.servers)
+        if self.strategy == 'failover':
+            return range(count)
+        order = [(self._next + idx) % count for idx in range(count)]
+        if self.strategy == 'least_outstanding':
+            order.sort(key=lambda idx: self.outstanding[idx])
+        return order
+
+    def select(self, write=False, exclude=()):
+        """Return the index of the server for the next call.
+
+        Raise :exc:`CircuitOpenError` if no server is available.
+        """
+        with self._lock:
+            for idx in self._order(write):
+                if idx in exclude:
+                    continue
+                try:
+                    self.breakers[idx].check()
+                except CircuitOpenError:
+                    continue
+                if not (write and self.primary is not None):
+                    self._next = (idx + 1) % len(self.servers)
+                self.outstanding[idx] += 1
+                return idx
+        raise CircuitOpenError('No server is available')
+
+    def done(self, idx, healthy=True):
+        """Record the end of a call, and the health of the server."""
+        with self._lock:
+            self.outstanding[idx] -= 1
+            self.calls[idx] += 1
+            if (healthy and self.strategy == 'failover' and
+                    idx != self.active):
+                _logger.warning('Switch from %s to %s',
+                                self.servers[self.active], self.servers[idx])
+                self.active = idx
+        if healthy:
+            self.breakers[idx].success()
+        else:
+            self.breakers[idx].failure()
+
+    def dispatch(self, proxies, method, args):
+        """Send the call with one of the `proxies`, one for each server."""
+        write = not _is_idempotent(method, args)
+        (tried, error) = ([], None)
+        while True:
+            try:
+                idx = self.select(write, exclude=tried)
+            except CircuitOpenError:
+                if error is None:
+                    raise
+                raise error
+            try:
+                if (self.probe is not None and
+                        self.breakers[idx].opened_at is not None):
+                    self.probe(idx)
+                res = proxies[idx](method, args)
+            except Exception as exc:
+                healthy = not _is_transient(exc)
+                self.done(idx, healthy)
+                if healthy or (write and not _not_sent(exc)):
+                    raise
+                (error, tried) = (exc, tried + [idx])
+            else:
+                self.done(idx)
+                return res
+
+
+class CapabilityCache(object):
+    """Cache the capabilities of the servers in a JSON file.
+
+    For each server URL, it records the version of the server, the services
+    and their methods, and the result of ``db.list`` (False if it is not
+    allowed).  The entries expire after `ttl` seconds.  The file at `path`
+    may be shared by many processes.
+    """
+
+    def __init__(self, path=CACHE_FILE, ttl=3600.0):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<CapabilityCache '%s' ttl=%s>" % (self.path, self.ttl)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _save(self, data):
+        # Replace the file atomically
+        tmp_path = '%s.%s' % (self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, sort_keys=True)
+        getattr(os, 'replace', os.rename)(tmp_path, self.path)
+
+    def _fresh(self, entry):
+        return entry and entry.get('time', 0) + self.ttl > time.time()
+
+    def get(self, server):
+        """Return the capabilities of the `server`, or None if expired."""
+        entry = self._load().get(server)
+        return entry if self._fresh(entry) else None
+
+    def update(self, server, **values):
+        """Store the `values` in the entry of the `server`."""
+        with self._lock:
+            data = self._load()
+            if not self._fresh(data.get(server)):
+                data[server] = {'time': time.time()}
+            data[server].update(values)
+            self._save(data)
+
+    def invalidate(self, server):
+        """Discard the entry of the `server`."""
+        with self._lock:
+            data = self._load()
+            if data.pop(server, None) is not None:
+                self._save(data)
+
+
+class Cassette(object):
+    """Record the RPC calls in a file, and replay them.
+
+    The file at `path` has one JSON line for each call, with the endpoint,
+    the method, the arguments, the result or the error, and the duration.
+    The passwords are not recorded.
+
+    When a call is replayed, the response is the next one which was
+    recorded for the same arguments, or the last one.  The replay waits
+    for the recorded duration, multiplied by `latency`: 0 to reply
+    instantly, 1.0 to emulate the recorded latency.
+    """
+
+    def __init__(self, path, latency=0.0):
+        self.path = os.path.expanduser(path)
+        self.latency = latency
+        self._file = self._calls = None
+        self._append = False
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<Cassette '%s'>" % self.path
+
+    def record(self, endpoint, dispatch, method, args):
+        """Send the call with `dispatch`, and record the response."""
+        start = _timer()
+        try:
+            res = dispatch(method, args)
+        except Exception as exc:
+            self._write(endpoint, method, args, None, _dump_error(exc),
+                        _timer() - start)
+            raise
+        self._write(endpoint, method, args, res, None, _timer() - start)
+        return res
+
+    def replay(self, endpoint, method, args):
+        """Return the recorded response of the call, or raise its error."""
+        key = _cassette_key(endpoint, method, args)
+        with self._lock:
+            if self._calls is None:
+                self._calls = self._load()
+            responses = self._calls.get(key)
+            if not responses:
+                raise Error('Call not recorded in %s: %s.%s' %
+                            (self.path, endpoint, method))
+            (res, error, duration) = (responses.pop(0) if len(responses) > 1
+                                      else responses[0])
+        if self.latency:
+            time.sleep(duration * self.latency)
+        if error is not None:
+            raise _load_error(error)
+        return res
+
+    def close(self):
+        """Close the file of the recording."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, endpoint, method, args, res, error, duration):
+        args = _mask_password(endpoint, method, args)
+        line = json.dumps([endpoint, method, args, res, error,
+                           round(duration, 6)],
+                          separators=(',', ':'), default=str)
+        with self._lock:
+            if self._file is None:
+                # Start a new recording, and append after close()
+                self._file = open(self.path, 'a' if self._append else 'w')
+                self._append = True
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def _load(self):
+        calls = {}
+        with open(self.path) as f:
+            for line in f:
+                (endpoint, method, args, res, error, duration) = \
+                    json.loads(line)
+                key = _cassette_key(endpoint, method, args)
+                calls.setdefault(key, []).append((res, error, duration))
+        return calls
+
+
+def _cassette_key(endpoint, method, args):
+    args = _mask_password(endpoint, method, args)
+    return json.dumps([endpoint, method, args], sort_keys=True,
+                      separators=(',', ':'), default=str)
+
+
+def _dump_error(exc):
+    if isinstance(exc, Fault):
+        return {'fault': [exc.faultCode, exc.faultString]}
+    if isinstance(exc, ServerError):
+        return {'server': exc.args[0]}
+    return {'message': '%s: %s' % (exc.__class__.__name__, exc),
+            'transient': _is_transient(exc)}
+
+
+def _load_error(error):
+    if 'fault' in error:
+        return Fault(*error['fault'])
+    if 'server' in error:
+        return ServerError(error['server'])
+    if error['transient']:
+        return socket.error(error['message'])
+    return Error(error['message'])
+
+
+class Metrics(object):
+    """Collect the statistics of the RPC calls.
+
+    The calls are counted for each ``(endpoint, model, method)``, where
+    `model` is empty except for the ``object`` endpoint.  The registry
+    records the number of calls and errors, the size of the requests
+    and the responses in bytes, and the histogram of the durations, with
+    the upper bounds of the `buckets` in seconds.
+    """
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None):
+        if buckets is not None:
+            self.buckets = tuple(sorted(buckets))
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<Metrics calls=%s>" % sum(
+            [stat[0] for stat in self._stats.values()])
+
+    def record(self, endpoint, model, method, duration, error=False,
+               sent=0, received=0):
+        """Count a call, which lasted `duration` seconds."""
+        key = (endpoint, model or '', method)
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                # [calls, errors, time, sent, received, histogram]
+                stat = self._stats[key] = [0, 0, 0.0, 0, 0,
+                                           [0] * len(self.buckets)]
+            stat[0] += 1
+            stat[1] += bool(error)
+            stat[2] += duration
+            stat[3] += sent
+            stat[4] += received
+            idx = bisect.bisect_left(self.buckets, duration)
+            if idx < len(self.buckets):
+                stat[5][idx] += 1
+
+    def reset(self):
+        """Clear the statistics."""
+        with self._lock:
+            self._stats.clear()
+
+    def stats(self):
+        """Return the statistics, the most expensive calls first.
+
+        Each item is a dictionary with keys ``endpoint``, ``model``,
+        ``method``, ``calls``, ``errors``, ``time``, ``sent``,
+        ``received`` and ``histogram``.  The `histogram` is the list
+        of ``(upper_bound, cumulative_count)`` of the durations.
+        """
+        with self._lock:
+            items = [(key, list(stat[:5]) + [list(stat[5])])
+                     for (key, stat) in self._stats.items()]
+        rv = []
+        for ((endpoint, model, method), stat) in items:
+            (cumul, histogram) = (0, [])
+            for (bound, count) in zip(self.buckets, stat[5]):
+                cumul += count
+                histogram.append((bound, cumul))
+            rv.append({'endpoint': endpoint, 'model': model,
+                       'method': method, 'calls': stat[0],
+                       'errors': stat[1], 'time': stat[2], 'sent': stat[3],
+                       'received': stat[4], 'histogram': histogram})
+        rv.sort(key=lambda item: (-item['time'], item['endpoint'],
+                                  item['model'], item['method']))
+        return rv
+
+    def to_json(self, **kwargs):
+        """Return the statistics as a JSON string."""
+        return json.dumps(self.stats(), **kwargs)
+
+    def to_prometheus(self, prefix='erppeek_rpc'):
+        """Return the statistics in the Prometheus text format."""
+        stats = self.stats()
+
+        def labels(item, **extra):
+            pairs = [(key, item[key]) for key in ('endpoint', 'model',
+                                                  'method')]
+            pairs += sorted(extra.items())
+            return ','.join(['%s="%s"' % (key, _prometheus_escape(value))
+                             for (key, value) in pairs])
+        lines = []
+        for (name, key, text) in [
+                ('calls_total', 'calls', 'Number of RPC calls'),
+                ('errors_total', 'errors', 'Number of failed RPC calls'),
+                ('request_bytes_total', 'sent', 'Size of the requests'),
+                ('response_bytes_total', 'received',
+                 'Size of the responses')]:
+            lines += ['# HELP %s_%s %s.' % (prefix, name, text),
+                      '# TYPE %s_%s counter' % (prefix, name)]
+            lines += ['%s_%s{%s} %s' % (prefix, name, labels(item), item[key])
+                      for item in stats]
+        name = prefix + '_duration_seconds'
+        lines += ['# HELP %s Duration of the RPC calls.' % name,
+                  '# TYPE %s histogram' % name]
+        for item in stats:
+            for (bound, count) in item['histogram']:
+                lines.append('%s_bucket{%s} %s' % (
+                    name, labels(item, le=repr(bound)), count))
+            lines += ['%s_bucket{%s} %s' % (name, labels(item, le='+Inf'),
+                                            item['calls']),
+                      '%s_sum{%s} %r' % (name, labels(item), item['time']),
+                      '%s_count{%s} %s' % (name, labels(item), item['calls'])]
+        return '\n'.join(lines) + '\n'
+
+
+def _prometheus_escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+class Hooks(object):
+    """Callbacks around the RPC calls, to trace them.
+
+    Override the methods in a subclass, or pass the functions as
+    arguments.  Each method receives the :class:`Span` of the call.
+    Register the hooks with ``client.hooks.append(hooks)``.
+    """
+
+    def __init__(self, before=None, after=None, error=None):
+        if before is not None:
+            self.before = before
+        if after is not None:
+            self.after = after
+        if error is not None:
+            self.error = error
+
+    def before(self, span):
+        """Called when the call starts."""
+
+    def after(self, span):
+        """Called when the call returns."""
+
+    def error(self, span, exc):
+        """Called when the call raises the exception `exc`."""
+
+
+class Span(object):
+    """A traced call, passed to the :class:`Hooks`.
+
+    The `name` is ``"rpc"`` for a request sent to the server, else the
+    name of the :class:`Client` method which sends the requests, like
+    ``"execute"``, ``"read"`` or ``"upgrade"``.  The `endpoint`, the
+    `model`, the `method` and the `args` (a summary of the arguments,
+    without the passwords) describe the call.  The `parent` is the
+    enclosing span, or None.
+
+    The positional and keyword arguments of the method are in `params`
+    and `kwargs`.
+
+    When the call is done, `duration` is the time elapsed in seconds,
+    `marshal` the part of this time spent to encode the requests and
+    decode the responses, `sent` the size of the requests and `size` the
+    size of the responses, in bytes.  The `rows` is the number of records
+    received by the methods which return records, such as ``read``: the
+    ids returned by a search are not counted.  The `requests` is the
+    number of requests sent for a ``"rpc"`` span: the calls of a batch
+    share a single request.  The hooks can store their own data in the
+    `tags` dictionary.
+    """
+    duration = error = None
+    requests = 1
+
+    def __init__(self, hooks, name, endpoint, model, method, params=(),
+                 kwargs=None):
+        self.hooks = hooks
+        self.name = name
+        self.endpoint = endpoint
+        self.model = model
+        self.method = method
+        self.params = params
+        self.kwargs = kwargs or {}
+        self.args = _summarize(params, kwargs)
+        self.parent = getattr(_rpc_local, 'span', None)
+        self.sent = self.size = self.rows = 0
+        self.marshal = 0.0
+        self.tags = {}
+
+    def __repr__(self):
+        return "<Span %s %s>" % (self.name, '.'.join(
+            [part for part in (self.endpoint, self.model, self.method)
+             if part]))
+
+    def __enter__(self):
+        self._notify('before', self)
+        _rpc_local.span = self
+        self._start = _timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.finish(exc_value if exc_type else None)
+
+    def finish(self, error=None, duration=None):
+        """Close the span, and call the hooks.
+
+        The `duration` is the share of the call, if it is sent with other
+        calls.
+        """
+        if duration is None:
+            duration = _timer() - self._start
+        self.duration = duration
+        _rpc_local.span = self.parent
+        if self.parent is not None:
+            self.parent.sent += self.sent
+            self.parent.size += self.size
+            self.parent.rows += self.rows
+            self.parent.marshal += self.marshal
+        if error is None:
+            self._notify('after', self)
+        else:
+            self.error = error
+            self._notify('error', self, error)
+
+    def _notify(self, event, *args):
+        for hooks in self.hooks:
+            try:
+                getattr(hooks, event)(*args)
+            except Exception:
+                # Never break the call because of the tracing
+                _logger.exception('Error in the %r hook of %r', event, hooks)
+
+
+class _NoSpan(object):
+    # The span, when there's no hook
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+
+_no_span = _NoSpan()
+_public_db_methods = ('db_exist', 'list', 'list_lang', 'list_countries',
+                      'server_version')
+# Positions of the passwords in the arguments of the 'db' methods.
+# The other methods take the master password first.
+_db_password_args = {
+    'create': (0, 4),                   # < 8.0
+    'create_database': (0, 4),
+    'change_admin_password': (0, 1),
+}
+
+
+def _summarize(args, kwargs=None, maxlen=MAXCOL[1]):
+    # Return a short representation of the arguments
+    rv = [repr(arg) for arg in args]
+    rv += ['%s=%r' % item for item in sorted((kwargs or {}).items())]
+    rv = ', '.join(rv)
+    if len(rv) > maxlen:
+        suffix = '... L=%s' % len(rv)
+        rv = rv[:maxlen - len(suffix)] + suffix
+    return rv
+
+
+def _mask_password(endpoint, name, args):
+    # Replace the password in the arguments with '*'
+    if endpoint == 'db':
+        if name not in _public_db_methods:
+            masked = _db_password_args.get(name, (0,))
+            return ['*' if idx in masked else arg
+                    for (idx, arg) in enumerate(args)]
+    elif len(args) > 2:
+        return list(args[:2]) + ['*'] + list(args[3:])
+    return list(args)
+
+
+def _sanitize(endpoint, name, args):
+    # Hide the passwords, and the model and the method of 'object' calls.
+    # Return the positional and the keyword arguments
+    if endpoint in ('db', 'common'):
+        args = _mask_password(endpoint, name, args)
+    elif endpoint == 'object' and name == 'execute_kw':
+        return (tuple(args[5]) if len(args) > 5 else (),
+                args[6] if len(args) > 6 else None)
+    elif endpoint == 'object' and name == 'execute':
+        args = args[5:]
+    else:
+        args = args[3:]
+    return (tuple(args), None)
+
+
+class SlowCallLog(Hooks):
+    """Log the RPC calls which last more than `threshold` seconds.
+
+    For each slow call, it logs a warning with the model and the method,
+    the fingerprint of the domain, the number of ids and fields, the
+    size of the request and the response, and the line of the script
+    which triggered the call.  The details are also attached to the log
+    record, as the ``slow_call`` attribute.
+    """
+
+    def __init__(self, threshold, logger=None):
+        self.threshold = threshold
+        self.logger = logger or _logger
+
+    def after(self, span):
+        if span.name != 'rpc' or span.duration < self.threshold:
+            return
+        (domain, ids, fields) = _call_shape(span.method, span.params,
+                                           span.kwargs)
+        frame = _caller_frame()
+        info = {'duration': span.duration, 'endpoint': span.endpoint,
+                'model': span.model, 'method': span.method,
+                'domain': domain, 'ids': ids, 'fields': fields,
+                'sent': span.sent, 'received': span.size,
+                'error': span.error is not None,
+                'filename': frame and frame[0], 'lineno': frame and frame[1],
+                'function': frame and frame[2]}
+        self.logger.warning(
+            'Slow call %.3fs: %s domain=%s ids=%s fields=%s sent=%s '
+            'received=%s at %s:%s in %s', span.duration,
+            '.'.join([part for part in (span.endpoint, span.model,
+                                        span.method) if part]),
+            domain, ids, fields, span.sent, span.size,
+            info['filename'], info['lineno'], info['function'],
+            extra={'slow_call': info})
+
+    def error(self, span, exc):
+        self.after(span)
+
+
+def _fingerprint(domain):
+    # Replace the values of the domain with '?'
+    terms = []
+    for term in domain:
+        if isinstance(term, (list, tuple)) and len(term) == 3:
+            terms.append('(%r, %r, ?)' % tuple(term[:2]))
+        elif isinstance(term, basestring) and term in DOMAIN_OPERATORS:
+            terms.append(repr(term))
+        else:
+            terms.append('?')
+    return '[%s]' % ', '.join(terms)
+
+
+def _call_shape(method, params, kwargs):
+    # Return the fingerprint of the domain, the number of ids and fields
+    (domain, ids, fields) = (None, None, None)
+    first = params[0] if params else kwargs.get('domain', kwargs.get('ids'))
+    if isinstance(first, int_types) and not isinstance(first, bool):
+        ids = 1
+    elif isinstance(first, (list, tuple)):
+        if all([isinstance(id_, int_types) for id_ in first]) and first:
+            ids = len(first)
+        else:
+            domain = _fingerprint(first)
+    fields = kwargs.get('fields')
+    if fields is None and method in ('read', 'search_read') and params[1:]:
+        fields = params[1]
+    fields = len(fields) if isinstance(fields, (list, tuple)) else None
+    return (domain, ids, fields)
+
+
+def _count_rows(method, res):
+    # Return the number of records received, for the methods which
+    # return records.  The ids returned by a search are not counted.
+    if method in _record_methods and isinstance(res, list):
+        return len(res)
+    return 0
+
+
+def _caller_frame():
+    # Return the filename, the line number and the function of the
+    # innermost frame outside of this module
+    module = _caller_frame.__code__.co_filename
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_filename != module:
+            code = frame.f_code
+            return (code.co_filename, frame.f_lineno, code.co_name)
+        frame = frame.f_back
+
+
+class NPlusOneDetector(object):
+    """Detect the fields which are read record by record.
+
+    Reading a field of a :class:`Record` sends one ``read`` request.  In a
+    loop over many records, it is better to read the field for all the
+    records at once, with :meth:`RecordList.read` or with an attribute of
+    the :class:`RecordList`.
+
+    The detector counts the reads of each field of a model, for each line
+    of the script.  It logs a warning when a line reads the same field
+    `threshold` times within `window` seconds, and a report of these
+    lines at exit.
+    """
+    window = 1.0
+
+    def __init__(self, threshold=10, window=None, logger=None):
+        self.threshold = threshold
+        if window is not None:
+            self.window = window
+        self.logger = logger or _logger
+        self.reads = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, field):
+        """Count a read of the `field` of a single record of the `model`."""
+        frame = _caller_frame()
+        key = (model, field) + (frame[:2] if frame else (None, None))
+        now = time.time()
+        with self._lock:
+            # [count, window_start, window_count, warned]
+            stat = self.reads.get(key)
+            if stat is None:
+                stat = self.reads[key] = [0, now, 0, False]
+            if now - stat[1] > self.window:
+                stat[1:3] = [now, 0]
+            stat[0] += 1
+            stat[2] += 1
+            if stat[3] or stat[2] < self.threshold:
+                return
+            stat[3] = True
+        self.logger.warning(
+            'N+1 reads: %s.%s is read for %s single records at %s:%s, '
+            'read the field on the RecordList instead',
+            model, field, stat[2], key[2], key[3])
+
+    def report(self):
+        """Return the lines which read a field record by record."""
+        with self._lock:
+            items = [(stat[0], key) for (key, stat) in self.reads.items()
+                     if stat[3]]
+        items.sort(key=lambda item: (-item[0], item[1]))
+        return ['%s.%s: %s reads at %s:%s' % (model, field, count,
+                                               filename, lineno)
+                for (count, (model, field, filename, lineno)) in items]
+
+    def log_report(self):
+        """Log the report, if any line reads a field record by record."""
+        lines = self.report()
+        if lines:
+            self.logger.warning('N+1 reads:\n  %s', '\n  '.join(lines))
+
+
+class Profile(Hooks):
+    """Profile the calls, grouped by model and method.
+
+    A call of :meth:`Client.execute` or :meth:`Client.read` might send
+    several requests.  For each group, the profile counts the `calls`,
+    the `errors` and the `requests`.  It measures the `time` of the calls,
+    the `network` time of the requests, the `marshal` time to encode and
+    decode them, and the `client` time which remains.  It counts the
+    `rows` and the bytes `sent` and `received`.
+
+    See :meth:`Client.profile`.
+    """
+    columns = ('model', 'method', 'calls', 'errors', 'requests', 'time',
+               'network', 'marshal', 'client', 'rows', 'sent', 'received')
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def after(self, span):
+        if span.parent is not None:
+            if span.name == 'rpc':
+                # Count the request in the outermost call
+                root = span.parent
+                while root.parent is not None:
+                    root = root.parent
+                counts = root.tags.setdefault('profile', [0, 0.0])
+                counts[0] += span.requests
+                counts[1] += span.duration
+            return
+        if span.name == 'rpc':
+            (requests, network) = (span.requests, span.duration)
+        else:
+            (requests, network) = span.tags.get('profile', (0, 0.0))
+        network -= span.marshal
+        key = (span.model or span.endpoint or '', span.method)
+        with self._lock:
+            # [calls, errors, requests, time, network, marshal, rows,
+            #  sent, received]
+            stat = self._stats.setdefault(key, [0, 0, 0, 0.0, 0.0, 0.0,
+                                                0, 0, 0])
+            for (idx, value) in enumerate((
+                    1, span.error is not None, requests, span.duration,
+                    network, span.marshal, span.rows, span.sent,
+                    span.size)):
+                stat[idx] += value
+
+    def error(self, span, exc):
+        self.after(span)
+
+    def stats(self):
+        """Return the statistics, the most expensive calls first.
+
+        Each item is a dictionary, with the keys listed in `columns`.
+        """
+        with self._lock:
+            items = [(key, list(stat)) for (key, stat) in self._stats.items()]
+        rv = []
+        for ((model, method), stat) in items:
+            client = max(stat[3] - stat[4] - stat[5], 0.0)
+            values = (model, method) + tuple(stat[:6]) + (client,)
+            rv.append(dict(zip(self.columns, values + tuple(stat[6:]))))
+        rv.sort(key=lambda item: (-item['time'], item['model'],
+                                  item['method']))
+        return rv
+
+    def report(self):
+        """Return the statistics as a text table."""
+        line = ('%-30s %-20s %6s %6s %8s %9s %9s %9s %9s %8s %10s %10s')
+        lines = [line % self.columns]
+        for item in self.stats():
+            lines.append(line % tuple(
+                ('%.3f' % item[key]) if isinstance(item[key], float)
+                else item[key] for key in self.columns))
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self, **kwargs):
+        """Return the statistics as a JSON string."""
+        return json.dumps(self.stats(), **kwargs)
+
+    def to_csv(self, fileobj):
+        """Write the statistics to the `fileobj`, in CSV format."""
+        writer = _DictWriter(fileobj, self.columns,
+                             quoting=csv.QUOTE_NONNUMERIC)
+        writer.writeheader()
+        writer.writerows(self.stats())
+
+    def save(self, output):
+        """Write the statistics to `output`, a file or a filename.
+
+        The format is CSV or JSON for the filenames which end with
+        ``.csv`` or ``.json``, else it is the text :meth:`report`.
+        """
+        if not isinstance(output, basestring):
+            output.write(self.report())
+            return
+        with open(output, 'w') as fileobj:
+            if output.endswith('.csv'):
+                self.to_csv(fileobj)
+            elif output.endswith('.json'):
+                fileobj.write(self.to_json(indent=2))
+            else:
+                fileobj.write(self.report())
+
+
+def _percentile(values, percent):
+    # Return the nearest-rank percentile of the sorted values
+    if not values:
+        return 0.0
+    return values[max(-(-len(values) * percent // 100) - 1, 0)]
+
+
+class Workload(object):
+    """A mix of operations to load the server.
+
+    The `operations` is a list of dictionaries, with the keys ``model``,
+    ``method`` (one of ``read``, ``search``, ``search_count``, ``write``
+    or ``create``, default ``read``), ``domain`` (default ``[]``),
+    ``fields``, ``limit``, ``values`` for ``write`` and ``create``, and
+    ``weight`` (default 1).  The optional ``name`` is the label of the
+    operation in the report.  The ``read`` and ``write`` operations
+    search the records with the `domain` and the `limit` first.
+
+    See :meth:`run` and the ``erppeek bench`` command.
+    """
+    methods = ('read', 'search', 'search_count', 'write', 'create')
+    columns = ('operation', 'calls', 'errors', 'error_rate', 'throughput',
+               'mean', 'p50', 'p90', 'p99', 'max')
+
+    def __init__(self, operations):
+        self.operations = []
+        for operation in operations:
+            operation = dict(operation)
+            operation.setdefault('method', 'read')
+            operation.setdefault('domain', [])
+            operation.setdefault('weight', 1)
+            if 'model' not in operation:
+                raise ValueError('Missing model: %r' % (operation,))
+            if operation['method'] not in self.methods:
+                raise ValueError('Unsupported method: %r' %
+                                 (operation['method'],))
+            if operation['method'] in ('write', 'create'):
+                operation.setdefault('values', {})
+            operation.setdefault('name', '%(model)s %(method)s' % operation)
+            self.operations.append(operation)
+        if not self.operations:
+            raise ValueError('The workload is empty')
+        self.elapsed = 0.0
+        self.workers = 0
+        self._latencies = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<Workload %s>" % ', '.join(
+            '%(name)s*%(weight)s' % op for op in self.operations)
+
+    @classmethod
+    def from_file(cls, path):
+        """Read the workload from a JSON file.
+
+        The file contains the list of the operations, or a dictionary
+        with this list in the ``operations`` key.
+        """
+        with open(path) as fileobj:
+            data = json.load(fileobj)
+        return cls(data['operations'] if isinstance(data, dict) else data)
+
+    def _execute(self, client, operation):
+        (model, method) = (operation['model'], operation['method'])
+        # The domain is parsed in place, use a copy
+        domain = list(operation['domain'])
+        if method == 'search_count':
+            return client.execute(model, method, domain)
+        if method == 'create':
+            return client.execute(model, method, operation['values'])
+        ids = client.execute(model, 'search', domain,
+                             limit=operation.get('limit'))
+        if method == 'read' and ids:
+            return client.execute(model, 'read', ids, operation.get('fields'))
+        if method == 'write' and ids:
+            return client.execute(model, 'write', ids, operation['values'])
+        return ids
+
+    def run(self, client, workers=1, duration=None, requests=None,
+            seed=None):
+        """Run the workload on the `client`, with concurrent `workers`.
+
+        The operations are chosen at random, according to their weight.
+        The workers stop after `duration` seconds, or when the total
+        number of `requests` is reached.  Return the :meth:`stats`.
+        The `seed` makes the sequence of operations repeatable.
+        """
+        if duration is None and requests is None:
+            raise ValueError('Set the duration or the number of requests')
+        cumulative = []
+        for operation in self.operations:
+            cumulative.append(operation['weight'] +
+                              (cumulative[-1] if cumulative else 0))
+        total = cumulative[-1]
+        # The budget of requests, shared by the workers
+        budget = iter(range(requests)) if requests is not None else None
+        start = _timer()
+        deadline = start + duration if duration is not None else None
+
+        def worker(rand):
+            latencies = dict((op['name'], []) for op in self.operations)
+            errors = {}
+            while deadline is None or _timer() < deadline:
+                if budget is not None:
+                    with self._lock:
+                        if next(budget, None) is None:
+                            break
+                idx = bisect.bisect(cumulative, rand.random() * total)
+                operation = self.operations[idx]
+                begin = _timer()
+                try:
+                    self._execute(client, operation)
+                except Exception as exc:
+                    message = (str(exc).strip().splitlines() or [''])[0]
+                    key = (operation['name'],
+                           '%s: %s' % (type(exc).__name__, message))
+                    errors[key] = errors.get(key, 0) + 1
+                else:
+                    latencies[operation['name']].append(_timer() - begin)
+            with self._lock:
+                for (name, values) in latencies.items():
+                    self._latencies.setdefault(name, []).extend(values)
+                for (key, count) in errors.items():
+                    self._errors[key] = self._errors.get(key, 0) + count
+        rand = random.Random(seed)
+        threads = [threading.Thread(target=worker,
+                                    args=(random.Random(rand.random()),))
+                   for __ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed += _timer() - start
+        self.workers = max(self.workers, workers)
+        return self.stats()
+
+    def stats(self):
+        """Return the statistics of each operation.
+
+        Each item is a dictionary, with the keys listed in `columns`.
+        The `throughput` is the number of calls per second, and the
+        latencies of the successful calls are in seconds.
+        """
+        with self._lock:
+            latencies = dict((name, sorted(values))
+                             for (name, values) in self._latencies.items())
+            errors = {}
+            for ((name, message), count) in self._errors.items():
+                errors[name] = errors.get(name, 0) + count
+        rv = []
+        for operation in self.operations:
+            values = latencies.get(operation['name'], [])
+            failed = errors.get(operation['name'], 0)
+            calls = len(values) + failed
+            rv.append(dict(zip(self.columns, (
+                operation['name'], calls, failed,
+                failed / float(calls) if calls else 0.0,
+                calls / self.elapsed if self.elapsed else 0.0,
+                sum(values) / len(values) if values else 0.0,
+                _percentile(values, 50), _percentile(values, 90),
+                _percentile(values, 99), values[-1] if values else 0.0))))
+        return rv
+
+    def errors(self):
+        """Return the error messages, the most frequent first.
+
+        Each item is a tuple ``(count, operation, message)``.
+        """
+        with self._lock:
+            items = [(count, name, message) for ((name, message), count)
+                     in self._errors.items()]
+        return sorted(items, key=lambda item: (-item[0],) + item[1:])
+
+    def summary(self):
+        """Return the totals of the workload, as a dictionary."""
+        stats = self.stats()
+        calls = sum(item['calls'] for item in stats)
+        errors = sum(item['errors'] for item in stats)
+        return {'elapsed': self.elapsed, 'workers': self.workers,
+                'calls': calls, 'errors': errors,
+                'error_rate': errors / float(calls) if calls else 0.0,
+                'throughput': calls / self.elapsed if self.elapsed else 0.0}
+
+    def report(self):
+        """Return the statistics as a text table.
+
+        The latencies are in milliseconds.
+        """
+        summary = self.summary()
+        line = '%-30s %7s %7s %10s %10s %9s %9s %9s %9s %9s'
+        lines = [('%(calls)d calls in %(elapsed).2f s with %(workers)d '
+                  'workers: %(throughput).1f calls/s, %(errors)d errors' %
+                  summary), '', line % self.columns]
+        for item in self.stats():
+            lines.append(line % (
+                (item['operation'], item['calls'], item['errors'],
+                 '%.2f%%' % (item['error_rate'] * 100),
+                 '%.1f' % item['throughput']) +
+                tuple('%.1f' % (item[key] * 1000)
+                      for key in self.columns[5:])))
+        errors = self.errors()
+        if errors:
+            lines.extend(['', 'Errors:'])
+            lines.extend(['%7d  %s  %s' % item for item in errors])
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self, **kwargs):
+        """Return the summary, the statistics and the error messages
+        as a JSON string."""
+        data = dict(self.summary(), operations=self.stats(),
+                    messages=[dict(zip(('count', 'operation', 'message'),
+                                       item)) for item in self.errors()])
+        return json.dumps(data, **kwargs)
+
+    def save(self, output):
+        """Write the statistics to `output`, a file or a filename.
+
+        The format is JSON for the filenames which end with ``.json``,
+        else it is the text :meth:`report`.
+        """
+        if not isinstance(output, basestring):
+            output.write(self.report())
+            return
+        with open(output, 'w') as fileobj:
+            if output.endswith('.json'):
+                fileobj.write(self.to_json(indent=2))
+            else:
+                fileobj.write(self.report())
+
+
 class Service(object):
     """A wrapper around XML-RPC endpoints.
 
@@ -421,6 +2244,14 @@ class Service(object):
 
     def __init__(self, client, endpoint, methods, verbose=False):
         self._dispatch = client._proxy(endpoint)
+        self._dispatch_batch = client._proxy_batch(endpoint)
+        self._dispatch_stream = client._proxy_stream(endpoint)
+        self._retry = client.retry
+        self._breaker = client.breaker
+        self._revalidate = (client._revalidate if client._capabilities
+                            else None)
+        self._metrics = client.metrics
+        self._hooks = client.hooks
         self._rpcpath = client._server
         self._endpoint = endpoint
         self._methods = methods
@@ -451,7 +2282,7 @@ class Service(object):
                     suffix = '... L=%s' % len(snt)
                     snt = snt[:maxcol - len(suffix)] + suffix
                 print('--> ' + snt)
-                res = self._dispatch(name, args)
+                res = self._call(name, args)
                 rcv = str(res)
                 if len(rcv) > maxcol:
                     suffix = '... L=%s' % len(rcv)
@@ -459,9 +2290,190 @@ class Service(object):
                 print('<-- ' + rcv)
                 return res
         else:
-            wrapper = lambda s, *args: s._dispatch(name, args)
+            wrapper = lambda s, *args: s._call(name, args)
         return _memoize(self, name, wrapper)
 
+    def _call(self, name, args):
+        (metrics, hooks) = (self._metrics, self._hooks)
+        if self._revalidate is None and metrics is None and not hooks:
+            return self._send(name, args)
+        (model, method) = self._model_method(name, args)
+        span = None
+        if hooks:
+            span = Span(hooks, 'rpc', self._endpoint, model, method,
+                        *_sanitize(self._endpoint, name, args))
+            span.__enter__()
+        _rpc_local.sizes = sizes = [0, 0, 0.0]
+        start = _timer()
+        error = res = None
+        try:
+            res = self._send(name, args)
+            return res
+        except Exception as exc:
+            error = exc
+            # The cached capabilities might be outdated
+            if (self._revalidate is not None and not _is_transient(exc) and
+                    _is_stale(self._endpoint, exc)):
+                self._revalidate()
+            raise
+        finally:
+            duration = _timer() - start
+            _rpc_local.sizes = None
+            if metrics is not None:
+                metrics.record(self._endpoint, model, method, duration,
+                               error is not None, sizes[0], sizes[1])
+            if span is not None:
+                (span.sent, span.size, span.marshal) = sizes
+                span.rows = _count_rows(method, res)
+                span.finish(error)
+
+    def _call_batch(self, calls):
+        # Send the calls in a single request, measured like _call
+        # The time and the sizes are shared evenly between the calls
+        (metrics, hooks) = (self._metrics, self._hooks)
+        dispatch = (lambda name, args: self._dispatch_batch(args))
+        if metrics is None and not hooks:
+            return self._send(None, calls, dispatch)
+        _rpc_local.sizes = sizes = [0, 0, 0.0]
+        start = _timer()
+        error = results = None
+        try:
+            results = self._send(None, calls, dispatch)
+            return results
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            duration = _timer() - start
+            _rpc_local.sizes = None
+            # No result if the server does not support the batch requests
+            count = len(calls) if (results or error) else 0
+            for (idx, (name, args)) in enumerate(calls[:count]):
+                res = error if results is None else results[idx]
+                failed = res if isinstance(res, Exception) else None
+                (model, method) = self._model_method(name, args)
+                if metrics is not None:
+                    metrics.record(self._endpoint, model, method,
+                                   duration / count, failed is not None,
+                                   sizes[0] // count, sizes[1] // count)
+                if hooks:
+                    span = Span(hooks, 'rpc', self._endpoint, model, method,
+                                *_sanitize(self._endpoint, name, args))
+                    span.__enter__()
+                    span.requests = int(idx == 0)
+                    (span.sent, span.size, span.marshal) = (
+                        sizes[0] // count, sizes[1] // count,
+                        sizes[2] / count)
+                    span.rows = _count_rows(method, res)
+                    span.finish(failed, duration / count)
+
+    def _call_stream(self, name, args):
+        # Iterate over the result while it is received, measured like
+        # _call.  The time between the items is not counted.
+        (metrics, hooks) = (self._metrics, self._hooks)
+        dispatch = (lambda name, args:
+                    _prefetch(self._dispatch_stream(name, args)))
+        (model, method) = self._model_method(name, args)
+        span = None
+        if hooks:
+            span = Span(hooks, 'rpc', self._endpoint, model, method,
+                        *_sanitize(self._endpoint, name, args))
+            span.__enter__()
+            # The caller runs between the items, outside of this span
+            _rpc_local.span = span.parent
+        sizes = [0, 0, 0.0]
+        (duration, rows, error) = (0.0, 0, None)
+        start = _timer()
+        try:
+            _rpc_local.sizes = sizes
+            try:
+                items = self._send(name, args, dispatch)
+            finally:
+                _rpc_local.sizes = None
+                duration += _timer() - start
+            while True:
+                start = _timer()
+                _rpc_local.sizes = sizes
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                finally:
+                    _rpc_local.sizes = None
+                    duration += _timer() - start
+                rows += 1
+                yield item
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            if metrics is not None:
+                metrics.record(self._endpoint, model, method, duration,
+                               error is not None, sizes[0], sizes[1])
+            if span is not None:
+                (span.sent, span.size, span.marshal) = sizes
+                span.rows = rows if method in _record_methods else 0
+                span.finish(error, duration)
+
+    def _model_method(self, name, args):
+        # Return the model and the method of an 'object' call
+        if (self._endpoint == 'object' and
+                name in ('execute', 'execute_kw') and len(args) > 4):
+            return (args[3], args[4])
+        return (None, name)
+
+    def _send(self, name, args, dispatch=None):
+        # Send the call, with the retry policy and the circuit breaker
+        (retry, breaker) = (self._retry, self._breaker)
+        dispatch = dispatch or self._dispatch
+        if retry is None and breaker is None:
+            return dispatch(name, args)
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.check()
+            try:
+                res = dispatch(name, args)
+            except Exception as exc:
+                if not _is_transient(exc):
+                    if breaker is not None:
+                        breaker.success()
+                    raise
+                if breaker is not None:
+                    breaker.failure()
+                if not (retry is not None and attempt < retry.retries and
+                        self._idempotent(name, args)):
+                    raise
+                retry.retried += 1
+                time.sleep(retry.delay(attempt))
+                attempt += 1
+            else:
+                if breaker is not None:
+                    breaker.success()
+                return res
+
+    def _idempotent(self, name, args):
+        if name is None:    # A batch of calls
+            return all(_is_idempotent(*call) for call in args)
+        return _is_idempotent(name, args)
+
+    def _dispatch_many(self, calls, workers=1):
+        """Send the `calls` in a single request, if possible.
+
+        The `calls` are ``(method, args)`` tuples.  Return the list of
+        results in the same order, where the errors are exception instances.
+        If the server does not support batch requests (JSON-RPC) or
+        ``system.multicall`` (XML-RPC), the calls are sent concurrently,
+        with at most `workers` threads.
+        """
+        if self._dispatch_batch is not None:
+            results = self._call_batch(calls)
+            if results is not None:
+                return results
+            self._dispatch_batch = None
+        return _parallel_map(lambda call: getattr(self, call[0])(*call[1]),
+                             calls, workers)
+
     def __del__(self):
         if hasattr(self, 'close'):
             self.close()
@@ -478,24 +2490,119 @@ class Client(object):
     The `db` is the name of the database and the `user` should exist in the
     table ``res.users``.  If the `password` is not provided, it will be
     asked on login.
+
+    Additional keyword arguments are accepted to tune the connection:
+
+     - `pool_size`: maximum number of connections per host (default 10)
+     - `idle_timeout`: delay in seconds before closing an idle connection
+       (default 60)
+     - `compress`: compress the requests with gzip if their size exceeds
+       this threshold in bytes, and accept compressed responses.  The server
+       must accept such requests.  Disabled by default (None).
+     - `codec`: the JSON codec for JSON-RPC, see :func:`json_codec`
+       (default ``json``)
+     - `retries`: retry the idempotent calls which fail with a connection
+       error, at most this number of times (default 0), see
+       :class:`RetryPolicy`
+     - `backoff`: the initial delay before a retry, in seconds (default 0.5)
+     - `breaker_threshold`: fail fast after this number of consecutive
+       connection errors, see :class:`CircuitBreaker` (default None)
+     - `breaker_timeout`: delay in seconds before trying again to connect
+       (default 30)
+     - `timeout`: the read timeout of the requests, in seconds
+       (default None, no limit)
+     - `connect_timeout`: the timeout to open a connection, in seconds
+       (default: same as `timeout`)
+
+    These options can be passed in the query string of the `server` URL
+    too.  Example: ``http://localhost:8069/jsonrpc?compress=4096``.
+
+    The `server` may be a list of URLs, or a string of URLs separated by
+    spaces or commas, to distribute the calls across several servers, with
+    the same protocol.  They are tuned with these options, see
+    :class:`Balancer`:
+
+     - `balance`: the strategy for the read-only calls, ``round_robin``
+       (default) or ``least_outstanding``
+     - `primary`: the URL of the server which receives the other calls
+       (default None: they are distributed too)
+     - `eject_threshold`: eject a server after this number of consecutive
+       connection errors (default 3)
+     - `eject_timeout`: delay in seconds before trying an ejected server
+       again (default 30)
+     - `fallback`: the standby servers, in order of preference.  The calls
+       are sent to the first available server of the list: the `server`,
+       else the first fallback, ...  This is the ``failover`` strategy.
+     - `cache_file`: the path of the :class:`CapabilityCache`, or True for
+       the default ``~/.erppeek_cache`` (default None: no cache).  The
+       version and the services of the server are read from the cache,
+       instead of asking the server.
+     - `cache_ttl`: the lifetime of the cached capabilities, in seconds
+       (default 3600)
+     - `version`: the version of the server, like ``11.0``, if it is known
+       (default None: ask the server)
+     - `metrics`: collect the statistics of the calls in :attr:`metrics`
+       (default True), see :meth:`stats`
+     - `slow_threshold`: log the calls which last more than this number
+       of seconds, with a :class:`SlowCallLog` (default None)
+     - `n1_threshold`: warn when a line of the script reads a field of
+       this number of single records, with a :class:`NPlusOneDetector`
+       (default None)
+     - `record`: record the calls in this file, see :class:`Cassette`
+       (default None)
+     - `replay`: reply to the calls with the responses recorded in this
+       file, instead of sending them to the server (default None)
+     - `replay_latency`: 0 to replay instantly, or 1.0 to wait for the
+       recorded duration of the calls (default 0)
+
+    The version of the server is read when the client is created, unless
+    it is set with the `version` option.  The RPC services are created on
+    first use.
+
+    The persistent connections are kept in the :attr:`pool`.  With JSON-RPC,
+    a ``requests.Session`` is used instead, if ``requests`` is installed.
+
+    The client can be shared by many threads: each thread sends its
+    requests on its own connection, and the caches of the models are
+    protected by a lock.  However :meth:`login` and :meth:`reset` change
+    the client for all the threads.  The :meth:`timeout` and
+    :meth:`deadline` contexts apply to the current thread only.
     """
     _config_file = os.path.join(os.curdir, CONF_FILE)
+    pool = _session = _codec = None
+    retry = breaker = balancer = metrics = n1_detector = None
+    cassette = None
+    _cache = _capabilities = None
 
     def __init__(self, server, db=None, user=None, password=None,
-                 transport=None, verbose=False):
-        self._set_services(server, transport, verbose)
+                 transport=None, verbose=False, **options):
+        (server, self._options) = _client_options(server, options)
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self.hooks = []
         self.reset()
+        self._set_services(server, transport, verbose)
         self.context = None
         if db:    # Try to login
             self.login(user, password=password, database=db)
 
     def _set_services(self, server, transport, verbose):
-        if isinstance(server, list):
+        servers = _split_servers(server)
+        if servers:
+            server = _server_url(servers[0])
+            # The other servers use the protocol of the first one
+            protocol = 'jsonrpc' if '/jsonrpc' in server else 'xmlrpc'
+            servers = [_server_url(url, protocol) for url in servers]
+        elif isinstance(server, list):
             appname = os.path.basename(__file__).rstrip('co')
             server = start_odoo_services(server, appname=appname)
-        elif isinstance(server, basestring) and server[-1:] == '/':
-            server = server.rstrip('/')
         self._server = server
+        if self._options['retries']:
+            self.retry = RetryPolicy(self._options['retries'],
+                                     self._options['backoff'])
+        if self._options['breaker_threshold']:
+            self.breaker = CircuitBreaker(self._options['breaker_threshold'],
+                                          self._options['breaker_timeout'])
 
         if not isinstance(server, basestring):
             assert not transport, "Not supported"
@@ -503,43 +2610,162 @@ class Client(object):
         elif '/jsonrpc' in server:
             assert not transport, "Not supported"
             self._proxy = self._proxy_jsonrpc
+            (self._session, self.pool) = http_session(self._options)
+            if self._options['codec'] != 'json':
+                self._codec = json_codec(self._options['codec'])
         else:
-            if '/xmlrpc' not in server:
-                self._server = server + '/xmlrpc'
             self._proxy = self._proxy_xmlrpc
+            if transport is None:
+                # Share the connections between the services
+                self.pool = ConnectionPool(self._options['pool_size'],
+                                           self._options['idle_timeout'])
+                transport = PooledTransport(self.pool, server.split(':')[0],
+                                            self._options['compress'],
+                                            self._timeouts)
             self._transport = transport
-
-        def get_service(name):
-            methods = list(_methods[name]) if (name in _methods) else []
-            if float_version < 8.0:
-                methods += _obsolete_methods.get(name) or ()
-            return Service(self, name, methods, verbose=verbose)
-
-        float_version = 99.0
-        self.server_version = ver = get_service('db').server_version()
-        self.major_version = re.match(r'\d+\.?\d*', ver).group()
-        float_version = float(self.major_version)
-        # Create the RPC services
-        self.db = get_service('db')
-        self.common = get_service('common')
-        self._object = get_service('object')
-        self._report = get_service('report') if float_version < 11.0 else None
-        self._wizard = get_service('wizard') if float_version < 7.0 else None
+        opts = self._options
+        if servers and opts['fallback']:
+            servers += [_server_url(url, protocol)
+                        for url in _split_servers(opts['fallback'])]
+            opts['balance'] = 'failover'
+        if servers and len(servers) > 1:
+            primary = (opts['primary'] and
+                       _server_url(opts['primary'], protocol))
+            self.balancer = Balancer(servers, opts['balance'], primary,
+                                     threshold=opts['eject_threshold'],
+                                     reset_timeout=opts['eject_timeout'],
+                                     probe=self._probe)
+            self._server = primary or server
+            self._proxy_server = self._proxy
+            self._proxy = self._proxy_balanced
+
+        if opts['replay']:
+            self.cassette = Cassette(opts['replay'], opts['replay_latency'])
+            self._proxy = self._proxy_replay
+        elif opts['record']:
+            self.cassette = Cassette(opts['record'])
+            self._proxy_wire = self._proxy
+            self._proxy = self._proxy_record
+
+        if (opts['cache_file'] and not self.cassette and
+                isinstance(server, basestring)):
+            self._cache = CapabilityCache(
+                CACHE_FILE if opts['cache_file'] is True else
+                opts['cache_file'], opts['cache_ttl'])
+            self._capabilities = self._cache.get(self._server)
+        if opts['metrics']:
+            self.metrics = Metrics()
+        if opts['slow_threshold']:
+            self.hooks.append(SlowCallLog(opts['slow_threshold']))
+        if opts['n1_threshold']:
+            self.n1_detector = NPlusOneDetector(opts['n1_threshold'])
+            atexit.register(self.n1_detector.log_report)
+        self._verbose = verbose
+        self._set_version()
+        # The RPC services are created on first access
+
+    def _service_methods(self, name, float_version):
+        # Return the methods of the service, for this version of the server
+        services = (self._capabilities or {}).get('services')
+        if services:
+            return services.get(name)
+        if float_version >= _removed_services.get(name, 999.0):
+            return None     # Not available
+        methods = list(_methods[name]) if (name in _methods) else []
+        if float_version < 8.0:
+            methods += _obsolete_methods.get(name) or ()
+        return methods
+
+    def _get_service(self, name, float_version=None):
+        if float_version is None:
+            float_version = float(self.major_version)
+        methods = self._service_methods(name, float_version)
+        if methods is None:
+            return None
+        return Service(self, name, methods, verbose=self._verbose)
+
+    def _set_version(self):
+        # Read the version of the server, unless it is known
+        ver = (self._options['version'] or
+               (self._capabilities or {}).get('server_version'))
+        db = None
+        if ver:
+            ver = str(ver)
+        else:
+            db = self._get_service('db', 99.0)
+            ver = db.server_version()
+        major_version = re.match(r'\d+\.?\d*', ver).group()
+        float_version = float(major_version)
+        if db is not None:
+            # Reuse the service, with the methods of this version
+            db._methods = self._service_methods('db', float_version)
+            self.db = db
+        if self._cache is not None and not self._capabilities:
+            self._cache.update(self._server, server_version=ver, services=dict(
+                (name, self._service_methods(name, float_version))
+                for name in _lazy_services.values()
+                if self._service_methods(name, float_version) is not None))
         self._searchargs = functools.partial(searchargs,
                                              api_v9=(float_version < 10.0))
+        self.server_version = ver
+        self.major_version = major_version
 
     def _proxy_dispatch(self, name):
         if self._server._api_v7:
             return self._server.netsvc.ExportService.getService(name).dispatch
         return functools.partial(self._server.http.dispatch_rpc, name)
 
-    def _proxy_xmlrpc(self, name):
-        proxy = ServerProxy(self._server + '/' + name,
+    def _proxy_xmlrpc(self, name, server=None):
+        proxy = ServerProxy((server or self._server) + '/' + name,
                             transport=self._transport, allow_none=True)
         return proxy._ServerProxy__request
 
-    def _proxy_jsonrpc(self, name):
-        return functools.partial(dispatch_jsonrpc, self._server, name)
+    def _proxy_jsonrpc(self, name, server=None):
+        server = server or self._server
+
+        def dispatch(method, args):
+            return dispatch_jsonrpc(server, name, method, args,
+                                    session=self._session,
+                                    compress=self._options['compress'],
+                                    codec=self._codec,
+                                    timeout=self._timeouts())
+        return dispatch
+
+    def _proxy_balanced(self, name):
+        # The batch and stream requests are not used with many servers
+        proxies = [self._proxy_server(name, server)
+                   for server in self.balancer.servers]
+        return functools.partial(self.balancer.dispatch, proxies)
+
+    def _proxy_record(self, name):
+        # The batch and stream requests are not recorded
+        return functools.partial(self.cassette.record, name,
+                                 self._proxy_wire(name))
+
+    def _proxy_replay(self, name):
+        return functools.partial(self.cassette.replay, name)
+
+    def _probe(self, idx):
+        # Check that the server is up, before sending the next calls
+        server = self.balancer.servers[idx]
+        self._proxy_server('db', server)('server_version', ())
+
+    def _proxy_batch(self, name):
+        if self._proxy == self._proxy_jsonrpc:
+            def dispatch_batch(calls):
+                return dispatch_jsonrpc_batch(
+                    self._server, name, calls, session=self._session,
+                    compress=self._options['compress'], codec=self._codec,
+                    timeout=self._timeouts())
+            return dispatch_batch
+        if self._proxy == self._proxy_xmlrpc:
+            return functools.partial(dispatch_multicall, self._proxy(name))
+
+    def _proxy_stream(self, name):
+        if (self._proxy == self._proxy_xmlrpc and
+                isinstance(self._transport, PooledTransport)):
+            return functools.partial(dispatch_stream, self._transport,
+                                     self._server + '/' + name)
 
     @classmethod
     def from_config(cls, environment, user=None, verbose=False):
@@ -558,9 +2784,16 @@ class Client(object):
         return client
 
     def reset(self):
+        """Logout and close the idle connections."""
         self.user = self._environment = None
         self._db, self._models = (), {}
         self._execute = self._exec_workflow = None
+        if self._session is not None:
+            self._session.close()
+        if self.pool is not None:
+            self.pool.close()
+        if self.cassette is not None:
+            self.cassette.close()
 
     def __repr__(self):
         return "<Client '%s#%s'>" % (self._server, self._db)
@@ -571,12 +2804,11 @@ class Client(object):
         If the `password` is not available, it will be asked.
         """
         if database:
-            try:
-                dbs = self.db.list()
-            except Fault:
-                pass    # AccessDenied: simply ignore this check
-            else:
-                if database not in dbs:
+            dbs = self._db_list()
+            if dbs is not False and database not in dbs:
+                if self._capabilities:
+                    dbs = self._db_list(cached=False)
+                if dbs is not False and database not in dbs:
                     raise Error("Database '%s' does not exist: %s" %
                                 (database, dbs))
             if not self._db:
@@ -599,21 +2831,53 @@ class Client(object):
         # Authenticated endpoints
         def authenticated(method):
             return functools.partial(method, self._db, uid, password)
+
+        def authenticated_lazy(service, name):
+            # The service is created on the first call
+            def method(*params):
+                return getattr(getattr(self, service), name)(
+                    database, uid, password, *params)
+            return method
         self._execute = authenticated(self._object.execute)
         self._exec_workflow = authenticated(self._object.exec_workflow)
+        float_version = float(self.major_version)
         if self.major_version != '5.0':
             # Only for Odoo and OpenERP >= 6
             self.execute_kw = authenticated(self._object.execute_kw)
-        if self._report:        # Odoo <= 10
-            self.report = authenticated(self._report.report)
-            self.report_get = authenticated(self._report.report_get)
+        if self._service_methods('report', float_version) is not None:
+            # Odoo <= 10
+            self.report = authenticated_lazy('_report', 'report')
+            self.report_get = authenticated_lazy('_report', 'report_get')
             if self.major_version != '5.0':
-                self.render_report = authenticated(self._report.render_report)
-        if self._wizard:        # OpenERP <= 6.1
-            self._wizard_execute = authenticated(self._wizard.execute)
-            self._wizard_create = authenticated(self._wizard.create)
+                self.render_report = authenticated_lazy('_report',
+                                                        'render_report')
+        if self._service_methods('wizard', float_version) is not None:
+            # OpenERP <= 6.1
+            self._wizard_execute = authenticated_lazy('_wizard', 'execute')
+            self._wizard_create = authenticated_lazy('_wizard', 'create')
         return uid
 
+    def _db_list(self, cached=True):
+        # Return the list of databases, or False if it is not allowed
+        capabilities = self._capabilities
+        if cached and capabilities and 'db_list' in capabilities:
+            return capabilities['db_list']
+        try:
+            dbs = self.db.list()
+        except Fault:
+            dbs = False     # AccessDenied: simply ignore this check
+        if self._cache is not None:
+            self._cache.update(self._server, db_list=dbs)
+            if capabilities:
+                capabilities['db_list'] = dbs
+        return dbs
+
+    def _revalidate(self):
+        # Discard the cached capabilities, after a failed call
+        if self._capabilities:
+            self._capabilities = None
+            self._cache.invalidate(self._server)
+
     # Needed for interactive use
     connect = None
     _login = login
@@ -654,8 +2918,7 @@ class Client(object):
         if uid:
             # Check if password changed
             if not self._check_valid(database, uid, password):
-                if cache_key in self._login.cache:
-                    del self._login.cache[cache_key]
+                self._login.cache.pop(cache_key, None)
                 uid = False
         elif uid is None:
             # Do a standard 'login'
@@ -781,6 +3044,29 @@ class Client(object):
         Method `params` are allowed.  If needed, keyword
         arguments are collected in `kwargs`.
         """
+        with self._span('execute', obj, method, params, kwargs):
+            return self._run(self._execute_steps(obj, method, params, kwargs))
+
+    def _span(self, name, model, method, params, kwargs=None):
+        # Trace the RPC calls of a Client method, if there are hooks
+        if not self.hooks:
+            return _no_span
+        return Span(self.hooks, name, None, model, method, params,
+                    dict(kwargs) if kwargs else None)
+
+    def _run(self, steps):
+        # Send the RPC calls yielded by the generator, until the result
+        value = next(steps)
+        while isinstance(value, _Call):
+            if value.method == 'execute':
+                value = steps.send(self._execute(*value.args))
+            else:
+                value = steps.send(self.execute_kw(*value.args))
+        return value
+
+    def _execute_steps(self, obj, method, params, kwargs):
+        # Generator: yield the RPC calls and receive their results,
+        # then yield the return value of Client.execute
         assert self.user, 'Not connected'
         assert isinstance(obj, basestring)
         assert isinstance(method, basestring) and method != 'browse'
@@ -795,15 +3081,17 @@ class Client(object):
                 # Combine search+read
                 search_params = self._searchargs(params[:1], kwargs, context)
                 ordered = len(search_params) > 3 and search_params[3]
-                ids = self._execute(obj, 'search', *search_params)
+                ids = yield _Call('execute', (obj, 'search') + search_params)
             else:
                 ordered = kwargs.pop('order', False) and params[0]
                 ids = set(params[0]) - {False}
                 if not ids and ordered:
-                    return [False] * len(ordered)
+                    yield [False] * len(ordered)
+                    return
                 ids = sorted(ids)
             if not ids:
-                return ids
+                yield ids
+                return
             if len(params) > 1:
                 params = (ids,) + params[1:]
             else:
@@ -823,7 +3111,7 @@ class Client(object):
         # Ignore extra keyword arguments
         for item in kwargs.items():
             print('Ignoring: %s = %r' % item)
-        res = self._execute(obj, method, *params)
+        res = yield _Call('execute', (obj, method) + params)
         if ordered:
             # The results are not in the same order as the ids
             # when received from the server
@@ -831,7 +3119,133 @@ class Client(object):
             if not isinstance(ordered, list):
                 ordered = ids
             res = [resdic.get(id_, False) for id_ in ordered]
-        return res[0] if single_id else res
+        yield res[0] if single_id else res
+
+    def execute_many(self, obj, method, params, workers=None):
+        """Call the same `method` for each item of `params`, concurrently.
+
+        Each item of the iterable `params` is a tuple of arguments for
+        :meth:`execute`, or a single argument.  The calls are sent with
+        at most `workers` threads (default ``pool_size``).  Return the list
+        of results in the same order, where the errors are exception
+        instances::
+
+            codes = ['E-COM11', 'E-COM12', 'FURN_0269']
+            results = client.execute_many('product.product', 'name_search',
+                                          codes)
+        """
+        assert self.user, 'Not connected'
+        items = [args if isinstance(args, tuple) else (args,)
+                 for args in params]
+        return _parallel_map(lambda args: self.execute(obj, method, *args),
+                             items, workers or self._options['pool_size'],
+                             local=self._local)
+
+    def _timeouts(self):
+        # Return the (connect, read) timeouts of the next request
+        (connect, read) = (getattr(self._local, 'timeout', None) or
+                           (self._options['connect_timeout'],
+                            self._options['timeout']))
+        if connect is None:
+            connect = read
+        deadline = getattr(self._local, 'deadline', None)
+        if deadline is None:
+            if connect is None and read is None:
+                return None
+            return (connect, read)
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise DeadlineExceeded('Deadline exceeded')
+        return (min(connect, remaining) if connect is not None else remaining,
+                min(read, remaining) if read is not None else remaining)
+
+    @contextlib.contextmanager
+    def timeout(self, timeout, connect_timeout=None):
+        """Override the timeouts of the calls in the ``with`` block.
+
+        The `timeout` is the read timeout and `connect_timeout` the
+        timeout to open a connection, in seconds (default: same as
+        `timeout`)::
+
+            with client.timeout(300):
+                client.execute('account.move', 'action_post', move_ids)
+        """
+        previous = getattr(self._local, 'timeout', None)
+        self._local.timeout = (connect_timeout, timeout)
+        try:
+            yield
+        finally:
+            self._local.timeout = previous
+
+    @contextlib.contextmanager
+    def deadline(self, seconds):
+        """Limit the duration of all the calls in the ``with`` block.
+
+        Every request sent inside the block, including the nested requests
+        of :meth:`execute` or :meth:`upgrade`, must complete before the
+        deadline.  Otherwise, a socket timeout or a :exc:`DeadlineExceeded`
+        error is raised.  The nested deadlines cannot extend the
+        enclosing one::
+
+            with client.deadline(30):
+                partners = client.read('res.partner', [('active', '=', 1)])
+        """
+        previous = getattr(self._local, 'deadline', None)
+        deadline = time.time() + seconds
+        if previous is not None:
+            deadline = min(deadline, previous)
+        self._local.deadline = deadline
+        try:
+            yield
+        finally:
+            self._local.deadline = previous
+
+    @contextlib.contextmanager
+    def profile(self, output=None):
+        """Return a context manager which profiles the calls in the block.
+
+        It yields a :class:`Profile`.  On exit, the report is written to
+        `output`, if it is set: a file, or a filename which ends with
+        ``.csv``, ``.json`` or else for a text report::
+
+            with client.profile('import.csv') as profile:
+                import_partners(client)
+            print(profile.report())
+        """
+        profile = Profile()
+        self.hooks.append(profile)
+        try:
+            yield profile
+        finally:
+            self.hooks.remove(profile)
+            if output is not None:
+                profile.save(output)
+
+    def stats(self):
+        """Return the statistics of the RPC calls, see :meth:`Metrics.stats`.
+
+        Export them with ``client.metrics.to_json()`` or
+        ``client.metrics.to_prometheus()``::
+
+            for item in client.stats()[:10]:
+                print('%(model)s.%(method)s: %(calls)d calls, %(time).3fs'
+                      % item)
+        """
+        return self.metrics.stats() if self.metrics is not None else []
+
+    def batch(self):
+        """Return a :class:`Batch` to group several calls in few requests.
+
+        Use it as a context manager.  The calls are sent when leaving
+        the ``with`` block, and their results are available then::
+
+            with client.batch() as batch:
+                partners = batch.read('res.partner', [1, 2], 'name')
+                count = batch.count('res.users')
+            print(partners.result(), count.result())
+        """
+        assert self.user, 'Not connected'
+        return Batch(self)
 
     def exec_workflow(self, obj, signal, obj_id):
         """Wrapper around ``object.exec_workflow`` RPC method.
@@ -869,6 +3283,10 @@ class Client(object):
         return self._wizard_execute(wiz_id, datas, action, context)
 
     def _upgrade(self, modules, button):
+        with self._span('upgrade', 'ir.module.module', button, modules):
+            return self._upgrade_modules(modules, button)
+
+    def _upgrade_modules(self, modules, button):
         # First, update the list of modules
         ir_module = self.model('ir.module.module', False)
         updated, added = ir_module.update_list()
@@ -978,35 +3396,81 @@ class Client(object):
         results returned.  Note: the low-level RPC method ``read`` itself does
         not preserve the order of the results.
         """
-        fmt = None
-        if len(params) > 1 and isinstance(params[1], basestring):
-            fmt = ('%(' in params[1]) and params[1]
-            if fmt:
-                fields = _fields_re.findall(fmt)
-            else:
-                # transform: "zip city" --> ("zip", "city")
-                fields = params[1].split()
-                if len(fields) == 1:
-                    fmt = ()    # marker
-            params = (params[0], fields) + params[2:]
-        res = self.execute(obj, 'read', *params, **kwargs)
-        if not res:
-            return res
-        if fmt:
-            if isinstance(res, list):
-                return [(d and fmt % d) for d in res]
-            return fmt % res
-        if fmt == ():
+        with self._span('read', obj, 'read', params, kwargs):
+            return self._run(self._read_steps(obj, params, kwargs))
+
+    def _read_steps(self, obj, params, kwargs):
+        (params, format_value) = _read_format(params)
+        steps = self._execute_steps(obj, 'read', params, kwargs)
+        res = next(steps)
+        while isinstance(res, _Call):
+            res = steps.send((yield res))
+        if res and format_value:
             if isinstance(res, list):
-                return [(d and d[fields[0]]) for d in res]
-            return res[fields[0]]
-        return res
+                res = [(d and format_value(d)) for d in res]
+            else:
+                res = format_value(res)
+        yield res
+
+    def iter_read(self, obj, *params, **kwargs):
+        """Iterate over the records, like :meth:`Client.read`.
+
+        The records are read by chunks of `chunk_size` ids (default 1000).
+        With XML-RPC, each response is parsed while it is received.  The
+        memory is bounded by the chunk size instead of the size of the
+        result.  The records of a chunk are returned once it is received,
+        hence the loop can send other calls with the same client.
+        """
+        assert self.user, 'Not connected'
+        assert params, 'Missing parameter'
+        chunk_size = kwargs.pop('chunk_size', 1000)
+        (params, format_value) = _read_format(params)
+        domain = params[0]
+        fields = params[1:2] or (kwargs.pop('fields', None),)
+        context = kwargs.pop('context', None)
+        if not (domain and isinstance(domain, list)):
+            ids = [domain] if domain else []
+            ordered = False
+        elif issearchdomain(domain):
+            ordered = bool(kwargs.get('order'))
+            ids = self.execute(obj, 'search', domain,
+                               context=context, **kwargs)
+        else:
+            ordered = bool(kwargs.pop('order', False))
+            ids = domain if ordered else sorted(set(domain) - {False})
+        args = fields + params[2:] + ((context,) if context else ())
+        for idx in range(0, len(ids), chunk_size):
+            chunk = ids[idx:idx + chunk_size]
+            if not ordered:
+                # Release the connection before the caller's loop
+                records = list(self._iter_execute(obj, 'read', chunk, *args))
+            else:
+                # The results are not in the same order as the ids
+                records = self._iter_execute(
+                    obj, 'read', sorted(set(chunk) - {False}), *args)
+                resdic = {val['id']: val for val in records}
+                records = [resdic.get(id_, False) for id_ in chunk]
+            for record in records:
+                yield (record and format_value(record)
+                       if format_value else record)
+
+    def _iter_execute(self, obj, method, *params):
+        # Iterate over the result, while the response is parsed
+        if not params[0]:
+            return iter(())
+        if self._object._dispatch_stream is None:
+            return iter(self._execute(obj, method, *params))
+        return self._object._call_stream(
+            'execute', self._execute.args + (obj, method) + params)
 
     def _models_get(self, name):
         try:
             return self._models[name]
         except KeyError:
-            self._models[name] = m = Model._new(self, name)
+            with self._lock:
+                m = self._models.get(name)
+                if m is None:
+                    self._models[name] = m = Model._new(self, name)
         return m
 
     def models(self, name=''):
@@ -1093,6 +3557,12 @@ class Client(object):
             return False
 
     def __getattr__(self, method):
+        if method in _lazy_services:
+            with self._lock:
+                if method not in self.__dict__:
+                    service = self._get_service(_lazy_services[method])
+                    setattr(self, method, service)
+            return self.__dict__[method]
         if not method.islower():
             return _memoize(self, method, self.model(lowercase(method)))
         if method.startswith('_'):
@@ -1112,6 +3582,175 @@ class Client(object):
         self.reset()
 
 
+# The services of the Client, created on first access
+_lazy_services = {'db': 'db', 'common': 'common', '_object': 'object',
+                  '_report': 'report', '_wizard': 'wizard'}
+_removed_services = {'report': 11.0, 'wizard': 7.0}
+
+
+def _read_format(params):
+    # Return the parameters of the read() method, and a function
+    # to format the records, if the fields are a string
+    if not (len(params) > 1 and isinstance(params[1], basestring)):
+        return (params, None)
+    if '%(' in params[1]:
+        fmt = params[1]
+        (fields, format_value) = (_fields_re.findall(fmt), fmt.__mod__)
+    else:
+        # transform: "zip city" --> ("zip", "city")
+        fields = params[1].split()
+        format_value = (len(fields) == 1) and (lambda d: d[fields[0]])
+    return ((params[0], fields) + params[2:], format_value)
+
+
+class _Call(object):
+    # A call of the 'object' service, yielded by Client._execute_steps
+    __slots__ = ('method', 'args')
+
+    def __init__(self, method, args):
+        (self.method, self.args) = (method, args)
+
+
+class Future(object):
+    """The pending result of a call in a :class:`Batch`."""
+    _done = False
+    _result = _exception = None
+
+    def __repr__(self):
+        state = 'error' if self._exception else 'done' if self._done else ''
+        return '<Future %s>' % (state or 'pending')
+
+    def done(self):
+        """Return True if the result is available."""
+        return self._done
+
+    def result(self):
+        """Return the result of the call, or raise its exception."""
+        if not self._done:
+            raise Error('The batch is not sent yet')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        """Return the exception raised by the call, or None."""
+        if not self._done:
+            raise Error('The batch is not sent yet')
+        return self._exception
+
+    def _set_result(self, result):
+        (self._result, self._done) = (result, True)
+
+    def _set_exception(self, exception):
+        (self._exception, self._done) = (exception, True)
+
+
+class Batch(object):
+    """A group of calls which are sent together.
+
+    The methods have the same signature as the :class:`Client` methods,
+    and they return a :class:`Future`.  The calls are sent by
+    :meth:`flush`, when leaving the ``with`` block.  With JSON-RPC, they
+    are sent as a single batch request.  When a call depends on the result
+    of another call (e.g. ``read`` with a search domain), it is sent in the
+    next round trip.
+
+    With XML-RPC, the calls are sent with the ``system.multicall`` method
+    if the server exposes it.  If the server supports neither of them, the
+    calls are sent concurrently, with at most ``pool_size`` connections.
+    The results keep the order of the calls, and an error is raised by the
+    :class:`Future` of the failed call only.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.flush()
+
+    def _add(self, steps):
+        future = Future()
+        self._advance(future, steps, next(steps))
+        return future
+
+    def _advance(self, future, steps, value):
+        if isinstance(value, _Call):
+            self._pending.append((future, steps, value))
+        else:
+            future._set_result(value)
+
+    def execute(self, obj, method, *params, **kwargs):
+        """Wrapper for :meth:`Client.execute`."""
+        return self._add(self.client._execute_steps(obj, method,
+                                                    params, kwargs))
+
+    def execute_kw(self, obj, method, params, kwargs=None):
+        """Wrapper for the ``object.execute_kw`` RPC method."""
+        args = (obj, method, params)
+        if kwargs is not None:
+            args += (kwargs,)
+
+        def steps():
+            res = yield _Call('execute_kw', args)
+            yield res
+        return self._add(steps())
+
+    def read(self, obj, *params, **kwargs):
+        """Wrapper for :meth:`Client.read`."""
+        return self._add(self.client._read_steps(obj, params, kwargs))
+
+    def search(self, obj, *params, **kwargs):
+        """Wrapper for :meth:`Client.search`."""
+        return self.execute(obj, 'search', *params, **kwargs)
+
+    def count(self, obj, domain=None):
+        """Wrapper for :meth:`Client.count`."""
+        return self.execute(obj, 'search_count', domain or [])
+
+    def flush(self):
+        """Send the pending calls and set the results of the futures."""
+        auth = self.client._execute.args
+        while self._pending:
+            (pending, self._pending) = (self._pending, [])
+            calls = [(call.method, auth + call.args)
+                     for (future, steps, call) in pending]
+            results = self.client._object._dispatch_many(
+                calls, workers=self.client._options['pool_size'])
+            for ((future, steps, call), result) in zip(pending, results):
+                try:
+                    if isinstance(result, Exception):
+                        value = steps.throw(result)
+                    else:
+                        value = steps.send(result)
+                except Exception as exc:
+                    future._set_exception(exc)
+                else:
+                    self._advance(future, steps, value)
+
+
+def _unbrowse_values(fields, values):
+    # Unwrap the id of the records, according to the type of the fields
+    new_values = values.copy()
+    for (key, value) in values.items():
+        field_type = fields[key]['type']
+        if hasattr(value, 'id'):
+            if field_type == 'reference':
+                new_values[key] = '%s,%s' % (value._model_name, value.id)
+            else:
+                new_values[key] = value = value.id
+        if field_type in ('one2many', 'many2many'):
+            if not value:
+                new_values[key] = [(6, 0, [])]
+            elif isinstance(value[0], int_types):
+                new_values[key] = [(6, 0, value)]
+    return new_values
+
+
 class Model(object):
     """The class for Odoo models."""
 
@@ -1126,6 +3765,7 @@ class Model(object):
     def _new(cls, client, name):
         m = object.__new__(cls)
         (m.client, m._name) = (client, name)
+        m._lock = threading.Lock()
         m._execute = functools.partial(client.execute, name)
         m.search = functools.partial(client.search, name)
         m.count = functools.partial(client.count, name)
@@ -1266,20 +3906,9 @@ class Model(object):
 
     def _unbrowse_values(self, values):
         """Unwrap the id of Record and RecordList."""
-        new_values = values.copy()
-        for (key, value) in values.items():
-            field_type = self._fields[key]['type']
-            if hasattr(value, 'id'):
-                if field_type == 'reference':
-                    new_values[key] = '%s,%s' % (value._model_name, value.id)
-                else:
-                    new_values[key] = value = value.id
-            if field_type in ('one2many', 'many2many'):
-                if not value:
-                    new_values[key] = [(6, 0, [])]
-                elif isinstance(value[0], int_types):
-                    new_values[key] = [(6, 0, value)]
-        return new_values
+        if not values:
+            return values.copy()
+        return _unbrowse_values(self._fields, values)
 
     def _get_external_ids(self, ids=None):
         """Retrieve the External IDs of the records.
@@ -1298,7 +3927,11 @@ class Model(object):
 
     def __getattr__(self, attr):
         if attr in ('_keys', '_fields'):
-            return _memoize(self, attr, getattr(self, '_get' + attr)())
+            with self._lock:
+                # Another thread may have read them in the meantime
+                if attr in self.__dict__:
+                    return self.__dict__[attr]
+                return _memoize(self, attr, getattr(self, '_get' + attr)())
         if attr.startswith('_imd_'):
             imd = self.client.model('ir.model.data')
             return _memoize(self, attr, getattr(imd, attr[5:]))
@@ -1629,6 +4262,9 @@ class Record(object):
     def __getattr__(self, attr):
         context = self._context
         if attr in self._model._keys:
+            detector = self._model.client.n1_detector
+            if detector is not None:
+                detector.record(self._model_name, attr)
             return self.read(attr, context=context)
         if attr == '_name':
             return self._get_name()
@@ -1660,6 +4296,566 @@ class Record(object):
                 self.id == other.id and self._model is other._model)
 
 
+def _async_run(steps):
+    """Run the generator `steps` in the event loop, and return a future.
+
+    The generator yields awaitables and receives their results.  The first
+    value which is not awaitable is the result of the future.
+    """
+    future = asyncio.get_event_loop().create_future()
+    awaiting = []
+
+    def step(value=None, exc=None):
+        try:
+            if exc is None:
+                value = steps.send(value)
+            else:
+                value = steps.throw(exc)
+        except Exception as error:
+            future.set_exception(error)
+            return
+        if asyncio.isfuture(value) or asyncio.iscoroutine(value):
+            awaiting[:] = [asyncio.ensure_future(value)]
+            awaiting[0].add_done_callback(wakeup)
+        else:
+            steps.close()
+            future.set_result(value)
+
+    def cancel(future):
+        # Cancel the awaited step too, hence the generator is closed
+        if future.cancelled() and awaiting:
+            awaiting[0].cancel()
+
+    def wakeup(awaited):
+        if future.cancelled() or awaited.cancelled():
+            steps.close()
+            future.cancel()
+        elif awaited.exception() is not None:
+            step(exc=awaited.exception())
+        else:
+            step(awaited.result())
+    future.add_done_callback(cancel)
+    step()
+    return future
+
+
+def _async_result(value):
+    # Return a future which is already done
+    future = asyncio.get_event_loop().create_future()
+    future.set_result(value)
+    return future
+
+
+class _AsyncHTTPProtocol(asyncio.Protocol if asyncio else object):
+    # Client side of an HTTP/1.1 connection, one request at a time
+    transport = _future = None
+    keep_alive = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def request(self, data):
+        self._future = asyncio.get_event_loop().create_future()
+        (self._buffer, self._head) = (bytearray(), None)
+        self.keep_alive = False
+        self.transport.write(data)
+        return self._future
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def data_received(self, data):
+        if self._future is None:
+            return
+        self._buffer += data
+        try:
+            body = self._parse()
+        except Exception as exc:
+            self._finish(exc=exc)
+            self.close()
+        else:
+            if body is not None:
+                self._finish(body)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if self._future is None:
+            return
+        if self._head is not None and self._head[-1] is None:
+            # The body ends when the connection is closed
+            self._finish(bytes(self._buffer))
+        else:
+            self._finish(exc=exc or socket.error('Connection closed'))
+
+    def _parse(self):
+        if self._head is None:
+            end = self._buffer.find(b'\r\n\r\n')
+            if end < 0:
+                return None
+            lines = bytes(self._buffer[:end]).decode('latin-1').split('\r\n')
+            del self._buffer[:end + 4]
+            (version, status, reason) = (lines[0].split(None, 2) + [''])[:3]
+            headers = {}
+            for line in lines[1:]:
+                (key, value) = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+            if headers.get('transfer-encoding', '').lower() == 'chunked':
+                length = 'chunked'
+            elif 'content-length' in headers:
+                length = int(headers['content-length'])
+            else:
+                length = None
+            self.keep_alive = (version == 'HTTP/1.1' and length is not None and
+                               headers.get('connection') != 'close')
+            self._head = (int(status), reason, headers, length)
+        length = self._head[-1]
+        if length == 'chunked':
+            return self._dechunk()
+        if length is not None and len(self._buffer) >= length:
+            return bytes(self._buffer[:length])
+        return None
+
+    def _dechunk(self):
+        (body, pos) = (bytearray(), 0)
+        while True:
+            eol = self._buffer.find(b'\r\n', pos)
+            if eol < 0:
+                return None
+            size = int(bytes(self._buffer[pos:eol]).split(b';')[0], 16)
+            if not size:
+                # Skip the trailers
+                if self._buffer.find(b'\r\n\r\n', eol) < 0:
+                    return None
+                return bytes(body)
+            pos = eol + 2 + size + 2
+            if len(self._buffer) < pos:
+                return None
+            body += self._buffer[eol + 2:pos - 2]
+
+    def _finish(self, body=None, exc=None):
+        (future, self._future) = (self._future, None)
+        if future.cancelled():
+            self.keep_alive = False
+        elif exc is not None:
+            self.keep_alive = False
+            future.set_exception(exc)
+        else:
+            (status, reason, headers, length) = self._head
+            if headers.get('content-encoding') == 'gzip':
+                body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+            future.set_result((status, reason, headers, body))
+
+
+class AsyncHTTPSession(object):
+    """A minimal HTTP client for :mod:`asyncio`, with persistent connections.
+
+    At most `maxsize` connections are open for each host: additional
+    requests wait for a free connection.  The connections which stay idle
+    more than `idle_timeout` seconds are closed.  If `accept_gzip` is True,
+    the server may compress the responses.  The counters ``created`` and
+    ``reused`` report the activity of the session.
+    """
+
+    def __init__(self, maxsize=10, idle_timeout=60.0, accept_gzip=False):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.accept_gzip = accept_gzip
+        self.created = self.reused = 0
+        self._idle = {}     # {(scheme, host): [(last_used, protocol)]}
+        self._active = {}   # {(scheme, host): count}
+        self._waiters = {}  # {(scheme, host): [future]}
+
+    def post(self, url, data, headers=None):
+        """Send a POST request and return a future for the response."""
+        return _async_run(self._post(url, data, dict(headers or {})))
+
+    def _post(self, url, data, headers):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        headers.update({'Host': parts.netloc, 'Content-Length': len(data)})
+        if self.accept_gzip:
+            headers['Accept-Encoding'] = 'gzip'
+        request = ['POST %s HTTP/1.1' % (parts.path or '/')]
+        request += ['%s: %s' % item for item in sorted(headers.items())]
+        request = ('\r\n'.join(request) + '\r\n\r\n').encode('latin-1')
+        while self._active.get(key, 0) >= self.maxsize:
+            waiter = asyncio.get_event_loop().create_future()
+            self._waiters.setdefault(key, []).append(waiter)
+            yield waiter
+        self._active[key] = self._active.get(key, 0) + 1
+        protocol = resp = None
+        try:
+            for attempt in (0, 1):
+                protocol = self._reuse(key)
+                retry = protocol is not None and not attempt
+                if protocol is None:
+                    self.created += 1
+                    https = (parts.scheme == 'https')
+                    (transport, protocol) = yield (
+                        asyncio.get_event_loop().create_connection(
+                            _AsyncHTTPProtocol, parts.hostname,
+                            parts.port or (443 if https else 80), ssl=https))
+                try:
+                    resp = yield protocol.request(request + data)
+                except socket.error:
+                    protocol.close()
+                    # Retry once, if the server closed the connection
+                    if not retry:
+                        raise
+                    continue
+                break
+        finally:
+            # Reuse the connection only after a complete response
+            if resp is not None and protocol.keep_alive:
+                idle = self._idle.setdefault(key, [])
+                idle.append((time.time(), protocol))
+            elif protocol is not None:
+                protocol.close()
+            self._active[key] -= 1
+            for waiter in self._waiters.pop(key, ()):
+                if not waiter.done():
+                    waiter.set_result(None)
+        (status, reason, resp_headers, content) = resp
+        if status >= 400:
+            raise HTTPError(url, status, reason, resp_headers, None)
+        yield _HTTPResponse(status, content)
+
+    def _reuse(self, key):
+        idle = self._idle.get(key) or []
+        while idle and idle[-1][1].transport is None:
+            idle.pop()
+        if idle and idle[-1][0] + self.idle_timeout > time.time():
+            self.reused += 1
+            return idle.pop()[1]
+        # The most recent connection is expired, discard them all
+        for (last_used, protocol) in idle:
+            protocol.close()
+        del idle[:]
+        return None
+
+    def close(self):
+        """Close the idle connections."""
+        for idle in self._idle.values():
+            for (last_used, protocol) in idle:
+                protocol.close()
+        self._idle.clear()
+
+
+class AsyncClient(object):
+    """Connection to an Odoo instance, for :mod:`asyncio`.
+
+    This is the asynchronous counterpart of the :class:`Client`.  The
+    methods which send RPC calls return an :class:`asyncio.Future`,
+    to be awaited in a coroutine::
+
+        client = AsyncClient('http://localhost:8069/jsonrpc')
+        await client.login('admin', 'admin', 'odoo')
+        partners = await client.read('res.partner', [('active', '=', True)])
+
+    Both XML-RPC and JSON-RPC are supported, with the same `options` as the
+    :class:`Client`.  The requests are sent by an :class:`AsyncHTTPSession`
+    with at most ``pool_size`` connections, hence many calls can run
+    concurrently in the same event loop.
+    """
+    user = _db = server_version = major_version = None
+    context = None
+
+    def __init__(self, server, **options):
+        assert asyncio, 'Not supported'
+        (server, self._options) = _client_options(server, options)
+        server = server.rstrip('/')
+        if '/jsonrpc' in server:
+            self._dispatch_steps = self._jsonrpc_steps
+        elif '/xmlrpc' not in server:
+            server += '/xmlrpc'
+        self._server = server
+        self._codec = json_codec(self._options['codec'])
+        self.session = AsyncHTTPSession(
+            self._options['pool_size'], self._options['idle_timeout'],
+            accept_gzip=self._options['compress'] is not None)
+        self._models = {}
+
+    def __repr__(self):
+        return "<AsyncClient '%s#%s'>" % (self._server, self._db)
+
+    def close(self):
+        """Close the idle connections."""
+        self.session.close()
+
+    def _post(self, url, data, content_type):
+        headers = {'Content-Type': content_type}
+        compress = self._options['compress']
+        if compress is not None and len(data) > compress:
+            data = gzip_encode(data)
+            headers['Content-Encoding'] = 'gzip'
+        return self.session.post(url, data, headers)
+
+    def _dispatch(self, service_name, method, args):
+        return _async_run(self._dispatch_steps(service_name, method, args))
+
+    def _dispatch_steps(self, service_name, method, args):
+        request = xmlrpc_dumps(args, method, allow_none=True)
+        resp = yield self._post(self._server + '/' + service_name,
+                                request.encode('utf-8', 'xmlcharrefreplace'),
+                                'text/xml')
+        yield xmlrpc_loads(resp.content)[0][0]
+
+    def _jsonrpc_steps(self, service_name, method, args):
+        (dumps, loads) = self._codec
+        data = _jsonrpc_call(service_name, method, args, _jsonrpc_id())
+        resp = yield self._post(self._server, dumps(data), 'application/json')
+        resp = loads(resp.content)
+        if resp.get('error'):
+            raise ServerError(resp['error'])
+        yield resp['result']
+
+    def login(self, user, password, database):
+        """Switch `user` and `database`.
+
+        Return a future for the ``uid`` of the user.
+        """
+        return _async_run(self._login_steps(user, password, database))
+
+    def _login_steps(self, user, password, database):
+        if self.server_version is None:
+            ver = yield self._dispatch('db', 'server_version', ())
+            self.major_version = re.match(r'\d+\.?\d*', ver).group()
+            self.server_version = ver
+            self._searchargs = functools.partial(
+                searchargs, api_v9=(float(self.major_version) < 10.0))
+        uid = yield self._dispatch('common', 'login',
+                                   (database, user, password))
+        if not uid:
+            raise Error('Invalid username or password')
+        (self._db, self.user) = (database, user)
+        self._auth = (database, uid, password)
+        self._models.clear()
+        yield uid
+
+    def _run(self, steps):
+        return _async_run(self._run_steps(steps))
+
+    def _run_steps(self, steps):
+        # Send the RPC calls yielded by the generator, until the result
+        value = next(steps)
+        while isinstance(value, _Call):
+            result = yield self._dispatch('object', value.method,
+                                          self._auth + value.args)
+            value = steps.send(result)
+        yield value
+
+    # Share the implementation of the Client methods
+    _execute_steps = Client.__dict__['_execute_steps']
+    _read_steps = Client.__dict__['_read_steps']
+
+    def execute(self, obj, method, *params, **kwargs):
+        """Wrapper for :meth:`Client.execute`."""
+        return self._run(self._execute_steps(obj, method, params, kwargs))
+
+    def execute_kw(self, obj, method, params, kwargs=None):
+        """Wrapper for the ``object.execute_kw`` RPC method."""
+        assert self.user, 'Not connected'
+        args = self._auth + (obj, method, params)
+        if kwargs is not None:
+            args += (kwargs,)
+        return self._dispatch('object', 'execute_kw', args)
+
+    def read(self, obj, *params, **kwargs):
+        """Wrapper for :meth:`Client.read`."""
+        return self._run(self._read_steps(obj, params, kwargs))
+
+    def search(self, obj, *params, **kwargs):
+        """Wrapper for :meth:`Client.search`."""
+        return self.execute(obj, 'search', *params, **kwargs)
+
+    def count(self, obj, domain=None):
+        """Wrapper for :meth:`Client.count`."""
+        return self.execute(obj, 'search_count', domain or [])
+
+    def model(self, name):
+        """Return an :class:`AsyncModel` instance.
+
+        The argument `name` is the name of the model.  Contrary to
+        :meth:`Client.model`, no validity check is done.
+        """
+        if name not in self._models:
+            self._models[name] = AsyncModel(self, name)
+        return self._models[name]
+
+
+class AsyncModel(object):
+    """The asynchronous counterpart of the :class:`Model`.
+
+    The methods return an :class:`asyncio.Future`.  The records are
+    :class:`AsyncRecord` and :class:`AsyncRecordList` objects: their
+    values are not cached, and the relational fields are not wrapped.
+    """
+
+    def __init__(self, client, name):
+        (self.client, self._name) = (client, name)
+        self._fields = None
+
+    def __repr__(self):
+        return "<AsyncModel '%s'>" % (self._name,)
+
+    def _unbrowse_steps(self, values):
+        # Unwrap the records, like Model._unbrowse_values.  The fields are
+        # read once, if a value depends on the type of its field.
+        if self._fields is None and any(
+                isinstance(value, (AsyncRecordList, list, tuple))
+                for value in values.values()):
+            self._fields = yield self._execute('fields_get')
+        yield (_unbrowse_values(self._fields, values)
+               if self._fields is not None else values)
+
+    def _execute(self, method, *params, **kwargs):
+        return self.client.execute(self._name, method, *params, **kwargs)
+
+    def search(self, *params, **kwargs):
+        """Wrapper for :meth:`Client.search`."""
+        return self.client.search(self._name, *params, **kwargs)
+
+    def read(self, *params, **kwargs):
+        """Wrapper for :meth:`Client.read`."""
+        return self.client.read(self._name, *params, **kwargs)
+
+    def browse(self, domain, *params, **kwargs):
+        """Wrapper for :meth:`Model.browse`.
+
+        Return a future for an :class:`AsyncRecord` or
+        an :class:`AsyncRecordList`.
+        """
+        return _async_run(self._browse_steps(domain, params, kwargs))
+
+    def _browse_steps(self, domain, params, kwargs):
+        context = kwargs.pop('context', self.client.context)
+        if isinstance(domain, int_types):
+            assert not params and not kwargs
+            yield AsyncRecord(self, domain, context=context)
+            return
+        safe = (domain or params or set(kwargs) & {'limit', 'offset', 'order'})
+        if safe and issearchdomain(domain):
+            kwargs['context'] = context
+            domain = yield self._execute('search', domain, *params, **kwargs)
+        else:
+            assert not params and not kwargs
+        yield AsyncRecordList(self, domain, context=context)
+
+    def get(self, domain, context=_DEFAULT):
+        """Wrapper for :meth:`Model.get`.
+
+        Return a future for an :class:`AsyncRecord` or None.
+        """
+        return _async_run(self._get_steps(domain, context))
+
+    def _get_steps(self, domain, context):
+        if context is _DEFAULT:
+            context = self.client.context
+        if isinstance(domain, int_types):   # a single id
+            ids = [domain]
+        elif isinstance(domain, basestring):  # lookup the xml_id
+            (module, name) = domain.split('.')
+            data = yield self.client.read(
+                'ir.model.data',
+                [('module', '=', module), ('name', '=', name)], 'model res_id')
+            assert not data or data[0]['model'] == self._name
+            ids = [res['res_id'] for res in data]
+        else:                               # a search domain
+            assert issearchdomain(domain)
+            ids = yield self._execute('search', domain, context=context)
+        if len(ids) > 1:
+            raise ValueError('domain matches too many records (%d)' % len(ids))
+        yield AsyncRecord(self, ids[0], context=context) if ids else None
+
+    def create(self, values, context=_DEFAULT):
+        """Wrapper for :meth:`Model.create`.
+
+        Return a future for the new :class:`AsyncRecord`.
+        """
+        return _async_run(self._create_steps(values, context))
+
+    def _create_steps(self, values, context):
+        if context is _DEFAULT:
+            context = self.client.context
+        values = yield _async_run(self._unbrowse_steps(values))
+        new_id = yield self._execute('create', values, context=context)
+        yield AsyncRecord(self, new_id, context=context)
+
+
+class AsyncRecordList(object):
+    """The asynchronous counterpart of the :class:`RecordList`."""
+
+    def __init__(self, res_model, ids, context=_DEFAULT):
+        if context is _DEFAULT:
+            context = res_model.client.context
+        (self._model, self.id, self._context) = (res_model, ids, context)
+        self._model_name = res_model._name
+
+    def __repr__(self):
+        return "<%s '%s,%s'>" % (self.__class__.__name__,
+                                 self._model_name, self.id)
+
+    def __len__(self):
+        return len(self.id)
+
+    def _ids(self):
+        return self.id
+
+    def read(self, fields=None, context=_DEFAULT):
+        """Wrapper for :meth:`RecordList.read`.
+
+        Return a future for the values.
+        """
+        if context is _DEFAULT:
+            context = self._context
+        if not self.id:
+            return _async_result([])
+        return self._model.read(self.id, fields, order=True, context=context)
+
+    def write(self, values, context=_DEFAULT):
+        """Wrapper for :meth:`RecordList.write`."""
+        if not self._ids():
+            return _async_result(True)
+        if context is _DEFAULT:
+            context = self._context
+        return _async_run(self._write_steps(values, context))
+
+    def _write_steps(self, values, context):
+        values = yield _async_run(self._model._unbrowse_steps(values))
+        res = yield self._model._execute('write', self._ids(), values,
+                                         context=context)
+        yield res
+
+    def unlink(self, context=_DEFAULT):
+        """Wrapper for :meth:`RecordList.unlink`."""
+        if not self._ids():
+            return _async_result(True)
+        if context is _DEFAULT:
+            context = self._context
+        return self._model._execute('unlink', self._ids(), context=context)
+
+
+class AsyncRecord(AsyncRecordList):
+    """The asynchronous counterpart of the :class:`Record`."""
+
+    def __len__(self):
+        return 1
+
+    def _ids(self):
+        return [self.id]
+
+    def read(self, fields=None, context=_DEFAULT):
+        """Wrapper for :meth:`Record.read`.
+
+        Return a future for the values.
+        """
+        if context is _DEFAULT:
+            context = self._context
+        return self._model.read(self.id, fields, context=context)
+
+
 def _interact(global_vars, use_pprint=True, usage=USAGE):
     import code
     import pprint
@@ -1719,7 +4915,69 @@ def _interact(global_vars, use_pprint=True, usage=USAGE):
     Console().interact('\033[A')
 
 
+def bench(argv=None):
+    """Run the ``erppeek bench`` command."""
+    description = ('Load the server with a workload, with concurrent '
+                   'workers, and report the throughput, the latency '
+                   'percentiles and the error rates.  The workload is a '
+                   'JSON file with the list of the operations.')
+    parser = optparse.OptionParser(
+        usage='%prog bench [options] workload.json',
+        version=__version__,
+        description=description)
+    parser.add_option(
+        '--env',
+        help='read connection settings from the given section')
+    parser.add_option(
+        '-c', '--config', default=None,
+        help='specify alternate config file (default: %r)' % CONF_FILE)
+    parser.add_option('-u', '--user', default=None, help='username')
+    parser.add_option(
+        '-w', '--workers', type='int', default=4,
+        help='number of concurrent workers (default: 4)')
+    parser.add_option(
+        '-t', '--duration', type='float', default=None,
+        help='duration in seconds (default: 10, unless --requests is set)')
+    parser.add_option(
+        '-n', '--requests', type='int', default=None,
+        help='total number of operations')
+    parser.add_option(
+        '--seed', type='int', default=None,
+        help='seed of the random sequence of operations')
+    parser.add_option(
+        '-o', '--output', metavar='FILE',
+        help='write the results to FILE (.json or text)')
+    parser.add_option(
+        '-v', '--verbose', default=0, action='count',
+        help='verbose')
+
+    (args, workload) = parser.parse_args(argv)
+    if len(workload) != 1:
+        parser.error('expected a single workload file')
+    if not args.env:
+        parser.error('the --env option is required')
+    if args.duration is None and args.requests is None:
+        args.duration = 10.0
+    workload = Workload.from_file(workload[0])
+
+    Client._config_file = os.path.join(os.curdir, args.config or CONF_FILE)
+    client = Client.from_config(args.env,
+                                user=args.user, verbose=args.verbose)
+    if args.workers > client._options['pool_size']:
+        print('The pool_size %s limits the concurrent requests' %
+              client._options['pool_size'])
+    with client:
+        workload.run(client, workers=args.workers, duration=args.duration,
+                     requests=args.requests, seed=args.seed)
+    sys.stdout.write(workload.report())
+    if args.output:
+        workload.save(args.output)
+    return workload
+
+
 def main(interact=_interact):
+    if sys.argv[1:2] == ['bench']:
+        return bench(sys.argv[2:])
     description = ('Inspect data on Odoo objects.  Use interactively '
                    'or query a model (-m) and pass search terms or '
                    'ids as positional parameters after the options.')
@@ -1756,6 +5014,9 @@ def main(interact=_interact):
     parser.add_option(
         '-v', '--verbose', default=0, action='count',
         help='verbose')
+    parser.add_option(
+        '--profile', metavar='FILE',
+        help='write the profile of the calls to FILE (.csv, .json or text)')
 
     (args, domain) = parser.parse_args()
 
@@ -1779,23 +5040,26 @@ def main(interact=_interact):
         client = Client(args.server, args.db, args.user, args.password,
                         verbose=args.verbose)
     client.context = {'lang': (os.getenv('LANG') or 'en_US').split('.')[0]}
-
-    if args.model and client.user:
-        data = client.execute(args.model, 'read', domain, args.fields)
-        if not args.fields:
-            args.fields = ['id']
-            if data:
-                args.fields.extend([fld for fld in data[0] if fld != 'id'])
-        writer = _DictWriter(sys.stdout, args.fields, "", "ignore",
-                             quoting=csv.QUOTE_NONNUMERIC)
-        writer.writeheader()
-        writer.writerows(data or ())
-
-    if client.connect is not None:
-        if not client.user:
-            client.connect()
-        # Enter interactive mode
-        return interact(global_vars) if interact else global_vars
+    profile = client.profile(args.profile) if args.profile else _no_span
+
+    with profile:
+        if args.model and client.user:
+            data = client.execute(args.model, 'read', domain, args.fields)
+            if not args.fields:
+                args.fields = ['id']
+                if data:
+                    args.fields.extend([fld for fld in data[0]
+                                        if fld != 'id'])
+            writer = _DictWriter(sys.stdout, args.fields, "", "ignore",
+                                 quoting=csv.QUOTE_NONNUMERIC)
+            writer.writeheader()
+            writer.writerows(data or ())
+
+        if client.connect is not None:
+            if not client.user:
+                client.connect()
+            # Enter interactive mode
+            return interact(global_vars) if interact else global_vars
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A fake Odoo server, for the tests and the benchmarks.
+
+It speaks XML-RPC on ``/xmlrpc/<service>`` and JSON-RPC on ``/jsonrpc``,
+and serves synthetic tables from memory.  Only a few methods are
+implemented: ``server_version``, ``list``, ``login``, ``execute`` and
+``execute_kw`` with ``search``, ``search_count``, ``read``,
+``search_read``, ``name_get``, ``write``, ``create``, ``unlink``,
+``fields_get`` and ``fields_get_keys``.
+
+Usage: python tests/fake_server.py [--port N] [--records N] [--latency S]
+"""
+from __future__ import print_function
+
+import json
+import re
+import sys
+import threading
+import time
+import traceback
+import zlib
+
+try:   # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from xmlrpc.client import (Fault, dumps as xmlrpc_dumps,
+                               loads as xmlrpc_loads)
+    basestring = str
+except ImportError:   # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from xmlrpclib import (Fault, dumps as xmlrpc_dumps,
+                           loads as xmlrpc_loads)
+
+__all__ = ['FakeServer', 'Table']
+
+COUNTRIES = ['Belgium', 'France', 'Germany', 'Italy', 'Spain']
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class Table(object):
+    """An in-memory table of records.
+
+    The `fields` map the field names to their description, as returned by
+    ``fields_get``.  The `rows` are dictionaries, without the ``id``.
+    """
+
+    def __init__(self, model, fields, rows=()):
+        self.model = model
+        self.fields = dict(fields, id={'type': 'integer', 'string': 'ID'})
+        self.records = {}
+        self.next_id = 1
+        for row in rows:
+            self.create(row)
+
+    def create(self, values):
+        new_id = self.next_id
+        self.next_id += 1
+        self.records[new_id] = dict(values, id=new_id)
+        return new_id
+
+    def search(self, domain, offset=0, limit=None, order=None):
+        ids = [id_ for (id_, rec) in sorted(self.records.items())
+               if _match(domain, rec)]
+        for term in reversed((order or '').split(',')):
+            if term.strip():
+                (field, desc) = (term.split() + ['asc'])[:2]
+                ids.sort(key=lambda id_: _sort_key(self.records[id_][field]),
+                         reverse=(desc.lower() == 'desc'))
+        return ids[offset:offset + limit if limit else None]
+
+    def read(self, ids, fields=None):
+        missing = set(ids) - set(self.records)
+        if missing:
+            raise ValueError('Record does not exist or has been deleted: '
+                             '%s(%s)' % (self.model, sorted(missing)))
+        fields = fields or sorted(self.fields)
+        return [dict([(field, self.records[id_].get(field, False))
+                      for field in fields], id=id_) for id_ in ids]
+
+    def write(self, ids, values):
+        for id_ in ids:
+            self.records[id_].update(values)
+        return True
+
+    def unlink(self, ids):
+        for id_ in ids:
+            self.records.pop(id_, None)
+        return True
+
+
+def _sort_key(value):
+    if isinstance(value, list):     # many2one
+        value = value[1]
+    return (value is False, value)
+
+
+def _match(domain, record):
+    # Evaluate the domain, in Polish notation
+    stack = []
+    for term in reversed(domain or []):
+        if term == '!':
+            stack.append(not stack.pop())
+        elif term in ('&', '|'):
+            (left, right) = (stack.pop(), stack.pop())
+            stack.append(left and right if term == '&' else left or right)
+        else:
+            stack.append(_match_term(term, record))
+    return all(stack)
+
+
+def _match_term(term, record):
+    (field, operator, value) = term
+    actual = record.get(field, False)
+    if isinstance(actual, list) and not isinstance(value, basestring):
+        actual = actual[0]      # many2one
+    elif isinstance(actual, list):
+        actual = actual[1]
+    if operator in ('=', '=='):
+        return actual == value
+    if operator in ('!=', '<>'):
+        return actual != value
+    if operator in ('in', 'not in'):
+        return (actual in value) == (operator == 'in')
+    if operator in ('like', 'ilike', 'not like', 'not ilike', '=like',
+                    '=ilike'):
+        pattern = '.*'.join([re.escape(part)
+                             for part in ('%s' % value).split('%')])
+        if not operator.startswith('='):
+            pattern = '.*' + pattern + '.*'
+        flags = re.I if 'ilike' in operator else 0
+        found = re.match(pattern + '$', '%s' % (actual or ''), flags)
+        return bool(found) != operator.startswith('not')
+    if actual is False:
+        return False
+    return {'<': actual < value, '>': actual > value,
+            '<=': actual <= value, '>=': actual >= value}[operator]
+
+
+def default_tables(records):
+    """Return the tables, with `records` partners."""
+    countries = Table('res.country', {
+        'name': {'type': 'char', 'string': 'Country Name'},
+        'code': {'type': 'char', 'string': 'Country Code'},
+    }, [{'name': name, 'code': name[:2].upper()} for name in COUNTRIES])
+    partners = Table('res.partner', {
+        'name': {'type': 'char', 'string': 'Name'},
+        'email': {'type': 'char', 'string': 'Email'},
+        'active': {'type': 'boolean', 'string': 'Active'},
+        'is_company': {'type': 'boolean', 'string': 'Is a Company'},
+        'credit_limit': {'type': 'float', 'string': 'Credit Limit'},
+        'comment': {'type': 'text', 'string': 'Notes'},
+        'country_id': {'type': 'many2one', 'string': 'Country',
+                       'relation': 'res.country'},
+        'write_date': {'type': 'datetime', 'string': 'Last Updated on'},
+    }, [{'name': 'Partner %d' % idx,
+         'email': 'partner%d@example.com' % idx,
+         'active': True,
+         'is_company': idx % 5 == 0,
+         'credit_limit': idx * 12.5,
+         'comment': '<p>Lorem ipsum dolor sit amet</p>' * (idx % 3),
+         'country_id': [idx % len(COUNTRIES) + 1,
+                        COUNTRIES[idx % len(COUNTRIES)]],
+         'write_date': '2018-12-05 10:%02d:00' % (idx % 60)}
+        for idx in range(1, records + 1)])
+    users = Table('res.users', {
+        'login': {'type': 'char', 'string': 'Login'},
+        'name': {'type': 'char', 'string': 'Name'},
+    }, [{'login': 'admin', 'name': 'Administrator'}])
+    tables = [countries, partners, users]
+    models = Table('ir.model', {
+        'model': {'type': 'char', 'string': 'Model'},
+        'name': {'type': 'char', 'string': 'Model Description'},
+    }, [{'model': table.model, 'name': table.model}
+        for table in tables + [Table('ir.model', {})]])
+    return dict([(table.model, table) for table in tables + [models]])
+
+
+class FakeServer(object):
+    """A fake Odoo server, running in a thread.
+
+    The table ``res.partner`` has `records` rows.  Each request waits for
+    `latency` seconds before the reply.  The user `user` logs in the
+    database `database` with the `password`.
+
+        with FakeServer(records=10000) as server:
+            client = erppeek.Client(server.url, 'demo', 'admin', 'admin')
+    """
+
+    def __init__(self, records=1000, latency=0.0, host='127.0.0.1', port=0,
+                 version='11.0', database='demo', user='admin',
+                 password='admin', tables=None):
+        self.latency = latency
+        self.version = version
+        self.database = database
+        self.users = {user: (1, password)}
+        self.tables = tables or default_tables(records)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = _HTTPServer((host, port), _RequestHandler)
+        self.httpd.fake = self
+
+    @property
+    def url(self):
+        (host, port) = self.httpd.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def start(self):
+        """Serve the requests in a thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and close the socket."""
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def dispatch(self, service, method, args):
+        """Return the result of the call, or raise an exception."""
+        if service == 'db':
+            if method == 'server_version':
+                return self.version
+            if method == 'list':
+                return [self.database]
+            if method == 'db_exist':
+                return args[0] == self.database
+        elif service == 'common':
+            if method == 'version':
+                return {'server_version': self.version}
+            if method in ('login', 'authenticate'):
+                (uid, password) = self.users.get(args[1], (False, None))
+                ok = args[0] == self.database and args[2] == password
+                return uid if ok else False
+        elif service == 'object' and method == 'execute':
+            self._check(*args[:3])
+            with self._lock:
+                return self.execute(args[3], args[4], list(args[5:]), {})
+        elif service == 'object' and method == 'execute_kw':
+            self._check(*args[:3])
+            kwargs = args[6] if len(args) > 6 else None
+            with self._lock:
+                return self.execute(args[3], args[4], list(args[5]),
+                                    dict(kwargs or {}))
+        raise Fault('Method not found', '%s.%s' % (service, method))
+
+    def _check(self, database, uid, password):
+        if (database != self.database or
+                (uid, password) not in self.users.values()):
+            raise Fault('AccessDenied', 'Access Denied')
+
+    def execute(self, model, method, params, kwargs):
+        """Call the `method` of the `model`."""
+        table = self.tables.get(model)
+        if model == 'ir.model.access' and method == 'check':
+            return True
+        if table is None:
+            raise Fault('warning -- Object Error',
+                        "Object %s doesn't exist" % model)
+        args = dict(zip(_SIGNATURES.get(method, ()), params), **kwargs)
+        args.pop('context', None)
+        if method == 'search':
+            return table.search(**args)
+        if method == 'search_count':
+            return len(table.search(args['domain']))
+        if method == 'read':
+            ids = args['ids']
+            single = not isinstance(ids, list)
+            rv = table.read([ids] if single else ids, args.get('fields'))
+            return rv[0] if single else rv
+        if method == 'search_read':
+            fields = args.pop('fields', None)
+            return table.read(table.search(**args), fields)
+        if method == 'name_get':
+            return [[rec['id'], rec['name']]
+                    for rec in table.read(args['ids'], ['name'])]
+        if method == 'create':
+            return table.create(args['vals'])
+        if method == 'write':
+            return table.write(args['ids'], args['vals'])
+        if method == 'unlink':
+            return table.unlink(args['ids'])
+        if method == 'fields_get':
+            return dict([(name, dict(field, name=name)) for (name, field)
+                         in table.fields.items()])
+        if method == 'fields_get_keys':
+            return sorted(table.fields)
+        raise Fault('warning -- Object Error',
+                    "Method %s.%s doesn't exist" % (model, method))
+
+
+_SIGNATURES = {
+    'search': ('domain', 'offset', 'limit', 'order', 'context', 'count'),
+    'search_count': ('domain', 'context'),
+    'read': ('ids', 'fields', 'context'),
+    'search_read': ('domain', 'fields', 'offset', 'limit', 'order',
+                    'context'),
+    'name_get': ('ids', 'context'),
+    'create': ('vals', 'context'),
+    'write': ('ids', 'vals', 'context'),
+    'unlink': ('ids', 'context'),
+    'fields_get': ('allfields', 'context'),
+    'fields_get_keys': ('context',),
+}
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # Accept many concurrent clients without SYN retransmits
+    request_queue_size = 128
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        fake = self.server.fake
+        with fake._lock:
+            fake.requests += 1
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = zlib.decompress(body, _GZIP_WBITS)
+        if fake.latency:
+            time.sleep(fake.latency)
+        if self.path == '/jsonrpc':
+            (content_type, content) = self._jsonrpc(json.loads(
+                body.decode('utf-8')))
+        elif self.path.startswith('/xmlrpc/'):
+            content_type = 'text/xml'
+            content = self._xmlrpc(self.path[8:].strip('/'), body)
+        else:
+            self.send_error(404)
+            return
+        headers = {'Content-Type': content_type}
+        if ('gzip' in (self.headers.get('Accept-Encoding') or '') and
+                len(content) > 1024):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, _GZIP_WBITS)
+            content = compressor.compress(content) + compressor.flush()
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(200)
+        for (key, value) in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _call(self, service, method, args):
+        return self.server.fake.dispatch(service, method, args)
+
+    def _xmlrpc(self, service, body):
+        (args, method) = xmlrpc_loads(body)
+        try:
+            if method == 'system.multicall':
+                rv = []
+                for call in args[0]:
+                    try:
+                        rv.append([self._call(service, call['methodName'],
+                                              call['params'])])
+                    except Exception as exc:
+                        fault = _fault(exc)
+                        rv.append({'faultCode': fault.faultCode,
+                                   'faultString': fault.faultString})
+            else:
+                rv = self._call(service, method, args)
+            content = xmlrpc_dumps((rv,), methodresponse=True,
+                                   allow_none=True)
+        except Exception as exc:
+            content = xmlrpc_dumps(_fault(exc), allow_none=True)
+        return content.encode('utf-8')
+
+    def _jsonrpc(self, data):
+        if isinstance(data, list):
+            rv = [self._jsonrpc_reply(item) for item in data]
+        else:
+            rv = self._jsonrpc_reply(data)
+        return ('application/json', json.dumps(rv).encode('utf-8'))
+
+    def _jsonrpc_reply(self, request):
+        params = request.get('params') or {}
+        try:
+            result = self._call(params['service'], params['method'],
+                                params.get('args') or [])
+        except Exception as exc:
+            fault = _fault(exc)
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {
+                'code': 200, 'message': 'Odoo Server Error',
+                'data': {'name': fault.faultCode,
+                         'message': fault.faultString,
+                         'arguments': [fault.faultString],
+                         'debug': traceback.format_exc()}}}
+        return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+
+
+def _fault(exc):
+    if isinstance(exc, Fault):
+        return exc
+    return Fault('%s: %s' % (exc.__class__.__name__, exc),
+                 traceback.format_exc())
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8069)
+    parser.add_argument('--records', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--version', default='11.0')
+    args = parser.parse_args()
+    server = FakeServer(args.records, args.latency, args.host, args.port,
+                        args.version)
+    print('Serving on %s (database %r, user admin, password admin)' %
+          (server.url, server.database))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+import json
+
+import mock
+import unittest2
+
+import erppeek
+from ._common import XmlRpcTestCase
+
+asyncio = erppeek.asyncio
+
+
+@unittest2.skipIf(asyncio is None, 'asyncio is not available')
+class TestAsyncHTTPProtocol(XmlRpcTestCase):
+    """Test the parsing of the HTTP responses."""
+
+    def setUp(self):
+        super(TestAsyncHTTPProtocol, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.protocol = erppeek._AsyncHTTPProtocol()
+        self.protocol.connection_made(mock.Mock())
+
+    def _receive(self, *chunks):
+        future = self.protocol.request(b'POST / HTTP/1.1\r\n\r\n')
+        for chunk in chunks:
+            self.assertFalse(future.done())
+            self.protocol.data_received(chunk)
+        return future
+
+    def test_content_length(self):
+        future = self._receive(b'HTTP/1.1 200 OK\r\nContent-Len',
+                               b'gth: 14\r\n\r\n{"resu', b'lt": 42}')
+        self.assertEqual(future.result(), (200, 'OK', {'content-length': '14'},
+                                           b'{"result": 42}'))
+        self.assertTrue(self.protocol.keep_alive)
+
+    def test_chunked(self):
+        future = self._receive(b'HTTP/1.1 200 OK\r\n'
+                               b'Transfer-Encoding: chunked\r\n\r\n5\r\n{"res',
+                               b'\r\n9\r\nult": 42}\r\n0\r\n', b'\r\n')
+        self.assertEqual(future.result()[3], b'{"result": 42}')
+        self.assertTrue(self.protocol.keep_alive)
+
+    def test_gzip(self):
+        body = erppeek.gzip_encode(b'{"result": 42}')
+        future = self._receive(
+            b'HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\n'
+            b'Connection: close\r\nContent-Length: %d\r\n\r\n' % len(body),
+            body)
+        self.assertEqual(future.result()[3], b'{"result": 42}')
+        self.assertFalse(self.protocol.keep_alive)
+
+    def test_connection_lost(self):
+        future = self._receive(b'HTTP/1.0 200 OK\r\n\r\n{"result"', b': 42}')
+        self.protocol.connection_lost(None)
+        self.assertEqual(future.result()[3], b'{"result": 42}')
+        self.assertFalse(self.protocol.keep_alive)
+
+        self.protocol.connection_made(mock.Mock())
+        future = self._receive(b'HTTP/1.1 200 OK\r\nContent-Length: 99\r\n')
+        self.protocol.connection_lost(None)
+        self.assertRaises(erppeek.socket.error, future.result)
+        self.assertIsNone(self.protocol.transport)
+
+    def test_session_cancel(self):
+        session = erppeek.AsyncHTTPSession()
+        key = ('http', '127.0.0.1:8069')
+        for timeout in (None, 0.01):
+            protocol = erppeek._AsyncHTTPProtocol()
+            protocol.connection_made(mock.Mock())
+            # Idle after a previous response
+            protocol.keep_alive = True
+            session._idle[key] = [(erppeek.time.time(), protocol)]
+            future = session.post('http://127.0.0.1:8069/jsonrpc', b'{}')
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.assertTrue(protocol.transport.write.called)
+            protocol.data_received(b'HTTP/1.1 200 OK\r\n'
+                                   b'Content-Length: 99\r\n\r\n{')
+            self.assertTrue(protocol.keep_alive)
+            if timeout is None:
+                future.cancel()
+                self.loop.run_until_complete(asyncio.sleep(0))
+            else:
+                self.assertRaises(asyncio.TimeoutError,
+                                  self.loop.run_until_complete,
+                                  asyncio.wait_for(future, timeout))
+            # The connection is closed, not reused with a pending response
+            self.assertEqual(session._idle[key], [])
+            self.assertIsNone(protocol.transport)
+            self.assertEqual(session._active[key], 0)
+
+
+@unittest2.skipIf(asyncio is None, 'asyncio is not available')
+class TestAsyncClient(XmlRpcTestCase):
+    """Test the AsyncClient with a fake JSON-RPC server."""
+    server = 'http://127.0.0.1:8069/jsonrpc'
+
+    def setUp(self):
+        super(TestAsyncClient, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.calls = []
+
+    def _patch_service(self):
+        mock.patch('erppeek.AsyncHTTPSession.post',
+                   side_effect=self._post).start()
+
+    def _post(self, url, data, headers):
+        params = json.loads(data.decode('utf-8'))['params']
+        self.calls.append((params['service'], params['method'],
+                           tuple(params['args'])))
+        result = self.dispatch(params['method'], *params['args'])
+        if isinstance(result, Exception):
+            resp = {'error': {'message': str(result)}}
+        else:
+            resp = {'result': result}
+        content = json.dumps(resp).encode('utf-8')
+        return erppeek._async_result(erppeek._HTTPResponse(200, content))
+
+    def dispatch(self, method, *args):
+        if method == 'server_version':
+            return '11.0'
+        if method == 'login':
+            return 17 if args[2] == 'pwd' else False
+        (obj, method) = args[3:5]
+        if method == 'search':
+            return [13, 42]
+        if method == 'read':
+            return [{'id': id_, 'name': 'Name %d' % id_}
+                    for id_ in sorted(args[5])]
+        if method == 'create':
+            return 99
+        if method == 'fields_get':
+            return {'name': {'type': 'char'},
+                    'parent_id': {'type': 'many2one'},
+                    'child_ids': {'type': 'one2many'},
+                    'category_id': {'type': 'many2many'},
+                    'ref': {'type': 'reference'}}
+        if method == 'unlink':
+            return ValueError('Access Denied')
+        return True
+
+    def run_(self, future):
+        return self.loop.run_until_complete(future)
+
+    def _login(self):
+        client = erppeek.AsyncClient(self.server)
+        self.assertEqual(self.run_(client.login('usr', 'pwd', 'db')), 17)
+        del self.calls[:]
+        return client
+
+    def test_login(self):
+        client = erppeek.AsyncClient(self.server)
+        self.assertRaises(erppeek.Error, self.run_,
+                          client.login('usr', 'passwd', 'db'))
+        self.assertEqual(client.major_version, '11.0')
+        self.assertIsNone(client.user)
+        self.assertEqual(self.run_(client.login('usr', 'pwd', 'db')), 17)
+        self.assertEqual(client.user, 'usr')
+        self.assertEqual(self.calls, [
+            ('db', 'server_version', ()),
+            ('common', 'login', ('db', 'usr', 'passwd')),
+            ('common', 'login', ('db', 'usr', 'pwd')),
+        ])
+
+    def test_execute(self):
+        client = self._login()
+        auth = ('db', 17, 'pwd')
+        futures = [client.search('res.partner', ['name like Morice']),
+                   client.read('res.partner', [42, 13], 'name', order=True),
+                   client.read('res.partner', [13], 'name'),
+                   client.execute_kw('res.partner', 'write', [[42]],
+                                     {'context': {}}),
+                   client.execute('res.partner', 'unlink', [42])]
+        self.assertEqual(self.run_(futures[0]), [13, 42])
+        self.assertEqual(self.run_(futures[1]), ['Name 42', 'Name 13'])
+        self.assertEqual(self.run_(futures[2]), ['Name 13'])
+        self.assertIs(self.run_(futures[3]), True)
+        self.assertRaises(erppeek.ServerError, self.run_, futures[4])
+        self.assertEqual(self.calls, [
+            ('object', 'execute', auth + ('res.partner', 'search',
+                                          [['name', 'like', 'Morice']])),
+            ('object', 'execute', auth + ('res.partner', 'read', [13, 42],
+                                          ['name'])),
+            ('object', 'execute', auth + ('res.partner', 'read', [13],
+                                          ['name'])),
+            ('object', 'execute_kw', auth + ('res.partner', 'write', [[42]],
+                                             {'context': {}})),
+            ('object', 'execute', auth + ('res.partner', 'unlink', [42])),
+        ])
+
+    def test_model(self):
+        client = self._login()
+        auth = ('db', 17, 'pwd')
+        model = client.model('res.partner')
+        self.assertIs(client.model('res.partner'), model)
+
+        records = self.run_(model.browse(['name like Morice']))
+        self.assertIsInstance(records, erppeek.AsyncRecordList)
+        self.assertEqual(records.id, [13, 42])
+        self.assertEqual(self.run_(records.read('name')),
+                         ['Name 13', 'Name 42'])
+        self.assertIs(self.run_(records.write({'parent_id': 1})), True)
+
+        record = self.run_(model.create({'name': 'Morice'}))
+        self.assertIsInstance(record, erppeek.AsyncRecord)
+        self.assertEqual(record.id, 99)
+        self.assertIs(self.run_(record.write({'parent_id': record})), True)
+        self.assertIs(self.run_(record.write({'category_id': [1, 2],
+                                              'child_ids': records,
+                                              'ref': record})), True)
+        self.assertEqual(self.run_(model.create({'category_id': []})).id,
+                         99)
+        self.assertRaises(ValueError, self.run_, model.get(['name = x']))
+        self.assertEqual(self.run_(model.browse(42)).id, 42)
+        self.assertEqual(self.run_(model.browse([])).id, [])
+
+        self.assertEqual(self.calls, [
+            ('object', 'execute', auth + ('res.partner', 'search',
+                                          [['name', 'like', 'Morice']])),
+            ('object', 'execute', auth + ('res.partner', 'read', [13, 42],
+                                          ['name'])),
+            ('object', 'execute', auth + ('res.partner', 'write', [13, 42],
+                                          {'parent_id': 1})),
+            ('object', 'execute', auth + ('res.partner', 'create',
+                                          {'name': 'Morice'})),
+            ('object', 'execute', auth + ('res.partner', 'fields_get')),
+            ('object', 'execute', auth + ('res.partner', 'write', [99],
+                                          {'parent_id': 99})),
+            ('object', 'execute', auth + ('res.partner', 'write', [99], {
+                'category_id': [[6, 0, [1, 2]]],
+                'child_ids': [[6, 0, [13, 42]]],
+                'ref': 'res.partner,99'})),
+            ('object', 'execute', auth + ('res.partner', 'create',
+                                          {'category_id': [[6, 0, []]]})),
+            ('object', 'execute', auth + ('res.partner', 'search',
+                                          [['name', '=', 'x']])),
+        ])
+
+    def test_xmlrpc(self):
+        post = mock.patch('erppeek.AsyncHTTPSession.post').start()
+        post.side_effect = lambda url, data, headers: erppeek._async_result(
+            erppeek._HTTPResponse(200, erppeek.xmlrpc_dumps(
+                ('8.0',), methodresponse=True).encode('utf-8')))
+        client = erppeek.AsyncClient('http://127.0.0.1:8069', compress=0)
+        self.assertEqual(self.run_(client._dispatch('db', 'server_version',
+                                                    ())), '8.0')
+        (url, data, headers) = post.call_args[0]
+        self.assertEqual(url, 'http://127.0.0.1:8069/xmlrpc/db')
+        self.assertEqual(headers, {'Content-Type': 'text/xml',
+                                   'Content-Encoding': 'gzip'})
+        self.assertTrue(client.session.accept_gzip)
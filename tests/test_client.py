@@ -1,4 +1,9 @@
 # -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+
 import mock
 from mock import call, sentinel, ANY
 
@@ -40,6 +45,11 @@ class TestService(XmlRpcTestCase):
     def _get_client(self):
         client = mock.Mock()
         client._server = 'http://127.0.0.1:8069/%s' % self.protocol
+        client._options = dict(erppeek.CLIENT_OPTIONS)
+        client._codec = None
+        client.retry = client.breaker = client._capabilities = None
+        client.metrics = None
+        client.hooks = []
         proxy = getattr(erppeek.Client, '_proxy_%s' % self.protocol)
         client._proxy = proxy.__get__(client, erppeek.Client)
         return client
@@ -57,6 +67,59 @@ class TestService(XmlRpcTestCase):
             self.assertCalls()
         self.assertOutput('')
 
+    def test_service_revalidate(self):
+        client = self._get_client()
+        client._capabilities = {'server_version': '11.0'}
+        svc_alpha = erppeek.Service(client, 'alpha', ['beta'])
+        self.service.side_effect = erppeek.socket.error
+        self.assertRaises(erppeek.socket.error, svc_alpha.beta, 42)
+        self.assertFalse(client._revalidate.called)
+
+        # The cached capabilities might be outdated
+        self.service.side_effect = erppeek.Fault(1, 'Method not found')
+        self.assertRaises(erppeek.Fault, svc_alpha.beta, 42)
+        client._revalidate.assert_called_once_with()
+
+        # The errors of the models do not discard the capabilities
+        client._revalidate.reset_mock()
+        svc_object = erppeek.Service(client, 'object', ['execute'])
+        self.service.side_effect = erppeek.Fault(
+            'warning -- AccessError', 'Access to res.partner is denied')
+        self.assertRaises(erppeek.Fault, svc_object.execute, 42)
+        self.service.side_effect = erppeek.Fault(
+            "'res.partner' object has no attribute 'missing'", '')
+        self.assertRaises(erppeek.Fault, svc_object.execute, 42)
+        self.assertFalse(client._revalidate.called)
+        svc_db = erppeek.Service(client, 'db', ['list'])
+        self.service.side_effect = erppeek.Fault('AccessDenied', '')
+        self.assertRaises(erppeek.Fault, svc_db.list)
+        self.assertFalse(client._revalidate.called)
+
+        self.service.side_effect = erppeek.Fault(
+            'Method not available execute_kw', '')
+        self.assertRaises(erppeek.Fault, svc_object.execute, 42)
+        client._revalidate.assert_called_once_with()
+        self.assertOutput('')
+
+    def test_service_metrics(self):
+        client = self._get_client()
+        client.metrics = erppeek.Metrics()
+        svc_object = erppeek.Service(client, 'object', ['execute'])
+        svc_object.execute('db', 1, 'pwd', 'res.users', 'read', [1])
+        self.service.side_effect = erppeek.socket.error
+        self.assertRaises(erppeek.socket.error, svc_object.execute,
+                          'db', 1, 'pwd', 'res.users', 'read', [1])
+        svc_common = erppeek.Service(client, 'common', ['login'])
+        self.assertRaises(erppeek.socket.error, svc_common.login, 'db')
+
+        stats = sorted(client.metrics.stats(), key=lambda s: s['endpoint'])
+        self.assertEqual(
+            [(s['endpoint'], s['model'], s['method'], s['calls'], s['errors'])
+             for s in stats],
+            [('common', '', 'login', 1, 1),
+             ('object', 'res.users', 'read', 2, 1)])
+        self.assertIsNone(erppeek._rpc_local.sizes)
+
     def test_service_openerp(self):
         client = self._get_client()
 
@@ -142,13 +205,13 @@ class TestCreateClient(XmlRpcTestCase):
     startup_calls = (
         call(ANY, 'db', ANY, verbose=ANY),
         'db.server_version',
-        call(ANY, 'db', ANY, verbose=ANY),
-        call(ANY, 'common', ANY, verbose=ANY),
-        call(ANY, 'object', ANY, verbose=ANY),
-        call(ANY, 'report', ANY, verbose=ANY),
-        call(ANY, 'wizard', ANY, verbose=ANY),
         'db.list',
     )
+    # The services are created on first use
+    common_call = call(ANY, 'common', ANY, verbose=ANY)
+    service_calls = (
+        call(ANY, 'object', ANY, verbose=ANY),
+    )
 
     def test_create(self):
         self.service.db.list.return_value = ['newdb']
@@ -156,7 +219,9 @@ class TestCreateClient(XmlRpcTestCase):
 
         client = erppeek.Client('http://127.0.0.1:8069', 'newdb', 'usr', 'pss')
         expected_calls = self.startup_calls + (
-            ('common.login', 'newdb', 'usr', 'pss'),)
+            self.common_call,
+            ('common.login', 'newdb', 'usr', 'pss'),
+        ) + self.service_calls
         self.assertIsInstance(client, erppeek.Client)
         self.assertCalls(*expected_calls)
         self.assertEqual(
@@ -169,7 +234,9 @@ class TestCreateClient(XmlRpcTestCase):
                              return_value='password').start()
         self.service.db.list.return_value = ['database']
         expected_calls = self.startup_calls + (
-            ('common.login', 'database', 'usr', 'password'),)
+            self.common_call,
+            ('common.login', 'database', 'usr', 'password'),
+        )
 
         # A: Invalid login
         self.assertRaises(erppeek.Error, erppeek.Client,
@@ -183,7 +250,7 @@ class TestCreateClient(XmlRpcTestCase):
 
         client = erppeek.Client('http://127.0.0.1:8069', 'database', 'usr')
         self.assertIsInstance(client, erppeek.Client)
-        self.assertCalls(*expected_calls)
+        self.assertCalls(*(expected_calls + self.service_calls))
         self.assertEqual(getpass.call_count, 1)
 
     def test_create_with_cache(self):
@@ -193,9 +260,10 @@ class TestCreateClient(XmlRpcTestCase):
             ('http://127.0.0.1:8069/xmlrpc', 'database', 'usr')] = (1, 'password')
 
         client = erppeek.Client('http://127.0.0.1:8069', 'database', 'usr')
-        expected_calls = self.startup_calls + (
+        expected_calls = self.startup_calls + self.service_calls[:1] + (
             ('object.execute', 'database', 1, 'password',
-             'res.users', 'fields_get_keys'),)
+             'res.users', 'fields_get_keys'),
+        ) + self.service_calls[1:]
         self.assertIsInstance(client, erppeek.Client)
         self.assertCalls(*expected_calls)
         self.assertOutput('')
@@ -208,7 +276,9 @@ class TestCreateClient(XmlRpcTestCase):
                              return_value='password').start()
         self.service.db.list.return_value = ['database']
         expected_calls = self.startup_calls + (
-            ('common.login', 'database', 'usr', 'password'),)
+            self.common_call,
+            ('common.login', 'database', 'usr', 'password'),
+        )
 
         # A: Invalid login
         self.assertRaises(erppeek.Error, erppeek.Client.from_config, 'test')
@@ -223,10 +293,76 @@ class TestCreateClient(XmlRpcTestCase):
 
         client = erppeek.Client.from_config('test')
         self.assertIsInstance(client, erppeek.Client)
-        self.assertCalls(*expected_calls)
+        self.assertCalls(*(expected_calls + self.service_calls))
         self.assertEqual(read_config.call_count, 1)
         self.assertEqual(getpass.call_count, 1)
 
+    def test_create_with_capability_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cache_file = os.path.join(tmpdir, 'cache.json')
+        server = 'http://127.0.0.1:8069?cache_file=%r' % cache_file
+        self.service.db.list.return_value = ['database']
+        self.service.common.login.return_value = 17
+        login_calls = (self.common_call,
+                       ('common.login', 'database', 'usr', 'pss'))
+        login_calls += self.service_calls
+
+        client = erppeek.Client(server, 'database', 'usr', 'pss')
+        self.assertCalls(*(self.startup_calls + login_calls))
+        self.assertIsNone(client._capabilities)
+        with open(cache_file) as f:
+            entry = json.load(f)['http://127.0.0.1:8069/xmlrpc']
+        self.assertEqual(entry['server_version'], '6.1')
+        self.assertEqual(entry['db_list'], ['database'])
+        self.assertEqual(sorted(entry['services']),
+                         ['common', 'db', 'object', 'report', 'wizard'])
+        self.assertIn('get_progress', entry['services']['db'])
+
+        # The handshake is skipped
+        wizard_methods = ['m_wizard']
+        entry['services']['wizard'] = wizard_methods
+        with open(cache_file, 'w') as f:
+            json.dump({'http://127.0.0.1:8069/xmlrpc': entry}, f)
+        client = erppeek.Client(server, 'database', 'usr', 'pss')
+        self.assertCalls(*login_calls)
+        self.assertIsNotNone(client._wizard)
+        self.assertCalls(call(client, 'wizard', wizard_methods, verbose=False))
+        self.assertEqual(client.server_version, '6.1')
+        self.assertEqual(client._capabilities['db_list'], ['database'])
+
+        # Revalidate the list of databases
+        self.service.db.list.return_value = ['database', 'newdb']
+        client.login('usr', 'pss', 'newdb')
+        self.assertCalls(call(ANY, 'db', ANY, verbose=ANY), 'db.list',
+                         ('common.login', 'newdb', 'usr', 'pss'))
+        self.assertRaises(erppeek.Error, client.login, 'usr', 'pss', 'nodb')
+        self.assertCalls('db.list')
+
+        client._revalidate()
+        self.assertIsNone(client._capabilities)
+        client = erppeek.Client(server, 'database', 'usr', 'pss')
+        self.assertCalls(*(self.startup_calls + login_calls))
+
+        # The entry expires
+        erppeek.Client(server + '&cache_ttl=0', 'database', 'usr', 'pss')
+        self.assertCalls(*(self.startup_calls + login_calls))
+
+    def test_create_with_version(self):
+        self.service.db.list.return_value = ['database']
+        self.service.common.login.return_value = 17
+
+        # The version is not asked, and the services are created on use
+        client = erppeek.Client('http://127.0.0.1:8069?version=6.1')
+        self.assertCalls()
+        self.assertEqual(client.server_version, '6.1')
+        self.assertEqual(client.major_version, '6.1')
+        client.login('usr', 'pss', 'database')
+        self.assertCalls(call(ANY, 'db', ANY, verbose=ANY), 'db.list',
+                         self.common_call,
+                         ('common.login', 'database', 'usr', 'pss'),
+                         *self.service_calls)
+
     def test_create_invalid(self):
         # Without mock
         self.service.stop()
@@ -318,6 +454,7 @@ class TestSampleSession50(TestSampleSession):
             imm + ('button_upgrade', [42]),
             imm + ('search', [('state', 'not in', STABLE)]),
             imm + ('read', [42], ['name', 'state']),
+            call(ANY, 'wizard', ANY, verbose=ANY),
             ('wizard.create', AUTH, 'module.upgrade'),
             ('wizard.execute', AUTH, 17, {}, 'start', None),
         )
@@ -596,6 +733,62 @@ class TestClientApi(XmlRpcTestCase):
         self.assertCalls()
         self.assertOutput('')
 
+    def test_execute_many(self):
+        execute_many = self.client.execute_many
+        self.service.object.execute.side_effect = [
+            [(1, 'A1')], [], erppeek.Fault(1, 'Access Denied')]
+
+        results = execute_many('foo.bar', 'name_search',
+                               ['A1', ('A2', [], 'ilike'), 'A3'], workers=1)
+        self.assertEqual(results[:2], [[(1, 'A1')], []])
+        self.assertIsInstance(results[2], erppeek.Fault)
+        self.assertCalls(
+            OBJ('foo.bar', 'name_search', 'A1'),
+            OBJ('foo.bar', 'name_search', 'A2', [], 'ilike'),
+            OBJ('foo.bar', 'name_search', 'A3'),
+        )
+
+        self.service.object.execute.side_effect = lambda *args: args[5]
+        self.assertEqual(execute_many('foo.bar', 'read', map(int, '6789'),
+                                      workers=3), [6, 7, 8, 9])
+        self.assertEqual(len(self.service.object.execute.mock_calls), 4)
+        self.assertEqual(execute_many('foo.bar', 'read', []), [])
+        self.service.reset_mock()
+        self.assertOutput('')
+
+    def test_iter_read(self):
+        iter_read = self.client.iter_read
+        self.service.object.execute.side_effect = self.obj_exec
+        self.service.object._dispatch_stream = None
+        domain = [('name', 'like', 'Morice')]
+
+        self.assertEqual(list(iter_read('foo.bar', ['name like Morice'])),
+                         [DIC1, DIC2])
+        self.assertEqual(list(iter_read('foo.bar', domain, 'city',
+                                        order='name ASC')),
+                         ['v_city_4002', 'v_city_4001'])
+        self.assertEqual(list(iter_read('foo.bar', [17, False, 13, 42, 17],
+                                        chunk_size=2)),
+                         [IdentDict(17), IdentDict(13), IdentDict(42)])
+        self.assertEqual(list(iter_read('foo.bar', [17, False, 13],
+                                        '%(city)s', order=True)),
+                         ['v_city_17', False, 'v_city_13'])
+        self.assertEqual(list(iter_read('foo.bar', 42, 'city')),
+                         ['v_city_42'])
+        self.assertEqual(list(iter_read('foo.bar', [])), [])
+
+        self.assertCalls(
+            OBJ('foo.bar', 'search', domain),
+            OBJ('foo.bar', 'read', [ID2, ID1], None),
+            OBJ('foo.bar', 'search', domain, 0, None, 'name ASC'),
+            OBJ('foo.bar', 'read', [ID1, ID2], ['city']),
+            OBJ('foo.bar', 'read', [13, 17], None),
+            OBJ('foo.bar', 'read', [42], None),
+            OBJ('foo.bar', 'read', [13, 17], ['city']),
+            OBJ('foo.bar', 'read', [42], ['city']),
+        )
+        self.assertOutput('')
+
     def test_method(self, method_name='method', single_id=True):
         method = getattr(self.client, method_name)
 
@@ -735,6 +928,7 @@ class TestClientApi(XmlRpcTestCase):
         self.assertRaises(TypeError, wizard)
 
         self.assertCalls(
+            call(ANY, 'wizard', ANY, verbose=ANY),
             ('wizard.create', AUTH, 'foo.bar'),
             ('wizard.create', AUTH, 'billy'),
             ('wizard.execute', AUTH, ID1, {}, 'shake', None),
@@ -745,6 +939,7 @@ class TestClientApi(XmlRpcTestCase):
     def test_report(self):
         self.assertTrue(self.client.report('foo.bar', sentinel.IDS))
         self.assertCalls(
+            call(ANY, 'report', ANY, verbose=ANY),
             ('report.report', AUTH, 'foo.bar', sentinel.IDS),
         )
         self.assertOutput('')
@@ -752,6 +947,7 @@ class TestClientApi(XmlRpcTestCase):
     def test_render_report(self):
         self.assertTrue(self.client.render_report('foo.bar', sentinel.IDS))
         self.assertCalls(
+            call(ANY, 'report', ANY, verbose=ANY),
             ('report.render_report', AUTH, 'foo.bar', sentinel.IDS),
         )
         self.assertOutput('')
@@ -759,6 +955,7 @@ class TestClientApi(XmlRpcTestCase):
     def test_report_get(self):
         self.assertTrue(self.client.report_get(ID1))
         self.assertCalls(
+            call(ANY, 'report', ANY, verbose=ANY),
             ('report.report_get', AUTH, ID1),
         )
         self.assertOutput('')
@@ -844,6 +1041,9 @@ class TestClientApi50(TestClientApi):
         self.service.wizard.create.return_value = 17
         self.service.wizard.execute.return_value = {'state': (['config'],)}
         action = getattr(self.client, button)
+        # The service is created on first use
+        wizard_calls = ([] if '_wizard' in vars(self.client) else
+                        [call(ANY, 'wizard', ANY, verbose=ANY)])
 
         imm = ('object.execute', AUTH, 'ir.module.module')
         expected_calls = [
@@ -853,6 +1053,7 @@ class TestClientApi50(TestClientApi):
             imm + ('button_' + button, [42]),
             imm + ('search', [('state', 'not in', STABLE)]),
             imm + ('read', [4, 42, 5], ['name', 'state']),
+        ] + wizard_calls + [
             ('wizard.create', AUTH, 'module.upgrade'),
             ('wizard.execute', AUTH, 17, {}, 'start', None),
         ]
@@ -886,3 +1087,463 @@ class TestClientApi11(TestClientApi):
     server_version = '11.0'
     test_wizard = _skip_test
     test_report = test_render_report = test_report_get = _skip_test
+
+
+class TestBatch(XmlRpcTestCase):
+    """Test the Batch of calls with JSON-RPC."""
+    server_version = '11.0'
+    server = 'http://127.0.0.1:8069/jsonrpc'
+    database = 'database'
+    user = 'user'
+    password = 'passwd'
+    uid = 1
+
+    def _patch_service(self):
+        self.requests = []
+        return mock.patch('erppeek.http_post',
+                          side_effect=self._http_post).start()
+
+    def _reply(self, params):
+        (service, method, args) = (params['service'], params['method'],
+                                   params['args'])
+        if method == 'server_version':
+            return {'result': self.server_version}
+        if method == 'list':
+            return {'result': [self.database]}
+        if method == 'login':
+            return {'result': self.uid}
+        if args[4] == 'search':
+            return {'result': [ID2, ID1]}
+        if args[4] == 'read':
+            return {'result': [{'id': id_, 'name': 'N%s' % id_}
+                               for id_ in args[5]]}
+        return {'error': {'message': 'Odoo Server Error',
+                          'data': {'name': 'Crash'}}}
+
+    def _http_post(self, url, data, session=None):
+        data = json.loads(data.decode('ascii'))
+        self.requests.append(data)
+        if isinstance(data, dict):
+            return dict(self._reply(data['params']), id=data['id'])
+        if self.reject_batch:
+            return {'error': {'message': 'Bad request'}, 'id': None}
+        return [dict(self._reply(item['params']), id=item['id'])
+                for item in reversed(data)]
+
+    reject_batch = False
+
+    def test_batch(self):
+        del self.requests[:]
+        with self.client.batch() as batch:
+            read1 = batch.read('foo.bar', ['name like Morice'], 'name')
+            read2 = batch.read('foo.bar', 42, 'name')
+            count = batch.execute_kw('foo.bar', 'search', [[]], {})
+            crash = batch.execute('foo.bar', 'crash', [42])
+            empty = batch.read('foo.bar', [], 'name')
+            self.assertFalse(read1.done())
+            self.assertRaises(erppeek.Error, read1.result)
+            self.assertTrue(empty.done())
+
+        self.assertEqual(read1.result(), ['N4002', 'N4001'])
+        self.assertEqual(read2.result(), 'N42')
+        self.assertEqual(count.result(), [ID2, ID1])
+        self.assertRaises(erppeek.ServerError, crash.result)
+        self.assertIsInstance(crash.exception(), erppeek.ServerError)
+        self.assertIs(empty.result(), False)
+
+        # Two round trips: the read depends on the search
+        self.assertEqual([len(req) for req in self.requests], [4, 1])
+        self.assertEqual(
+            [item['params']['args'][3:] for item in self.requests[0]],
+            [['foo.bar', 'search', [['name', 'like', 'Morice']]],
+             ['foo.bar', 'read', [42], ['name']],
+             ['foo.bar', 'search', [[]], {}],
+             ['foo.bar', 'crash', [42]]])
+        self.assertEqual(
+            [item['params']['method'] for item in self.requests[0]],
+            ['execute', 'execute', 'execute_kw', 'execute'])
+        self.assertEqual(self.requests[1][0]['params']['args'][3:],
+                         ['foo.bar', 'read', [ID2, ID1], ['name']])
+        self.assertOutput('')
+
+    def test_batch_rejected(self):
+        self.reject_batch = True
+        del self.requests[:]
+        with self.client.batch() as batch:
+            read1 = batch.read('foo.bar', ['name like Morice'], 'name')
+            crash = batch.execute('foo.bar', 'crash', [42])
+
+        self.assertEqual(read1.result(), ['N4002', 'N4001'])
+        self.assertRaises(erppeek.ServerError, crash.result)
+        # The batch is rejected once, then the calls are sent one by one
+        self.assertEqual([isinstance(req, list) for req in self.requests],
+                         [True, False, False, False])
+
+    def test_batch_error(self):
+        # Nothing is sent if an exception is raised in the block
+        del self.requests[:]
+        with self.assertRaises(ZeroDivisionError):
+            with self.client.batch() as batch:
+                read1 = batch.read('foo.bar', 42, 'name')
+                1 / 0
+        self.assertFalse(read1.done())
+        self.assertEqual(self.requests, [])
+
+        # Invalid arguments are detected immediately
+        self.assertRaises(ValueError, batch.search, 'foo.bar', ['name Morice'])
+
+
+class TestBatchXmlRpc(XmlRpcTestCase):
+    """Test the Batch of calls with XML-RPC."""
+    server_version = '11.0'
+    server = 'http://127.0.0.1:8069/xmlrpc'
+    database = 'database'
+    user = 'user'
+    password = 'passwd'
+    uid = 1
+
+    def _patch_service(self):
+        return mock.patch('erppeek.ServerProxy._ServerProxy__request',
+                          side_effect=self._request).start()
+
+    multicall = True
+
+    def _execute(self, args):
+        if args[4] == 'search':
+            return [ID2, ID1]
+        if args[4] == 'read':
+            return [{'id': id_, 'name': 'N%s' % id_} for id_ in args[5]]
+        raise erppeek.Fault('crash', 'Traceback')
+
+    def _request(self, name, args):
+        if name == 'server_version':
+            return self.server_version
+        if name == 'list':
+            return [self.database]
+        if name == 'login':
+            return self.uid
+        if name == 'system.multicall':
+            if not self.multicall:
+                raise erppeek.Fault(1, 'Method not found')
+            results = []
+            for item in args[0]:
+                try:
+                    results.append([self._execute(item['params'])])
+                except erppeek.Fault as exc:
+                    results.append({'faultCode': exc.faultCode,
+                                    'faultString': exc.faultString})
+            return results
+        return self._execute(args)
+
+    def _batch(self):
+        self.service.reset_mock()
+        with self.client.batch() as batch:
+            futures = [batch.read('foo.bar', ['name like Morice'], 'name'),
+                       batch.read('foo.bar', 42, 'name'),
+                       batch.execute('foo.bar', 'crash', [42]),
+                       batch.count('foo.bar')]
+        self.assertEqual(futures[0].result(), ['N4002', 'N4001'])
+        self.assertEqual(futures[1].result(), 'N42')
+        self.assertRaises(erppeek.Fault, futures[2].result)
+        self.assertRaises(erppeek.Fault, futures[3].result)
+        return [args[0] for (args, kwargs) in self.service.call_args_list]
+
+    def test_multicall(self):
+        self.assertEqual(self._batch(),
+                         ['system.multicall', 'system.multicall'])
+        self.assertOutput('')
+
+    def test_multicall_unsupported(self):
+        self.multicall = False
+        self.assertEqual(self._batch().count('system.multicall'), 1)
+        self.assertEqual(self._batch().count('system.multicall'), 0)
+        self.assertEqual(self.service.call_count, 5)
+        self.assertOutput('')
+
+    def test_parallel_map(self):
+        def func(item):
+            return 1 / item
+        items = [1, 2, 0, 4, 5] * 3
+        results = erppeek._parallel_map(func, items, 4)
+        self.assertEqual(len(results), 15)
+        for (item, result) in zip(items, results):
+            if item:
+                self.assertEqual(result, 1 / item)
+            else:
+                self.assertIsInstance(result, ZeroDivisionError)
+
+
+class TestTracing(XmlRpcTestCase):
+    """Test the tracing hooks."""
+    server_version = '11.0'
+    server = 'http://127.0.0.1:8069/xmlrpc'
+    database = 'database'
+    user = 'user'
+    password = 'passwd'
+    uid = 1
+
+    def _patch_service(self):
+        return mock.patch('erppeek.ServerProxy._ServerProxy__request',
+                          side_effect=self._request).start()
+
+    def _request(self, name, args):
+        if name == 'server_version':
+            return self.server_version
+        if name == 'list':
+            return [self.database]
+        if name in ('login', 'db_exist', 'drop', 'create_database',
+                    'change_admin_password'):
+            return self.uid
+        if args[4] == 'search':
+            return [ID2, ID1]
+        if args[4] == 'read':
+            return [{'id': id_, 'name': 'N%s' % id_} for id_ in args[5]]
+        raise erppeek.Fault('crash', 'Traceback')
+
+    def setUp(self):
+        super(TestTracing, self).setUp()
+        self.events = []
+        self.hooks = erppeek.Hooks(
+            before=lambda span: self.events.append(('before', span)),
+            after=lambda span: self.events.append(('after', span)),
+            error=lambda span, exc: self.events.append(('error', span)))
+        self.client.hooks.append(self.hooks)
+
+    def _events(self):
+        rv = [(event, span.name, span.model, span.method, span.args,
+               span.parent and span.parent.name)
+              for (event, span) in self.events]
+        del self.events[:]
+        return rv
+
+    def test_execute(self):
+        self.assertEqual(self.client.read('foo.bar', ['name like Morice'],
+                                          'name'), ['N4002', 'N4001'])
+        domain = "[('name', 'like', 'Morice')]"
+        self.assertEqual(self._events(), [
+            ('before', 'read', 'foo.bar', 'read', "['name like Morice'], "
+             "'name'", None),
+            ('before', 'rpc', 'foo.bar', 'search', domain, 'read'),
+            ('after', 'rpc', 'foo.bar', 'search', domain, 'read'),
+            ('before', 'rpc', 'foo.bar', 'read', "[4002, 4001], ['name']",
+             'read'),
+            ('after', 'rpc', 'foo.bar', 'read', "[4002, 4001], ['name']",
+             'read'),
+            ('after', 'read', 'foo.bar', 'read', "['name like Morice'], "
+             "'name'", None),
+        ])
+
+        self.assertRaises(erppeek.Fault, self.client.execute,
+                          'foo.bar', 'crash', [42], context={'lang': 'fr'})
+        self.assertEqual(self._events(), [
+            ('before', 'execute', 'foo.bar', 'crash',
+             "[42], context={'lang': 'fr'}", None),
+            ('before', 'rpc', 'foo.bar', 'crash', "[42], {'lang': 'fr'}",
+             'execute'),
+            ('error', 'rpc', 'foo.bar', 'crash', "[42], {'lang': 'fr'}",
+             'execute'),
+            ('error', 'execute', 'foo.bar', 'crash',
+             "[42], context={'lang': 'fr'}", None),
+        ])
+        self.assertIsNone(getattr(erppeek._rpc_local, 'span', None))
+        self.assertOutput('')
+
+    def test_sanitize(self):
+        self.client.common.login('db', 'admin', 'secret')
+        self.client.db.db_exist('db')
+        self.client.db.drop('admin_passwd', 'db')
+        spans = [span for (event, span) in self.events if event == 'after']
+        self.assertEqual([(span.endpoint, span.method, span.args)
+                          for span in spans],
+                         [('common', 'login', "'db', 'admin', '*'"),
+                          ('db', 'db_exist', "'db'"),
+                          ('db', 'drop', "'*', 'db'")])
+        self.assertIsInstance(spans[0].duration, float)
+        self.assertIsNone(spans[0].parent)
+
+    def test_sanitize_db_passwords(self):
+        class Recorder(erppeek.Hooks):
+            def __init__(self):
+                self.params = []
+
+            def after(self, span):
+                self.params.append((span.method, span.params, span.args))
+
+        recorder = Recorder()
+        self.client.hooks[:] = [recorder]
+        self.client.db.create_database('super_pw', 'newdb', False, 'en_US',
+                                       'admin_pw', 'admin', 'BE')
+        self.client.db.change_admin_password('old_pw', 'new_pw')
+        self.assertEqual(recorder.params, [
+            ('create_database',
+             ('*', 'newdb', False, 'en_US', '*', 'admin', 'BE'),
+             "'*', 'newdb', False, 'en_US', '*', 'admin', 'BE'"),
+            ('change_admin_password', ('*', '*'), "'*', '*'")])
+
+    def test_hook_error(self):
+        self.hooks.before = mock.Mock(side_effect=ValueError)
+        with mock.patch('erppeek._logger') as logger:
+            self.assertEqual(self.client.search('foo.bar'), [ID2, ID1])
+        self.assertEqual(logger.exception.call_count, 2)
+        self.assertEqual([span.name for (event, span) in self.events],
+                         ['rpc', 'execute'])
+
+    def test_slow_call(self):
+        logger = mock.Mock()
+        self.client.hooks[:] = [erppeek.SlowCallLog(0.0, logger)]
+        self.client.read('foo.bar', ['name like Morice', 'state != draft'],
+                         'name description')
+        self.client.execute_kw('foo.bar', 'read', [[42]],
+                               {'fields': ['name']})
+        self.client.execute('foo.bar', 'search', [('name', '=', 'x')], 0, 80)
+        with self.assertRaises(erppeek.Fault):
+            self.client.execute('foo.bar', 'crash', 42)
+        infos = [kwargs['extra']['slow_call']
+                 for (args, kwargs) in logger.warning.call_args_list]
+        self.assertEqual(
+            [(info['method'], info['domain'], info['ids'], info['fields'],
+              info['error'], info['filename'], info['function'])
+             for info in infos],
+            [('search', "[('name', 'like', ?), ('state', '!=', ?)]", None,
+              None, False, __file__, 'test_slow_call'),
+             ('read', None, 2, 2, False, __file__, 'test_slow_call'),
+             ('read', None, 1, 1, False, __file__, 'test_slow_call'),
+             ('search', "[('name', '=', ?)]", None, None, False, __file__,
+              'test_slow_call'),
+             ('crash', None, 1, None, True, __file__, 'test_slow_call')])
+        self.assertIn('Slow call', logger.warning.call_args[0][0])
+
+        self.client.hooks[:] = [erppeek.SlowCallLog(60.0, logger)]
+        logger.reset_mock()
+        self.client.search('foo.bar')
+        self.assertFalse(logger.warning.called)
+
+    def test_slow_threshold(self):
+        client = erppeek.Client(self.server, slow_threshold=2.5)
+        self.assertEqual([hooks.threshold for hooks in client.hooks], [2.5])
+
+    def test_profile(self):
+        self.client.hooks[:] = []
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        output = os.path.join(tmpdir, 'profile.csv')
+        with self.client.profile(output) as profile:
+            self.client.read('foo.bar', ['name like Morice'], 'name')
+            self.client.read('foo.bar', [42], 'name')
+            self.client.search('foo.bar')
+            self.assertRaises(erppeek.Fault, self.client.execute,
+                              'foo.bar', 'crash', 42)
+            self.client.common.version
+        self.assertEqual(self.client.hooks, [])
+
+        stats = sorted(profile.stats(), key=lambda s: s['method'])
+        self.assertEqual(
+            [(s['model'], s['method'], s['calls'], s['errors'],
+              s['requests'], s['rows']) for s in stats],
+            [('foo.bar', 'crash', 1, 1, 1, 0),
+             ('foo.bar', 'read', 2, 0, 3, 3),
+             ('foo.bar', 'search', 1, 0, 1, 0)])
+        for item in stats:
+            self.assertAlmostEqual(item['time'], item['network'] +
+                                   item['marshal'] + item['client'])
+        with open(output) as fileobj:
+            lines = fileobj.read().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[0].split(','),
+                         ['"%s"' % col for col in profile.columns])
+        self.assertEqual(profile.report().splitlines()[0].split(),
+                         list(profile.columns))
+
+
+class TestCassette(XmlRpcTestCase):
+    """Test the recording and the replay of the calls."""
+    server_version = '11.0'
+    server = 'http://127.0.0.1:8069/xmlrpc'
+
+    def _patch_service(self):
+        return mock.patch('erppeek.ServerProxy._ServerProxy__request',
+                          side_effect=self._request).start()
+
+    def _request(self, name, args):
+        if name == 'server_version':
+            return self.server_version
+        if name == 'list':
+            return ['database']
+        if name == 'login':
+            return 17 if args[2] == 'passwd' else False
+        if name in ('create_database', 'change_admin_password'):
+            return True
+        if args[4] == 'search':
+            return [ID2, ID1]
+        if args[4] == 'read':
+            return [{'id': id_, 'name': 'N%s' % id_} for id_ in args[5]]
+        if args[4] == 'unlink':
+            raise erppeek.socket.error('Connection reset')
+        raise erppeek.Fault('crash', 'Traceback')
+
+    def _session(self, client):
+        client.login('user', 'passwd', 'database')
+        rv = [client.read('foo.bar', ['name like Morice'], 'name'),
+              client.search('foo.bar', [])]
+        self.assertRaises(erppeek.Fault, client.execute,
+                          'foo.bar', 'crash', [42])
+        self.assertRaises(erppeek.socket.error, client.execute,
+                          'foo.bar', 'unlink', [42])
+        return rv
+
+    def test_record_replay(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'session.jsonl')
+
+        client = erppeek.Client(self.server, record=path)
+        self.assertIsInstance(client.cassette, erppeek.Cassette)
+        self.assertEqual(self._session(client),
+                         [['N4002', 'N4001'], [ID2, ID1]])
+        client.reset()
+        sent = self.service.call_count
+        with open(path) as f:
+            content = f.read()
+        self.assertEqual(len(content.splitlines()), sent)
+        self.assertNotIn('passwd', content)
+
+        # Replay without any server
+        self.service.reset_mock()
+        client = erppeek.Client(self.server, replay=path)
+        self.assertEqual(client.server_version, '11.0')
+        self.assertEqual(self._session(client),
+                         [['N4002', 'N4001'], [ID2, ID1]])
+        self.assertRaises(erppeek.Error, client.execute, 'foo.bar', 'copy',
+                          [42])
+        self.assertFalse(self.service.called)
+        self.assertOutput('')
+
+    def test_record_db_passwords(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'session.jsonl')
+
+        client = erppeek.Client(self.server, record=path)
+        client.db.create_database('super_pw', 'newdb', False, 'en_US',
+                                  'admin_pw', 'admin', 'BE')
+        client.db.change_admin_password('old_pw', 'new_pw')
+        client.reset()
+        with open(path) as f:
+            calls = [json.loads(line)[:3] for line in f]
+        self.assertEqual(calls[-2:], [
+            ['db', 'create_database',
+             ['*', 'newdb', False, 'en_US', '*', 'admin', 'BE']],
+            ['db', 'change_admin_password', ['*', '*']]])
+        self.assertNotIn('_pw', json.dumps(calls))
+
+    def test_latency(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'session.jsonl')
+        with open(path, 'w') as f:
+            f.write('["db","server_version",[],"11.0",null,0.25]\n')
+        sleep = mock.patch('time.sleep').start()
+        erppeek.Client(self.server, replay=path)
+        self.assertFalse(sleep.called)
+        erppeek.Client(self.server, replay=path, replay_latency=2)
+        sleep.assert_called_once_with(0.5)
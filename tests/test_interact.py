@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
+import json
+import os
+import shutil
 import sys
+import tempfile
 
 import mock
 from mock import call, ANY
@@ -13,13 +17,13 @@ class TestInteract(XmlRpcTestCase):
     startup_calls = (
         call(ANY, 'db', ANY, verbose=ANY),
         'db.server_version',
-        call(ANY, 'db', ANY, verbose=ANY),
-        call(ANY, 'common', ANY, verbose=ANY),
-        call(ANY, 'object', ANY, verbose=ANY),
-        call(ANY, 'report', ANY, verbose=ANY),
-        call(ANY, 'wizard', ANY, verbose=ANY),
         'db.list',
     )
+    # The services are created on first use
+    common_call = call(ANY, 'common', ANY, verbose=ANY)
+    service_calls = (
+        call(ANY, 'object', ANY, verbose=ANY),
+    )
 
     def setUp(self):
         super(TestInteract, self).setUp()
@@ -56,7 +60,9 @@ class TestInteract(XmlRpcTestCase):
         self.assertEqual(sys.ps1, 'demo >>> ')
         self.assertEqual(sys.ps2, 'demo ... ')
         expected_calls = self.startup_calls + (
+            self.common_call,
             ('common.login', 'database', 'usr', 'password'),
+        ) + self.service_calls + (
             ('object.execute', 'database', 17, 'password',
              'ir.model.access', 'check', 'res.users', 'write'),
             ('common.login', 'database', 'gaspard', 'password'),
@@ -122,7 +128,9 @@ class TestInteract(XmlRpcTestCase):
 
         usr17 = ('object.execute', 'database', 17, 'passwd')
         expected_calls = self.startup_calls + (
+            self.common_call,
             ('common.login', 'database', 'usr', 'passwd'),
+        ) + self.service_calls + (
             usr17 + ('ir.model', 'search',
                      [('model', 'like', 'res.company')]),
             usr17 + ('ir.model', 'read', 42, ('model',)),
@@ -141,3 +149,26 @@ class TestInteract(XmlRpcTestCase):
             'Model not found: res.company',
         ])
         self.assertOutput(stderr=ANY)
+
+    def test_profile(self):
+        env_tuple = ('http://127.0.0.1:8069', 'database', 'usr', 'passwd')
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        output = os.path.join(tmpdir, 'profile.json')
+        mock.patch('sys.argv', new=['erppeek', '--env', 'demo', '--profile',
+                                    output, '-i', '-m', 'res.partner',
+                                    '42']).start()
+        mock.patch('erppeek.read_config', return_value=env_tuple).start()
+        self.service.db.list.return_value = ['database']
+        self.service.common.login.return_value = 17
+        self.service.object.execute.return_value = [{'id': 42}]
+        self.infunc.side_effect = [EOFError('Finished')]
+
+        erppeek.main()
+
+        with open(output) as fileobj:
+            stats = json.load(fileobj)
+        self.assertEqual([(item['model'], item['method'], item['calls'])
+                          for item in stats], [('res.partner', 'read', 1)])
+        self.assertIn('"id"\r\n42\r\n', self.stdout.popvalue())
+        self.assertOutput(stderr=ANY)
@@ -1,4 +1,9 @@
 # -*- coding: utf-8 -*-
+import sys
+import threading
+import time
+
+import mock
 from mock import patch, sentinel, ANY
 
 import erppeek
@@ -130,6 +135,23 @@ class TestModel(TestCase):
         self.assertCalls(OBJ('foo.bar', 'fields_get'))
         self.assertOutput('')
 
+    def test_fields_threads(self):
+        def obj_exec(*args):
+            time.sleep(0.01)
+            return self.obj_exec(*args)
+        self.service.object.execute.side_effect = obj_exec
+        model = self.model('foo.bar')
+        threads = [threading.Thread(target=model.fields) for __ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(model.fields())
+
+        # The fields are read once
+        self.assertCalls(OBJ('foo.bar', 'fields_get'))
+        self.assertOutput('')
+
     def test_field(self):
         self.assertTrue(self.model('foo.bar').field('spam'))
 
@@ -855,6 +877,31 @@ class TestRecord(TestCase):
         self.assertCalls()
         self.assertOutput('')
 
+    def test_n1_detector(self):
+        detector = erppeek.NPlusOneDetector(3, logger=mock.Mock())
+        self.client.n1_detector = detector
+        records = [self.model('foo.bar').browse(id_) for id_ in range(1, 6)]
+        for rec in records:
+            self.assertEqual(rec.message, 'v_message')
+        lineno = sys._getframe().f_lineno - 1
+        records[0].name
+
+        detector.logger.warning.assert_called_once_with(
+            ANY, 'foo.bar', 'message', 3, __file__, lineno)
+        self.assertEqual(detector.report(), [
+            'foo.bar.message: 5 reads at %s:%s' % (__file__, lineno)])
+        detector.log_report()
+        self.assertEqual(detector.logger.warning.call_count, 2)
+
+        # The count restarts after the window
+        detector.reads.clear()
+        with patch('time.time', side_effect=[1000.0, 1001.5, 1003.0]):
+            for rec in records[:3]:
+                del rec.message
+                rec.message
+        self.assertEqual(detector.report(), [])
+        self.assertOutput('')
+
     def test_equal(self):
         rec1 = self.model('foo.bar').get(42)
         rec2 = self.model('foo.bar').get(42)
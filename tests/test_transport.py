@@ -0,0 +1,982 @@
+# -*- coding: utf-8 -*-
+import errno
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+import zlib
+
+import mock
+
+import erppeek
+from ._common import XmlRpcTestCase
+from .fake_server import FakeServer
+
+
+class TestConnectionPool(XmlRpcTestCase):
+    """Test the persistent connections."""
+
+    def _patch_service(self):
+        self.time = mock.patch('time.time', return_value=1000.0).start()
+        self.http = mock.patch('erppeek.HTTPConnection').start()
+        self.https = mock.patch('erppeek.HTTPSConnection').start()
+
+    def test_reuse(self):
+        pool = erppeek.ConnectionPool()
+        conn = pool.acquire('http', 'localhost:8069')
+        self.assertIs(conn, self.http.return_value)
+        self.http.assert_called_once_with('localhost:8069')
+        pool.release('http', 'localhost:8069', conn)
+
+        self.assertIs(pool.acquire('http', 'localhost:8069'), conn)
+        self.assertEqual((pool.created, pool.reused), (1, 1))
+        self.assertEqual(self.http.call_count, 1)
+
+        pool.acquire('https', 'localhost:8069')
+        self.https.assert_called_once_with('localhost:8069')
+        self.assertEqual((pool.created, pool.reused), (2, 1))
+
+    def test_discard(self):
+        pool = erppeek.ConnectionPool()
+        conn = pool.acquire('http', 'localhost:8069')
+        pool.release('http', 'localhost:8069', conn, reuse=False)
+        self.assertEqual(conn.close.call_count, 1)
+
+        # Closed by the server
+        conn.sock = None
+        pool.release('http', 'localhost:8069', conn)
+        pool.acquire('http', 'localhost:8069')
+        self.assertEqual((pool.created, pool.reused), (2, 0))
+
+    def test_idle_timeout(self):
+        pool = erppeek.ConnectionPool(idle_timeout=30)
+        conn = pool.acquire('http', 'localhost:8069')
+        pool.release('http', 'localhost:8069', conn)
+
+        self.time.return_value += 31
+        pool.acquire('http', 'localhost:8069')
+        self.assertEqual(conn.close.call_count, 1)
+        self.assertEqual((pool.created, pool.reused), (2, 0))
+
+    def test_close(self):
+        pool = erppeek.ConnectionPool()
+        conn = pool.acquire('http', 'localhost:8069')
+        pool.release('http', 'localhost:8069', conn)
+        pool.close()
+        self.assertEqual(conn.close.call_count, 1)
+        pool.acquire('http', 'localhost:8069')
+        self.assertEqual((pool.created, pool.reused), (2, 0))
+
+    def test_transport(self):
+        pool = erppeek.ConnectionPool()
+        transport = erppeek.PooledTransport(pool)
+        parse_response = mock.patch.object(transport, 'parse_response',
+                                           return_value=(42,)).start()
+        conn = self.http.return_value
+        conn.getresponse.return_value.status = 200
+
+        self.assertEqual(transport.request('localhost:8069', '/xmlrpc/db',
+                                           b'<xml/>'), (42,))
+        self.assertEqual(transport.request('localhost:8069', '/xmlrpc/db',
+                                           b'<xml/>'), (42,))
+        self.http.assert_called_once_with('localhost:8069')
+        self.assertEqual(conn.getresponse.call_count, 2)
+        self.assertEqual((pool.created, pool.reused), (1, 1))
+
+        # The connection is discarded on error
+        parse_response.side_effect = EOFError
+        self.assertRaises(EOFError, transport.request,
+                          'localhost:8069', '/xmlrpc/db', b'<xml/>')
+        self.assertEqual(conn.close.call_count, 1)
+
+    def test_client(self):
+        conn = self.http.return_value
+        server_version = mock.patch('erppeek.Service.server_version',
+                                    create=True, return_value='11.0').start()
+        client = erppeek.Client('http://127.0.0.1:8069', pool_size=3,
+                                idle_timeout=15)
+        server_version.assert_called_once_with()
+
+        self.assertIsInstance(client.pool, erppeek.ConnectionPool)
+        self.assertEqual(client.pool.maxsize, 3)
+        self.assertEqual(client.pool.idle_timeout, 15)
+        # The same transport is shared by all the services
+        self.assertIsInstance(client._transport, erppeek.PooledTransport)
+        for service in (client.db, client.common, client._object):
+            proxy = service._dispatch.__self__
+            self.assertIs(proxy._ServerProxy__transport, client._transport)
+        self.assertIs(client._transport._pool, client.pool)
+
+        client.pool.release('http', '127.0.0.1:8069',
+                            client.pool.acquire('http', '127.0.0.1:8069'))
+        client.reset()
+        self.assertEqual(conn.close.call_count, 1)
+
+        self.assertRaises(TypeError, erppeek.Client, 'http://127.0.0.1:8069',
+                          pool_size=3, spam='ham')
+
+
+class TestHTTPSession(XmlRpcTestCase):
+    """Test the persistent connections with JSON-RPC."""
+
+    def _patch_service(self):
+        self.http = mock.patch('erppeek.HTTPConnection').start()
+        conn = self.http.return_value
+        conn.getresponse.return_value.status = 200
+        conn.getresponse.return_value.read.return_value = b'{"result": 42}'
+
+    def test_post(self):
+        session = erppeek.HTTPSession(erppeek.ConnectionPool())
+        conn = self.http.return_value
+
+        for idx in range(3):
+            resp = session.post('http://127.0.0.1:8069/jsonrpc', b'{}',
+                                {'Content-Type': 'application/json'})
+            self.assertEqual(resp.json(), {'result': 42})
+        self.http.assert_called_once_with('127.0.0.1:8069')
+        self.assertEqual(conn.request.mock_calls, [
+            mock.call('POST', '/jsonrpc', b'{}',
+                      {'Content-Type': 'application/json'})] * 3)
+        self.assertEqual((session.pool.created, session.pool.reused), (1, 2))
+
+        session.close()
+        self.assertEqual(conn.close.call_count, 1)
+
+    def test_post_retry(self):
+        session = erppeek.HTTPSession(erppeek.ConnectionPool())
+        conn = self.http.return_value
+
+        conn.getresponse.side_effect = [erppeek.BadStatusLine(''),
+                                        mock.DEFAULT]
+        resp = session.post('http://127.0.0.1:8069/jsonrpc', b'{}')
+        self.assertEqual(resp.json(), {'result': 42})
+        self.assertEqual(conn.request.call_count, 2)
+
+        conn.getresponse.side_effect = erppeek.BadStatusLine('')
+        self.assertRaises(erppeek.BadStatusLine, session.post,
+                          'http://127.0.0.1:8069/jsonrpc', b'{}')
+        self.assertEqual(conn.request.call_count, 4)
+
+        conn.getresponse.side_effect = None
+        conn.getresponse.return_value.status = 500
+        self.assertRaises(erppeek.HTTPError, session.post,
+                          'http://127.0.0.1:8069/jsonrpc', b'{}')
+
+    def test_dispatch(self):
+        session = mock.Mock()
+        session.post.return_value.json.return_value = {'result': 'JSON'}
+        result = erppeek.dispatch_jsonrpc('http://127.0.0.1:8069/jsonrpc',
+                                          'db', 'list', (), session=session)
+        self.assertEqual(result, 'JSON')
+        self.assertEqual(session.post.mock_calls[0], mock.call(
+            'http://127.0.0.1:8069/jsonrpc', data=mock.ANY,
+            headers={'Content-Type': 'application/json'}))
+
+    def test_client(self):
+        http_post = mock.patch('erppeek.http_post',
+                               return_value={'result': '11.0'}).start()
+        with erppeek.Client('http://127.0.0.1:8069/jsonrpc',
+                            pool_size=3) as client:
+            session = client._session
+            self.assertIsNotNone(session)
+            http_post.assert_called_once_with(
+                'http://127.0.0.1:8069/jsonrpc', mock.ANY, session=session)
+            close = mock.patch.object(session, 'close').start()
+        close.assert_called_once_with()
+        if not erppeek.requests:
+            self.assertIsInstance(session, erppeek.HTTPSession)
+            self.assertIs(session.pool, client.pool)
+            self.assertEqual(client.pool.maxsize, 3)
+
+
+class TestCompression(XmlRpcTestCase):
+    """Test the gzip compression of the requests and responses."""
+
+    def _patch_service(self):
+        self.http = mock.patch('erppeek.HTTPConnection').start()
+        self.http_post = mock.patch('erppeek.http_post',
+                                    return_value={'result': '11.0'}).start()
+        mock.patch('erppeek.Service.server_version', create=True,
+                   return_value='11.0').start()
+
+    def test_options(self):
+        client = erppeek.Client(
+            'http://127.0.0.1:8069/jsonrpc?compress=1024&pool_size=2')
+        self.assertEqual(client._server, 'http://127.0.0.1:8069/jsonrpc')
+        self.assertEqual(client._options['compress'], 1024)
+        self.assertEqual(client._options['pool_size'], 2)
+
+        # The keyword arguments override the query string
+        client = erppeek.Client('http://127.0.0.1:8069?compress=1024',
+                                compress=None)
+        self.assertEqual(client._server, 'http://127.0.0.1:8069/xmlrpc')
+        self.assertIsNone(client._options['compress'])
+        self.assertIsNone(client._transport.encode_threshold)
+
+        client = erppeek.Client('http://127.0.0.1:8069?compress=0')
+        self.assertEqual(client._transport.encode_threshold, 0)
+
+        self.assertRaises(TypeError, erppeek.Client,
+                          'http://127.0.0.1:8069?compression=9')
+
+    def test_jsonrpc_request(self):
+        url = 'http://127.0.0.1:8069/jsonrpc'
+        args = ('db', 1, 'pwd', 'res.partner', 'write', [42], {'name': 'x'})
+        erppeek.dispatch_jsonrpc(url, 'object', 'execute', args,
+                                 compress=1024)
+        self.http_post.assert_called_once_with(url, mock.ANY, session=None)
+
+        args += ('x' * 1024,)
+        self.http_post.reset_mock()
+        erppeek.dispatch_jsonrpc(url, 'object', 'execute', args,
+                                 compress=1024)
+        self.http_post.assert_called_once_with(
+            url, mock.ANY, {'Content-Type': 'application/json',
+                            'Content-Encoding': 'gzip'}, session=None)
+        data = zlib.decompress(self.http_post.call_args[0][1],
+                               16 + zlib.MAX_WBITS)
+        self.assertEqual(json.loads(data.decode('ascii'))['params']['args'],
+                         list(args))
+
+    def test_jsonrpc_response(self):
+        content = b'{"result": "%s"}' % (b'x' * 1024,)
+        resp = self.http.return_value.getresponse.return_value
+        resp.status = 200
+        resp.getheader.return_value = 'gzip'
+        resp.read.return_value = erppeek.gzip_encode(content)
+
+        session = erppeek.HTTPSession(erppeek.ConnectionPool(),
+                                      accept_gzip=True)
+        resp = session.post('http://127.0.0.1:8069/jsonrpc', b'{}')
+        self.assertEqual(resp.content, content)
+        self.http.return_value.request.assert_called_once_with(
+            'POST', '/jsonrpc', b'{}', {'Accept-Encoding': 'gzip'})
+
+
+class TestJSONCodec(XmlRpcTestCase):
+    """Test the pluggable JSON codecs."""
+
+    def _patch_service(self):
+        self.http_post = mock.patch('erppeek.http_post',
+                                    return_value={'result': '11.0'}).start()
+
+    def test_codec(self):
+        value = {'id': 42, 'name': u'Caf\xe9', 'parent_id': [1, 'Main']}
+        for name in ('json', 'orjson', 'rapidjson', 'ujson', 'auto'):
+            (dumps, loads) = erppeek.json_codec(name)
+            data = dumps(value)
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(loads(data), value)
+            self.assertEqual(json.loads(data.decode('utf-8')), value)
+
+        self.assertRaises(ValueError, erppeek.json_codec, 'simplejson')
+
+    def test_fallback(self):
+        codecs = [(name, mock.Mock(side_effect=ImportError))
+                  for (name, codec) in erppeek.JSON_CODECS[:-1]]
+        mock.patch('erppeek.JSON_CODECS',
+                   codecs + erppeek.JSON_CODECS[-1:]).start()
+        for name in ('orjson', 'auto'):
+            (dumps, loads) = erppeek.json_codec(name)
+            self.assertEqual(dumps({'id': 42}), b'{"id": 42}')
+        self.assertEqual([codec.call_count for (name, codec) in codecs],
+                         [2, 1, 1])
+
+    def test_client(self):
+        mock.patch('erppeek.Service.server_version', create=True,
+                   return_value='11.0').start()
+        codec = (mock.Mock(return_value=b'{}'), mock.Mock())
+        mock.patch('erppeek.json_codec', return_value=codec).start()
+        url = 'http://127.0.0.1:8069/jsonrpc'
+
+        client = erppeek.Client(url)
+        self.assertIsNone(client._codec)
+
+        client = erppeek.Client(url + '?codec="orjson"')
+        erppeek.json_codec.assert_called_once_with('orjson')
+        self.assertIs(client._codec, codec)
+        self.http_post.reset_mock()
+        client.db.list()
+        self.http_post.assert_called_once_with(
+            url, b'{}', session=client._session, loads=codec[1])
+
+
+class TestStreaming(XmlRpcTestCase):
+    """Test the incremental parsing of the XML-RPC responses."""
+
+    def _patch_service(self):
+        self.http = mock.patch('erppeek.HTTPConnection').start()
+
+    def _response(self, body, chunk_size=100):
+        resp = self.http.return_value.getresponse.return_value
+        resp.status = 200
+        resp.getheader.return_value = None
+        chunks = [body[idx:idx + chunk_size]
+                  for idx in range(0, len(body), chunk_size)]
+        resp.read.side_effect = chunks + [b'']
+        return resp
+
+    def test_stream(self):
+        rows = [{'id': idx, 'name': 'Partner %d' % idx}
+                for idx in range(1, 51)]
+        body = erppeek.xmlrpc_dumps((rows,), methodresponse=True)
+        resp = self._response(body.encode('utf-8'))
+        pool = erppeek.ConnectionPool()
+        transport = erppeek.PooledTransport(pool)
+
+        items = erppeek.dispatch_stream(transport,
+                                        'http://127.0.0.1:8069/xmlrpc/object',
+                                        'execute', ('db', 1, 'pwd'))
+        self.assertEqual(next(items), rows[0])
+        # The response is not read entirely
+        self.assertLess(resp.read.call_count, len(body) // 200)
+        self.assertEqual(list(items), rows[1:])
+        self.assertEqual((pool.created, pool.reused), (1, 0))
+
+        # The connection is reused
+        self._response(body.encode('utf-8'))
+        self.assertEqual(len(list(erppeek.dispatch_stream(
+            transport, 'http://127.0.0.1:8069/xmlrpc/object', 'execute',
+            ()))), 50)
+        self.assertEqual((pool.created, pool.reused), (1, 1))
+
+        # The connection is discarded if the response is not read
+        self._response(body.encode('utf-8'))
+        items = erppeek.dispatch_stream(
+            transport, 'http://127.0.0.1:8069/xmlrpc/object', 'execute', ())
+        next(items)
+        items.close()
+        self.assertEqual(self.http.return_value.close.call_count, 1)
+
+    def test_stream_fault(self):
+        body = erppeek.xmlrpc_dumps(erppeek.Fault(1, 'Access Denied'),
+                                    methodresponse=True)
+        self._response(body.encode('utf-8'), chunk_size=10)
+        pool = erppeek.ConnectionPool()
+        items = erppeek.dispatch_stream(erppeek.PooledTransport(pool),
+                                        'http://127.0.0.1:8069/xmlrpc/object',
+                                        'execute', ())
+        self.assertRaises(erppeek.Fault, list, items)
+        # The connection is reusable after a Fault
+        self.assertEqual(len(pool._idle[('http', '127.0.0.1:8069')]), 1)
+
+    def test_client(self):
+        mock.patch('erppeek.Service.server_version', create=True,
+                   return_value='11.0').start()
+        client = erppeek.Client('http://127.0.0.1:8069')
+        self.assertEqual(client._object._dispatch_stream.args,
+                         (client._transport,
+                          'http://127.0.0.1:8069/xmlrpc/object'))
+
+        mock.patch('erppeek.http_post').start()
+        client = erppeek.Client('http://127.0.0.1:8069/jsonrpc')
+        self.assertIsNone(client._object._dispatch_stream)
+
+
+class TestRetry(XmlRpcTestCase):
+    """Test the retry policy and the circuit breaker."""
+
+    def _patch_service(self):
+        self.sleep = mock.patch('time.sleep').start()
+        self.time = mock.patch('time.time', return_value=1000.0).start()
+        mock.patch('random.uniform', side_effect=lambda a, b: b).start()
+
+    def _service(self, retry=None, breaker=None):
+        client = mock.Mock(retry=retry, breaker=breaker, hooks=[])
+        service = erppeek.Service(client, 'object', ['execute'])
+        self.dispatch = service._dispatch
+        return service
+
+    def test_retry(self):
+        retry = erppeek.RetryPolicy(retries=3, backoff=0.5, max_backoff=1.5)
+        service = self._service(retry=retry)
+        self.dispatch.side_effect = [socket.error, erppeek.BadStatusLine(''),
+                                     erppeek.ProtocolError('', 503, '', {}),
+                                     [42]]
+        self.assertEqual(service.execute('db', 1, 'pwd', 'foo', 'search', []),
+                         [42])
+        self.assertEqual(self.dispatch.call_count, 4)
+        self.assertEqual(self.sleep.mock_calls,
+                         [mock.call(0.5), mock.call(1.0), mock.call(1.5)])
+        self.assertEqual(retry.retried, 3)
+
+        # Too many errors
+        self.dispatch.reset_mock()
+        self.dispatch.side_effect = socket.error
+        self.assertRaises(socket.error, service.execute,
+                          'db', 1, 'pwd', 'foo', 'read', [42])
+        self.assertEqual(self.dispatch.call_count, 4)
+
+        # Other errors and methods are not retried
+        self.dispatch.reset_mock()
+        self.dispatch.side_effect = erppeek.Fault(1, 'Access Denied')
+        self.assertRaises(erppeek.Fault, service.execute,
+                          'db', 1, 'pwd', 'foo', 'read', [42])
+        self.dispatch.side_effect = erppeek.ProtocolError('', 500, '', {})
+        self.assertRaises(erppeek.ProtocolError, service.execute,
+                          'db', 1, 'pwd', 'foo', 'read', [42])
+        self.dispatch.side_effect = socket.error
+        self.assertRaises(socket.error, service.execute,
+                          'db', 1, 'pwd', 'foo', 'write', [42], {})
+        self.assertEqual(self.dispatch.call_count, 3)
+        self.assertEqual(retry.retried, 6)
+
+    def test_breaker(self):
+        breaker = erppeek.CircuitBreaker(threshold=2, reset_timeout=30)
+        service = self._service(breaker=breaker)
+        self.dispatch.side_effect = socket.error
+
+        for idx in range(2):
+            self.assertRaises(socket.error, service.execute,
+                              'db', 1, 'pwd', 'foo', 'read', [42])
+        self.assertEqual(breaker.trips, 1)
+        self.assertRaises(erppeek.CircuitOpenError, service.execute,
+                          'db', 1, 'pwd', 'foo', 'read', [42])
+        self.assertEqual((self.dispatch.call_count, breaker.rejected), (2, 1))
+
+        # A trial call after the timeout
+        self.time.return_value += 31
+        self.assertRaises(socket.error, service.execute,
+                          'db', 1, 'pwd', 'foo', 'read', [42])
+        self.assertRaises(erppeek.CircuitOpenError, service.execute,
+                          'db', 1, 'pwd', 'foo', 'read', [42])
+        self.time.return_value += 31
+        self.dispatch.side_effect = erppeek.Fault(1, 'Access Denied')
+        self.assertRaises(erppeek.Fault, service.execute,
+                          'db', 1, 'pwd', 'foo', 'read', [42])
+        self.dispatch.side_effect = None
+        service.execute('db', 1, 'pwd', 'foo', 'read', [42])
+        self.assertEqual(self.dispatch.call_count, 5)
+        self.assertEqual((breaker.trips, breaker.rejected), (1, 2))
+
+    def test_client(self):
+        mock.patch('erppeek.Service.server_version', create=True,
+                   return_value='11.0').start()
+        client = erppeek.Client('http://127.0.0.1:8069')
+        self.assertIsNone(client.retry)
+        self.assertIsNone(client.breaker)
+
+        client = erppeek.Client('http://127.0.0.1:8069?retries=2',
+                                breaker_threshold=5)
+        self.assertEqual(client.retry.retries, 2)
+        self.assertEqual(client.breaker.threshold, 5)
+        self.assertIs(client._object._retry, client.retry)
+        self.assertIs(client.db._breaker, client.breaker)
+
+
+class TestTimeout(XmlRpcTestCase):
+    """Test the timeouts and the deadline."""
+
+    def _patch_service(self):
+        self.time = mock.patch('time.time', return_value=1000.0).start()
+        self.http = mock.patch('erppeek.HTTPConnection').start()
+        conn = self.http.return_value
+        conn.sock = None
+        conn.connect.side_effect = lambda: setattr(conn, 'sock', mock.Mock())
+        mock.patch('erppeek.Service.server_version', create=True,
+                   return_value='11.0').start()
+
+    def test_acquire(self):
+        pool = erppeek.ConnectionPool()
+        conn = pool.acquire('http', 'localhost:8069', (3, 20))
+        self.assertEqual(conn.timeout, 3)
+        conn.connect.assert_called_once_with()
+        conn.sock.settimeout.assert_called_once_with(20)
+        pool.release('http', 'localhost:8069', conn)
+
+        self.assertIs(pool.acquire('http', 'localhost:8069'), conn)
+        conn.sock.settimeout.assert_called_with(None)
+        self.assertEqual(conn.connect.call_count, 1)
+
+    def test_connect_error(self):
+        pool = erppeek.ConnectionPool(maxsize=1)
+        conn = self.http.return_value
+        connect = conn.connect.side_effect
+        conn.connect.side_effect = socket.timeout
+        self.assertRaises(socket.timeout, pool.acquire,
+                          'http', 'localhost:8069', (3, None))
+        self.assertEqual(conn.close.call_count, 1)
+        # The slot is released
+        conn.connect.side_effect = connect
+        pool.acquire('http', 'localhost:8069', (3, None))
+
+    def test_client(self):
+        client = erppeek.Client('http://127.0.0.1:8069')
+        self.assertIsNone(client._timeouts())
+        client = erppeek.Client('http://127.0.0.1:8069?timeout=60',
+                                connect_timeout=5)
+        self.assertEqual(client._timeouts(), (5, 60))
+        self.assertEqual(client._transport._timeouts, client._timeouts)
+
+        with client.timeout(300):
+            self.assertEqual(client._timeouts(), (300, 300))
+            with client.timeout(1, connect_timeout=2):
+                self.assertEqual(client._timeouts(), (2, 1))
+            self.assertEqual(client._timeouts(), (300, 300))
+        self.assertEqual(client._timeouts(), (5, 60))
+
+        # A connect timeout without a read timeout
+        client = erppeek.Client('http://127.0.0.1:8069', connect_timeout=5)
+        self.assertEqual(client._timeouts(), (5, None))
+        with client.timeout(None, connect_timeout=3):
+            self.assertEqual(client._timeouts(), (3, None))
+        with client.deadline(30):
+            self.assertEqual(client._timeouts(), (5, 30))
+
+    def test_deadline(self):
+        client = erppeek.Client('http://127.0.0.1:8069', timeout=60,
+                                connect_timeout=5)
+        with client.deadline(30):
+            self.assertEqual(client._timeouts(), (5, 30))
+            self.time.return_value += 27
+            self.assertEqual(client._timeouts(), (3, 3))
+            # A nested deadline does not extend the enclosing one
+            with client.deadline(10):
+                self.assertEqual(client._timeouts(), (3, 3))
+            self.time.return_value += 3
+            self.assertRaises(erppeek.DeadlineExceeded, client._timeouts)
+        self.assertEqual(client._timeouts(), (5, 60))
+
+    def test_deadline_jsonrpc(self):
+        http_post = mock.patch('erppeek.http_post',
+                               return_value={'result': [42]}).start()
+        client = erppeek.Client('http://127.0.0.1:8069/jsonrpc')
+        client.db.list()
+        self.assertNotIn('timeout', http_post.call_args[1])
+
+        with client.deadline(30):
+            client.db.list()
+            self.assertEqual(http_post.call_args[1]['timeout'], (30, 30))
+            # The deadline applies to the threads of execute_many
+            client.user = 'admin'
+            client._login = mock.Mock(return_value=1)
+            client._execute = mock.Mock(side_effect=lambda *args: (
+                client._timeouts()))
+            self.assertEqual(client.execute_many('res.partner', 'check',
+                                                 [1, 2, 3], workers=3),
+                             [(30, 30)] * 3)
+            self.time.return_value += 31
+            self.assertRaises(erppeek.DeadlineExceeded, client.db.list)
+        self.assertEqual(http_post.call_count, 2)
+
+
+class TestBalancer(XmlRpcTestCase):
+    """Test the distribution of the calls across several servers."""
+    servers = ['http://odoo1:8069/xmlrpc', 'http://odoo2:8069/xmlrpc',
+               'http://odoo3:8069/xmlrpc']
+
+    def _patch_service(self):
+        self.time = mock.patch('time.time', return_value=1000.0).start()
+
+    def _dispatch(self, balancer, method='execute', args=('db', 1, 'pwd',
+                                                           'foo', 'read')):
+        return balancer.dispatch(self.proxies, method, args)
+
+    def setUp(self):
+        super(TestBalancer, self).setUp()
+        self.proxies = [mock.Mock(return_value=idx) for idx in range(3)]
+
+    def test_round_robin(self):
+        balancer = erppeek.Balancer(self.servers)
+        results = [self._dispatch(balancer) for idx in range(7)]
+        self.assertEqual(results, [0, 1, 2, 0, 1, 2, 0])
+        self.assertEqual(balancer.calls, [3, 2, 2])
+        self.assertEqual(balancer.outstanding, [0, 0, 0])
+        self.proxies[1].assert_called_with(
+            'execute', ('db', 1, 'pwd', 'foo', 'read'))
+
+        self.assertRaises(ValueError, erppeek.Balancer, self.servers, 'spam')
+        self.assertRaises(ValueError, erppeek.Balancer, self.servers,
+                          primary='http://odoo4:8069/xmlrpc')
+
+    def test_least_outstanding(self):
+        balancer = erppeek.Balancer(self.servers, 'least_outstanding')
+        self.assertEqual(balancer.select(), 0)
+        self.assertEqual(balancer.select(), 1)
+        balancer.done(0)
+        self.assertEqual(balancer.outstanding, [0, 1, 0])
+        self.assertEqual(balancer.select(), 2)
+        self.assertEqual(balancer.select(), 0)
+        self.assertEqual(balancer.outstanding, [1, 1, 1])
+
+    def test_primary(self):
+        balancer = erppeek.Balancer(self.servers, primary=self.servers[2])
+        args = ('db', 1, 'pwd', 'foo', 'write', [42], {})
+        self.assertEqual([self._dispatch(balancer, 'execute', args),
+                          self._dispatch(balancer),
+                          self._dispatch(balancer, 'execute', args),
+                          self._dispatch(balancer)], [2, 0, 2, 1])
+
+        # The writes are never sent to another server
+        self.proxies[2].side_effect = socket.error
+        for idx in range(3):
+            self.assertRaises(socket.error, self._dispatch,
+                              balancer, 'execute', args)
+        self.assertRaises(erppeek.CircuitOpenError, self._dispatch,
+                          balancer, 'execute', args)
+        self.assertEqual(self._dispatch(balancer), 0)
+
+    def test_eject(self):
+        balancer = erppeek.Balancer(self.servers, threshold=2,
+                                    reset_timeout=30)
+        self.proxies[1].side_effect = socket.error
+        # The read-only calls are sent to the next server
+        self.assertEqual([self._dispatch(balancer) for idx in range(6)],
+                         [0, 2, 0, 2, 0, 2])
+        self.assertEqual(self.proxies[1].call_count, 2)
+        self.assertEqual(balancer.breakers[1].trips, 1)
+
+        # A server error does not affect the health of the server
+        self.proxies[0].side_effect = erppeek.Fault(1, 'Access Denied')
+        self.assertRaises(erppeek.Fault, self._dispatch, balancer)
+        self.assertEqual(balancer.breakers[0].failures, 0)
+        self.proxies[0].side_effect = socket.error
+        self.proxies[2].side_effect = socket.error
+        self.assertRaises(socket.error, self._dispatch, balancer)
+
+        # A trial call after the timeout
+        self.time.return_value += 31
+        self.proxies[1].side_effect = None
+        self.assertEqual(self._dispatch(balancer), 1)
+        self.assertEqual(balancer.breakers[1].failures, 0)
+
+    def test_failover(self):
+        logger = mock.patch('erppeek._logger').start()
+        probe = mock.Mock()
+        balancer = erppeek.Balancer(self.servers, 'failover', threshold=2,
+                                    reset_timeout=30, probe=probe)
+        write = ('db', 1, 'pwd', 'foo', 'write', [42], {})
+        self.assertEqual([self._dispatch(balancer) for idx in range(3)],
+                         [0, 0, 0])
+
+        # The primary is down
+        self.proxies[0].side_effect = socket.error(errno.ECONNREFUSED,
+                                                   'Connection refused')
+        self.assertEqual(self._dispatch(balancer), 1)
+        self.assertEqual(balancer.active, 1)
+        logger.warning.assert_called_once_with(
+            'Switch from %s to %s', self.servers[0], self.servers[1])
+        # The write is sent again, because it was not sent
+        self.assertEqual(self._dispatch(balancer, 'execute', write), 1)
+        self.assertEqual(self.proxies[0].call_count, 5)
+        self.assertEqual(balancer.breakers[0].trips, 1)
+        self.assertEqual(self._dispatch(balancer, 'execute', write), 1)
+        self.assertEqual(self.proxies[0].call_count, 5)
+
+        # But not after a read timeout
+        self.proxies[1].side_effect = socket.timeout
+        self.assertRaises(socket.timeout, self._dispatch,
+                          balancer, 'execute', write)
+        self.proxies[1].side_effect = None
+
+        # The primary is probed after the timeout
+        self.time.return_value += 31
+        probe.side_effect = socket.error(errno.ECONNREFUSED, 'Refused')
+        self.assertEqual(self._dispatch(balancer), 1)
+        probe.assert_called_once_with(0)
+        self.assertEqual(self.proxies[0].call_count, 5)
+
+        self.time.return_value += 31
+        probe.side_effect = None
+        self.proxies[0].side_effect = None
+        self.assertEqual(self._dispatch(balancer), 0)
+        self.assertEqual(balancer.active, 0)
+        logger.warning.assert_called_with(
+            'Switch from %s to %s', self.servers[1], self.servers[0])
+        self.assertEqual(self._dispatch(balancer), 0)
+        self.assertEqual(probe.call_count, 2)
+
+    def test_client(self):
+        mock.patch('erppeek.Service.server_version', create=True,
+                   return_value='11.0').start()
+        client = erppeek.Client('http://127.0.0.1:8069')
+        self.assertIsNone(client.balancer)
+
+        client = erppeek.Client('http://odoo1:8069',
+                                fallback='http://odoo2:8069 http://odoo3:8069')
+        self.assertEqual(client.balancer.servers, self.servers)
+        self.assertEqual(client.balancer.strategy, 'failover')
+        self.assertEqual(client._server, self.servers[0])
+        with mock.patch('erppeek.ServerProxy') as server_proxy:
+            client.balancer.probe(1)
+        server_proxy.assert_called_once_with(
+            'http://odoo2:8069/xmlrpc/db', transport=client._transport,
+            allow_none=True)
+
+        client = erppeek.Client('http://odoo1:8069, http://odoo2:8069/ '
+                                'http://odoo3:8069/xmlrpc?eject_timeout=5',
+                                primary='http://odoo3:8069')
+        self.assertEqual(client.balancer.servers, self.servers)
+        self.assertEqual(client.balancer.primary, self.servers[2])
+        self.assertEqual(client.balancer.breakers[0].reset_timeout, 5)
+        self.assertEqual(client._server, self.servers[2])
+        self.assertEqual(
+            [proxy.__self__._ServerProxy__host
+             for proxy in client._object._dispatch.args[0]],
+            ['odoo1:8069', 'odoo2:8069', 'odoo3:8069'])
+        self.assertIsNone(client._object._dispatch_batch)
+
+        client = erppeek.Client(['http://odoo1:8069/jsonrpc',
+                                 'http://odoo2:8069/jsonrpc'],
+                                balance='least_outstanding')
+        self.assertEqual(client.balancer.strategy, 'least_outstanding')
+        self.assertEqual(client._server, 'http://odoo1:8069/jsonrpc')
+        self.assertIsNone(client.balancer.primary)
+
+        # The servers without path use the protocol of the first server
+        client = erppeek.Client('http://odoo1:8069/jsonrpc http://odoo2:8069',
+                                primary='http://odoo2:8069')
+        self.assertEqual(client.balancer.servers,
+                         ['http://odoo1:8069/jsonrpc',
+                          'http://odoo2:8069/jsonrpc'])
+        self.assertEqual(client.balancer.primary, 'http://odoo2:8069/jsonrpc')
+        self.assertEqual(client._server, 'http://odoo2:8069/jsonrpc')
+
+
+class TestMetrics(XmlRpcTestCase):
+    """Test the statistics of the RPC calls."""
+
+    def test_record(self):
+        metrics = erppeek.Metrics(buckets=(1.0, 0.1))
+        self.assertEqual(metrics.buckets, (0.1, 1.0))
+        metrics.record('object', 'res.partner', 'read', 0.05,
+                       sent=100, received=2000)
+        metrics.record('object', 'res.partner', 'read', 0.5, error=True,
+                       sent=100, received=50)
+        metrics.record('db', None, 'list', 2.0)
+        self.assertEqual(metrics.stats(), [
+            {'endpoint': 'db', 'model': '', 'method': 'list', 'calls': 1,
+             'errors': 0, 'time': 2.0, 'sent': 0, 'received': 0,
+             'histogram': [(0.1, 0), (1.0, 0)]},
+            {'endpoint': 'object', 'model': 'res.partner', 'method': 'read',
+             'calls': 2, 'errors': 1, 'time': 0.55, 'sent': 200,
+             'received': 2050, 'histogram': [(0.1, 1), (1.0, 2)]},
+        ])
+        self.assertEqual(json.loads(metrics.to_json())[1]['calls'], 2)
+        self.assertEqual(repr(metrics), '<Metrics calls=3>')
+
+        metrics.reset()
+        self.assertEqual(metrics.stats(), [])
+
+    def test_prometheus(self):
+        metrics = erppeek.Metrics(buckets=(0.1,))
+        metrics.record('object', 'res.partner', 'read', 0.05, received=30)
+        text = metrics.to_prometheus()
+        labels = 'endpoint="object",model="res.partner",method="read"'
+        self.assertIn('# TYPE erppeek_rpc_calls_total counter\n'
+                      'erppeek_rpc_calls_total{%s} 1\n' % labels, text)
+        self.assertIn('erppeek_rpc_response_bytes_total{%s} 30\n' % labels,
+                      text)
+        self.assertIn('erppeek_rpc_duration_seconds_bucket{%s,le="0.1"} 1\n'
+                      'erppeek_rpc_duration_seconds_bucket{%s,le="+Inf"} 1\n'
+                      % (labels, labels), text)
+        self.assertIn('erppeek_rpc_duration_seconds_count{%s} 1\n' % labels,
+                      text)
+
+        metrics.record('object', 'x"y', 'read', 0.5)
+        self.assertIn('model="x\\"y"', metrics.to_prometheus())
+
+    def test_sizes(self):
+        erppeek._rpc_local.sizes = sizes = [0, 0, 0.0]
+        self.addCleanup(setattr, erppeek._rpc_local, 'sizes', None)
+        session = mock.Mock()
+        session.post.return_value.content = b'{"result": 42}'
+        erppeek._post_jsonrpc('http://127.0.0.1:8069/jsonrpc', {'x': 1},
+                              session, None, None)
+        self.assertEqual(sizes[:2], [len(b'{"x": 1}'), 14])
+        self.assertGreater(sizes[2], 0.0)
+
+
+class TestFakeServer(XmlRpcTestCase):
+    """Test the transports with the fake server."""
+    path = '/xmlrpc'
+
+    def _patch_service(self):
+        pass
+
+    def setUp(self):
+        super(TestFakeServer, self).setUp()
+        self.server = FakeServer(records=30).start()
+        self.addCleanup(self.server.stop)
+        self.client = erppeek.Client(self.server.url + self.path, 'demo',
+                                     'admin', 'admin', compress=64)
+
+    def test_model(self):
+        model = self.client.model('res.partner')
+        records = model.browse(['name like Partner 1', 'is_company = True'],
+                               order='name desc')
+        self.assertEqual(records.id, [15, 10])
+        self.assertEqual(records.name, ['Partner 15', 'Partner 10'])
+        self.assertEqual(records[0].country_id.name, 'Belgium')
+
+        record = model.create({'name': 'Morice', 'country_id': 2})
+        self.assertEqual(record.id, 31)
+        self.assertEqual(record.country_id.name, 'France')
+        record.write({'name': 'Maurice'})
+        self.assertEqual(model.read(['name like Maurice'], 'name'),
+                         ['Maurice'])
+        self.assertEqual(model.count(['country_id = 2']), 7)
+        self.assertEqual(self.client.execute_kw(
+            'res.partner', 'search_read', [[('id', '<', 3)]],
+            {'fields': ['name']}), [{'id': 1, 'name': 'Partner 1'},
+                                    {'id': 2, 'name': 'Partner 2'}])
+        self.assertRaises((erppeek.Fault, erppeek.ServerError),
+                          self.client.execute, 'res.partner', 'missing')
+        self.assertOutput('')
+
+    def test_transport(self):
+        with self.client.batch() as batch:
+            futures = [batch.read('res.partner', id_, 'name')
+                       for id_ in (1, 2)]
+        self.assertEqual([future.result() for future in futures],
+                         ['Partner 1', 'Partner 2'])
+        self.assertEqual(
+            list(self.client.iter_read('res.partner', ['id < 6'], 'name',
+                                       chunk_size=2)),
+            ['Partner 1', 'Partner 2', 'Partner 3', 'Partner 4',
+             'Partner 5'])
+        # The requests are compressed, the connection is reused
+        self.assertEqual(len(self.client.read('res.partner', ['id > 0'])), 30)
+        self.assertEqual(self.client.pool.created, 1)
+        self.assertGreater(self.client.pool.reused, 5)
+        self.assertOutput('')
+
+    def test_server_down(self):
+        client = erppeek.Client(self.server.url + self.path, 'demo',
+                                'admin', 'admin', pool_size=2)
+        self.addCleanup(client.reset)
+        self.server.stop()
+        client.pool.close()
+        # The connections are released when the request is not sent
+        for idx in range(2):
+            self.assertRaises(socket.error, list,
+                              client.iter_read('res.partner', [1, 2, 3],
+                                               'name', chunk_size=2))
+        self.assertFalse(any(client.pool._active.values()))
+        self.assertRaises(socket.error, client.read, 'res.partner', 1)
+
+    def test_iter_read_calls(self):
+        client = erppeek.Client(self.server.url + self.path, 'demo',
+                                'admin', 'admin', pool_size=1)
+        self.addCleanup(client.reset)
+        records = client.iter_read('res.partner', ['id < 6'], 'name',
+                                   chunk_size=2)
+        self.assertEqual(next(records), 'Partner 1')
+        # The connection is released while the caller's loop runs
+        self.assertFalse(any(client.pool._active.values()))
+        names = [name + str(client.search('res.partner', ['id < 3']))
+                 for name in records]
+        self.assertEqual(names, ['Partner 2[1, 2]', 'Partner 3[1, 2]',
+                                 'Partner 4[1, 2]', 'Partner 5[1, 2]'])
+
+    def test_batch_metrics(self):
+        self.client.metrics.reset()
+        with self.client.profile() as profile:
+            with self.client.batch() as batch:
+                for id_ in range(1, 6):
+                    batch.read('res.partner', id_, 'name')
+            self.assertEqual(
+                list(self.client.iter_read('res.partner', [1, 2, 3, 4],
+                                           'name', chunk_size=2)),
+                ['Partner 1', 'Partner 2', 'Partner 3', 'Partner 4'])
+        # The calls of the batch and the streamed calls are measured
+        (stat,) = self.client.stats()
+        self.assertEqual((stat['model'], stat['method'], stat['calls'],
+                          stat['errors']), ('res.partner', 'read', 7, 0))
+        self.assertGreater(stat['sent'], 0)
+        self.assertGreater(stat['received'], 0)
+        (stat,) = profile.stats()
+        self.assertEqual((stat['calls'], stat['requests'], stat['rows']),
+                         (7, 3, 9))
+
+    def test_batch_breaker(self):
+        client = erppeek.Client(self.server.url + self.path, 'demo',
+                                'admin', 'admin', breaker_threshold=1)
+        self.addCleanup(client.reset)
+        self.server.stop()
+        client.pool.close()
+
+        def read_batch():
+            with client.batch() as batch:
+                batch.read('res.partner', 1, 'name')
+                batch.read('res.partner', 2, 'name')
+        self.assertRaises(socket.error, read_batch)
+        self.assertRaises(erppeek.CircuitOpenError, read_batch)
+        self.assertEqual(client.breaker.rejected, 1)
+
+    def test_fallback(self):
+        down = FakeServer()
+        down.stop()
+        client = erppeek.Client(down.url + self.path, fallback=self.server.url)
+        self.addCleanup(client.reset)
+        # The fallback server uses the same protocol
+        self.assertEqual(client.balancer.servers,
+                         [down.url + self.path, self.server.url + self.path])
+        client.login('admin', 'admin', 'demo')
+        self.assertEqual(client.read('res.partner', 1, 'name'), 'Partner 1')
+        self.assertEqual(client.balancer.active, 1)
+
+    def test_latency(self):
+        self.server.latency = 0.05
+        start = time.time()
+        self.client.search('res.partner')
+        self.assertGreaterEqual(time.time() - start, 0.05)
+
+    def test_workload(self):
+        workload = erppeek.Workload([
+            {'model': 'res.partner', 'domain': ['id < 6'],
+             'fields': ['name'], 'weight': 3},
+            {'model': 'res.partner', 'method': 'write', 'limit': 2,
+             'domain': ['name like Partner'], 'values': {'name': 'Bench'}},
+            {'model': 'res.missing', 'method': 'search_count'},
+        ])
+        stats = workload.run(self.client, workers=3, requests=40, seed=7)
+        self.assertEqual([item['operation'] for item in stats],
+                         ['res.partner read', 'res.partner write',
+                          'res.missing search_count'])
+        self.assertEqual(sum(item['calls'] for item in stats), 40)
+        self.assertEqual([item['errors'] for item in stats],
+                         [0, 0, stats[2]['calls']])
+        self.assertGreater(stats[0]['calls'], stats[1]['calls'])
+        self.assertLessEqual(stats[0]['p50'], stats[0]['p99'])
+        self.assertLessEqual(stats[0]['p99'], stats[0]['max'])
+        self.assertEqual(self.client.read('res.partner', [1, 2], 'name'),
+                         ['Bench', 'Bench'])
+        self.assertEqual(workload.summary()['calls'], 40)
+        self.assertEqual(workload.errors()[0][:2],
+                         (stats[2]['calls'], 'res.missing search_count'))
+        self.assertIn('40 calls in ', workload.report())
+
+        self.assertRaises(ValueError, workload.run, self.client)
+        self.assertRaises(ValueError, erppeek.Workload, [{'model': 'x',
+                                                          'method': 'copy'}])
+        self.assertRaises(ValueError, erppeek.Workload, [{'fields': 'x'}])
+
+    def test_bench(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        (path, output) = (os.path.join(tmpdir, 'workload.json'),
+                          os.path.join(tmpdir, 'output.json'))
+        with open(path, 'w') as f:
+            json.dump({'operations': [{'model': 'res.partner',
+                                       'method': 'search'}]}, f)
+        mock.patch('erppeek.read_config', return_value=(
+            self.server.url + self.path, 'demo', 'admin', 'admin')).start()
+        mock.patch('sys.argv', new=['erppeek', 'bench', '--env', 'demo',
+                                    '-w', '2', '-n', '10', '-o', output,
+                                    path]).start()
+
+        workload = erppeek.main()
+        self.assertIsInstance(workload, erppeek.Workload)
+        with open(output) as f:
+            result = json.load(f)
+        self.assertEqual((result['calls'], result['errors']), (10, 0))
+        self.assertEqual(result['operations'][0]['operation'],
+                         'res.partner search')
+        self.assertOutput(workload.report())
+
+
+class TestFakeServerJsonRpc(TestFakeServer):
+    path = '/jsonrpc'
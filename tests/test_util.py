@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
+import os
+import tempfile
+
+import mock
 import unittest2
 
-from erppeek import issearchdomain, searchargs
+from erppeek import issearchdomain, read_config, searchargs
 
 
 class TestUtils(unittest2.TestCase):
@@ -107,3 +111,24 @@ class TestUtils(unittest2.TestCase):
         self.assertRaises(ValueError, searchargs, (['spam.hamin (1, 2)'],))
         self.assertRaises(ValueError, searchargs, (['spamin (1, 2)'],))
         self.assertRaises(ValueError, searchargs, (['[id = 1540]'],))
+
+    def test_read_config(self):
+        config = tempfile.NamedTemporaryFile('w', suffix='.ini', delete=False)
+        self.addCleanup(os.remove, config.name)
+        with config:
+            config.write('[DEFAULT]\nhost = localhost\nport = 8069\n'
+                         'database = odoo\nusername = admin\n'
+                         '[demo]\nusername = demo\npassword = demo\n'
+                         '[wan]\nprotocol = jsonrpc\ncompress = 4096\n'
+                         '[cluster]\nhost = odoo1, odoo2:8070\n'
+                         'balance = least_outstanding\n')
+        with mock.patch('erppeek.Client._config_file', config.name):
+            self.assertEqual(read_config(), ['demo', 'wan', 'cluster'])
+            self.assertEqual(read_config('demo'), (
+                'http://localhost:8069/xmlrpc', 'odoo', 'demo', 'demo'))
+            self.assertEqual(read_config('wan'), (
+                'http://localhost:8069/jsonrpc?compress=4096',
+                'odoo', 'admin', None))
+            self.assertEqual(read_config('cluster'), (
+                'http://odoo1:8069/xmlrpc http://odoo2:8070/xmlrpc'
+                '?balance=least_outstanding', 'odoo', 'admin', None))